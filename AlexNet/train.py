@@ -5,22 +5,26 @@ from AlexNet.transformation import *
 import timeit
 from AlexNet.executor import *
 from AlexNet.properties import *
+from common.torch.utils.autotune import load_tuned_settings
 
 if __name__ == '__main__':
     def getDataLoader(csv_path, images_path, transformation, fields, training=False, batch_size=16, shuffle=False, num_workers=4,
                       pin_memory=False,
-                      drop_last=True):
+                      drop_last=True, **kwargs):
         df = pd.read_csv(csv_path)
         dataset = ClassificationDataset(images_path, df, transformation, fields, training, mean_rgb=f"{config['INPUT_DIR']}/rgb_val.json")
-        data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers, pin_memory=pin_memory, drop_last=drop_last)
+        data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers, pin_memory=pin_memory, drop_last=drop_last,
+                                 **kwargs)
         return data_loader
 
 
     fields = {'image': 'image', 'label': 'class'}
+    # Batch size and DataLoader settings tuned for this machine if available ( python -m common.torch.utils.autotune --model alexnet )
+    settings = load_tuned_settings('alexnet', batch_size=256, num_workers=16, pin_memory=True)
     train_data_loader = getDataLoader(csv_path=config['TRAIN_CSV'], images_path=config['TRAIN_DIR'], transformation=train_transformation,
                                       fields=fields,
                                       training=True,
-                                      batch_size=256, shuffle=True, num_workers=16, pin_memory=True)
+                                      shuffle=True, **settings)
     val_data_loader = getDataLoader(csv_path=config['VALID_CSV'], images_path=config['VALID_DIR'], transformation=test_transformation, fields=fields,
                                     training=False,
                                     batch_size=16, shuffle=True, num_workers=4, pin_memory=True, drop_last=False)
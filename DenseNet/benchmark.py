@@ -0,0 +1,42 @@
+import argparse
+from DenseNet.model import *
+from common.torch.utils.benchmark_util import *
+
+"""
+    Measures the peak memory and step time of a DenseNet training step with and without the memory
+    efficient mode. Each measurement runs in a fresh process so that the peak RSS on CPU is not
+    shared between the runs.
+
+    Usage: python -m DenseNet.benchmark --architecture densenet_121 --batch-size 64
+"""
+
+architectures = {
+    'densenet_121': densenet_121,
+    'densenet_169': densenet_169,
+    'densenet_201': densenet_201,
+    'densenet_161': densenet_161
+}
+
+
+def train_step_memory(architecture, batch_size, memory_efficient, device):
+    """
+        Build the model and measure the training step in the current process. Invoked through run_isolated().
+    """
+    torch.manual_seed(0)
+    model = architectures[architecture](num_classes=256, memory_efficient=memory_efficient).to(device)
+    return measure_train_step(model, batch_size, device, steps=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--architecture', default='densenet_121', choices=list(architectures.keys()))
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    print(f'{args.architecture}, batch size {args.batch_size}, device {args.device}')
+    print(f'{"Mode":<20}{"Peak Memory (MB)":>20}{"Step Time (sec)":>20}')
+    for memory_efficient in [False, True]:
+        result = run_isolated(train_step_memory, args.architecture, args.batch_size, memory_efficient, args.device)
+        mode = 'memory efficient' if memory_efficient else 'default'
+        print(f'{mode:<20}{result["peak_memory_mb"]:>20.1f}{result["step_time_sec"]:>20.3f}')
@@ -1,3 +1,4 @@
+from DenseNet.model import *
 from common.torch.utils.base_executor import *
 
 """
@@ -22,7 +23,7 @@ class Executor(BaseExecutor):
         """
 
         # initialize the model
-        self.model = SqueezeNet(num_classes=self.NUM_CLASSES)
+        self.model = densenet_121(num_classes=self.NUM_CLASSES, memory_efficient=self.MEMORY_EFFICIENT)
 
         if not prediction:
             # Save model to tensor board
@@ -77,7 +78,7 @@ class Executor(BaseExecutor):
         for epoch in range(start_epoch, self.EPOCHS + 1):
 
             # Invoke the pre training operations
-            self.pre_training_loop_ops()
+            self.pre_training_loop_ops(epoch)
 
             correct = 0
             total = 0
@@ -118,4 +119,4 @@ class Executor(BaseExecutor):
 
         self.logger.info(f"Test rank 1 Accuracy is {test_accuracy} and rank 5 accuracy is {rank5_accuracy}")
         print(f"Test rank 1 Accuracy is {test_accuracy} and rank 5 accuracy is {rank5_accuracy}")
-        return test_accuracy
+        return test_accuracy, rank5_accuracy
@@ -1,86 +1,182 @@
+import torch.nn as nn
+import torch.utils.checkpoint as cp
 from common.torch.utils.model_util import *
 
 """
-    This is the implementation of the SqueezeNet Architecture using PyTorch Library                   
+    This is the implementation of the DenseNet Architecture using PyTorch Library
+    There are few differences between the Actual Paper and this implementation.
+
+    1.  Use Xavier Normal initialization instead of initializing just from a normal distribution.
+    2.  Memory efficient mode from "Memory-Efficient Implementation of DenseNets" has been incorporated.
+
+    Some of the below code was taken from torch code base.
+
 """
 
 
-class SqueezeModule(CNNBaseModel):
+class DenseLayer(CNNBaseModel):
     """
-        This class defines the SqueezeModule where the 1x1 convolution is implemented.
+        This class defines the bottleneck layer ( DenseNet-B ) of the dense block.
+            1. BatchNorm2d -> ReLU -> 1x1 Conv2d ( bn_size * growth_rate kernels )
+            2. BatchNorm2d -> ReLU -> 3x3 Conv2d ( growth_rate kernels )
+
+        The input of the layer is the concatenation of the output of all the previous layers.
     """
 
-    def __init__(self, in_channels, out_channels):
+    def __init__(self, in_channels, growth_rate, bn_size, drop_rate=0.0, memory_efficient=False):
         """
-            This constructor is responsible for defining the layers in the SqueezeModule.
+            The constructor of the DenseLayer class.
+
+            :param in_channels: number of input channel
+            :param growth_rate: number of output channel ( k in the paper )
+            :param bn_size: multiplicative factor for the bottleneck layer ( 4 in the paper )
+            :param drop_rate: dropout rate after each dense layer
+            :param memory_efficient: if True, recompute the concatenation and the bottleneck layer during backward pass.
         """
-        super(SqueezeModule, self).__init__()
-        self.model = torch.nn.Sequential(
-            torch.nn.Conv2d(in_channels=in_channels, out_channels=out_channels, kernel_size=1, stride=1),
-            torch.nn.ELU(inplace=True)
-        )
-        self.weights_init_xavier_normal()
+        super(DenseLayer, self).__init__()
 
-    def forward(self, x):
+        # The bottleneck layer. The concatenated input is only used by this part.
+        self.bn1 = torch.nn.BatchNorm2d(num_features=in_channels)
+        self.relu1 = torch.nn.ReLU(inplace=True)
+        self.conv1 = torch.nn.Conv2d(in_channels=in_channels, out_channels=bn_size * growth_rate, kernel_size=1, stride=1, bias=False)
+
+        self.bn2 = torch.nn.BatchNorm2d(num_features=bn_size * growth_rate)
+        self.relu2 = torch.nn.ReLU(inplace=True)
+        self.conv2 = torch.nn.Conv2d(in_channels=bn_size * growth_rate, out_channels=growth_rate, kernel_size=3, stride=1, padding=1, bias=False)
+
+        self.drop_rate = drop_rate
+        self.memory_efficient = memory_efficient
+
+    def bottleneck(self, *features):
         """
-            The forward function for the SqueezeModule
-            :param x: input data
+            Concatenate -> BatchNorm2d -> ReLU -> 1x1 Conv2d
+
+            :param features: output of all the previous layers
         """
-        return self.model(x)
+        # A single tensor is already concatenated ( shared storage of the DenseBlock ), avoid the copy.
+        concatenated_features = features[0] if len(features) == 1 else torch.cat(tensors=features, dim=1)
+        return self.conv1(self.relu1(self.bn1(concatenated_features)))
+
+    def forward(self, features):
+        """
+            The forward function for the DenseLayer
+
+            :param features: list of the output of all the previous layers ( or an already concatenated tensor )
+        """
+        if isinstance(features, torch.Tensor):
+            features = [features]
+
+        if self.memory_efficient and any(feature.requires_grad for feature in features):
+            # Do not store the concatenated tensor and the output of BatchNorm2d/ReLU for backward pass.
+            # Both of them grow with the depth of the block ( quadratic memory ). Instead they are
+            # recomputed during the backward pass from the per layer outputs, which are stored anyway.
+            bottleneck_output = cp.checkpoint(self.bottleneck, *features)
+        else:
+            bottleneck_output = self.bottleneck(*features)
+
+        new_features = self.conv2(self.relu2(self.bn2(bottleneck_output)))
 
+        if self.drop_rate > 0:
+            new_features = torch.nn.functional.dropout(new_features, p=self.drop_rate, training=self.training)
 
-class ExpandModule(CNNBaseModel):
+        return new_features
+
+
+class DenseBlock(CNNBaseModel):
     """
-        This class defines the ExpandModule where the 1x1 and 3x3 convolution is implemented.
+        This class defines the Dense Block. Each layer takes the output of all the preceding layers as input.
     """
 
-    def __init__(self, in_channels, out_channels):
+    def __init__(self, num_layers, in_channels, growth_rate, bn_size, drop_rate=0.0, memory_efficient=False):
         """
-            This constructor is responsible for defining the layers in the ExpandModule.
+            The constructor of the DenseBlock class.
+
+            :param num_layers: number of DenseLayer in the block
+            :param in_channels: number of input channel
+            :param growth_rate: number of output channel of each DenseLayer
+            :param bn_size: multiplicative factor for the bottleneck layer
+            :param drop_rate: dropout rate after each dense layer
+            :param memory_efficient: if True, use shared storage for the concatenation ( inference ) and
+                                     recompute the bottleneck layer during backward pass ( training ).
         """
-        super(ExpandModule, self).__init__()
-        self.conv_1x1 = torch.nn.Sequential(
-            torch.nn.Conv2d(in_channels=in_channels, out_channels=out_channels, kernel_size=1, stride=1),
-            torch.nn.ELU(inplace=True)
-        )
+        super(DenseBlock, self).__init__()
 
-        self.conv_3x3 = torch.nn.Sequential(
-            torch.nn.Conv2d(in_channels=in_channels, out_channels=out_channels, kernel_size=3, stride=1, padding=1),
-            torch.nn.ELU(inplace=True)
-        )
+        self.in_channels = in_channels
+        self.growth_rate = growth_rate
+        self.memory_efficient = memory_efficient
 
-        self.weights_init_xavier_normal()
+        self.layers = torch.nn.ModuleList(
+            [DenseLayer(in_channels=in_channels + i * growth_rate, growth_rate=growth_rate, bn_size=bn_size, drop_rate=drop_rate,
+                        memory_efficient=memory_efficient) for i in range(num_layers)])
+
+        # Number of channel after concatenating the output of all the layers
+        self.out_channels = in_channels + num_layers * growth_rate
+
+    def forward_shared_storage(self, x):
+        """
+            Allocate the output of the whole block once and let each layer write into its own channel slice.
+            The input of a layer is a view of the first channels of the same storage, hence no torch.cat()
+            is needed. This is only used when gradients are disabled, since autograd does not allow in-place
+            updates of a tensor whose views have been saved for the backward pass.
+
+            :param x: input data
+        """
+        n, c, h, w = x.shape
+        storage = x.new_empty(n, self.out_channels, h, w)
+        storage[:, :c] = x
+
+        for layer in self.layers:
+            storage[:, c:c + self.growth_rate] = layer(storage[:, :c])
+            c += self.growth_rate
+
+        return storage
 
     def forward(self, x):
         """
-            The forward function for the ExpandModule
+            The forward function for the DenseBlock
+
             :param x: input data
         """
-        conv_1x1 = self.conv_1x1(x)
-        conv_3x3 = self.conv_3x3(x)
+        if self.memory_efficient and not torch.is_grad_enabled():
+            return self.forward_shared_storage(x)
+
+        features = [x]
+        for layer in self.layers:
+            features.append(layer(features))
 
-        # Combine the layers in array
         # Concatenate by channel, hence dim=1 (N, C, H, W)
-        return torch.cat(tensors=[conv_1x1, conv_3x3], dim=1)
+        return torch.cat(tensors=features, dim=1)
 
 
-class FireModule(CNNBaseModel):
+class TransitionLayer(CNNBaseModel):
     """
-        This class defines the FireModule of the SqueezeNet architecture.
+        This class defines the Transition Layer between two dense blocks.
+            1. BatchNorm2d
+            2. ReLU
+            3. 1x1 Conv2d ( reduces the channel size by the compression factor )
+            4. 2x2 AvgPool2d
     """
 
-    def __init__(self, in_channels, squeeze_filter, expand_filter):
-        super(FireModule, self).__init__()
+    def __init__(self, in_channels, out_channels):
+        """
+            The constructor of the TransitionLayer class.
+
+            :param in_channels: number of input channel
+            :param out_channels: output channel
+        """
+        super(TransitionLayer, self).__init__()
 
-        # Define the Squeeze and Expand Module
         self.model = torch.nn.Sequential(
-            SqueezeModule(in_channels=in_channels, out_channels=squeeze_filter),
-            ExpandModule(in_channels=squeeze_filter, out_channels=expand_filter)
+            torch.nn.BatchNorm2d(num_features=in_channels),
+            torch.nn.ReLU(inplace=True),
+            torch.nn.Conv2d(in_channels=in_channels, out_channels=out_channels, kernel_size=1, stride=1, bias=False),
+            torch.nn.AvgPool2d(kernel_size=2, stride=2)
         )
 
     def forward(self, x):
         """
-            The forward function for the FireModule
+            The forward function for the TransitionLayer
+
             :param x: input data
         """
         return self.model(x)
@@ -88,51 +184,66 @@ class FireModule(CNNBaseModel):
 
 class DenseNet(CNNBaseModel):
     """
-        This class defines the SqueezeNet Architecture.
+        This class defines the DenseNet-BC Architecture.
     """
 
-    def __init__(self, num_classes=256):
+    def __init__(self, block_config, growth_rate=32, num_init_features=64, bn_size=4, compression=0.5, drop_rate=0.0, num_classes=256,
+                 memory_efficient=False):
         """
             This constructor is responsible for defining the layers in the architecture.
+
+            :param block_config: number of DenseLayer in each DenseBlock
+            :param growth_rate: number of output channel of each DenseLayer ( k in the paper )
+            :param num_init_features: output channel of the first convolution layer
+            :param bn_size: multiplicative factor for the bottleneck layer
+            :param compression: reduction of channel size in the transition layer ( theta in the paper )
+            :param drop_rate: dropout rate after each dense layer
+            :param num_classes: number of classes
+            :param memory_efficient: if True, activation memory grows linearly with the depth instead of quadratically.
+                                     This is slower ( ~15-20% ) due to the recomputation during backward pass.
         """
         super(DenseNet, self).__init__()
 
-        self.model = torch.nn.Sequential(
-
-            # Initial Layers
-            torch.nn.Conv2d(in_channels=3, out_channels=64, kernel_size=3, stride=2),
-            torch.nn.ELU(inplace=True),
-            torch.nn.MaxPool2d(kernel_size=3, stride=2, ceil_mode=True),
-
-            # Fire Modules
-            FireModule(in_channels=64, squeeze_filter=16, expand_filter=64),
-            FireModule(in_channels=64 * 2, squeeze_filter=16, expand_filter=64),
+        layers = []
 
-            torch.nn.MaxPool2d(kernel_size=3, stride=2, ceil_mode=True),
+        # Initial Convolution and Max Pooling Layers
+        layers += [torch.nn.Conv2d(in_channels=3, out_channels=num_init_features, kernel_size=7, stride=2, padding=3, bias=False)]
+        layers += [torch.nn.BatchNorm2d(num_features=num_init_features)]
+        layers += [torch.nn.ReLU(inplace=True)]
+        layers += [torch.nn.MaxPool2d(kernel_size=3, stride=2, padding=1)]
 
-            FireModule(in_channels=64 * 2, squeeze_filter=32, expand_filter=128),
-            FireModule(in_channels=128 * 2, squeeze_filter=32, expand_filter=128),
+        in_channels = num_init_features
 
-            torch.nn.MaxPool2d(kernel_size=3, stride=2, ceil_mode=True),
+        # Loop through the block configuration
+        for i, num_layers in enumerate(block_config):
+            block = DenseBlock(num_layers=num_layers, in_channels=in_channels, growth_rate=growth_rate, bn_size=bn_size, drop_rate=drop_rate,
+                               memory_efficient=memory_efficient)
+            layers += [block]
+            in_channels = block.out_channels
 
-            FireModule(in_channels=128 * 2, squeeze_filter=48, expand_filter=192),
-            FireModule(in_channels=192 * 2, squeeze_filter=48, expand_filter=192),
-            FireModule(in_channels=192 * 2, squeeze_filter=64, expand_filter=256),
-            FireModule(in_channels=256 * 2, squeeze_filter=64, expand_filter=256),
+            # No transition layer after the last dense block
+            if i != len(block_config) - 1:
+                out_channels = int(in_channels * compression)
+                layers += [TransitionLayer(in_channels=in_channels, out_channels=out_channels)]
+                in_channels = out_channels
 
-            torch.nn.Dropout(p=0.5),
+        # Final BatchNorm2d as the dense layers use pre-activation
+        layers += [torch.nn.BatchNorm2d(num_features=in_channels)]
+        layers += [torch.nn.ReLU(inplace=True)]
 
-            # Have number of channels equal to number of classes
-            torch.nn.Conv2d(in_channels=256 * 2, out_channels=num_classes, kernel_size=1, stride=1),
-            torch.nn.ELU(inplace=True),
+        # AdaptiveAvgPool2d will shrink the layers automatically. No need to provide the kernel.
+        layers += [torch.nn.AdaptiveAvgPool2d((1, 1))]
+        # Flatten the layers
+        layers += [Flatten()]
 
-            # AdaptiveAvgPool2d will shrink the layers automatically. No need to provide the kernel.
-            torch.nn.AdaptiveAvgPool2d((1, 1)),
-            Flatten(),
+        # Define linear layers
+        layers += [nn.Linear(in_channels, num_classes)]
+        # dim - A dimension along which LogSoftmax will be computed.
+        # Since our inout is (N, L), we need to pass 1
+        layers += [torch.nn.LogSoftmax(dim=1)]
 
-            # Linear Layer is not needed
-            torch.nn.LogSoftmax(dim=1)
-        )
+        # Create the Sequential layer
+        self.model = torch.nn.Sequential(*layers)
 
         # Use xavier normal initializer
         self.weights_init_xavier_normal()
@@ -140,9 +251,49 @@ class DenseNet(CNNBaseModel):
     # @torch.cuda.amp.autocast()
     def forward(self, x):
         """
-            The forward function for the SqueezeNet
+            The forward function for the DenseNet
 
             :param x: input data
         """
         x = self.model(x)
         return x
+
+
+def densenet_121(num_classes=256, memory_efficient=False):
+    """
+        This function defines the DenseNet-121 architecture
+
+        :param num_classes: number of classes
+        :param memory_efficient: use the memory efficient implementation
+    """
+    return DenseNet(block_config=(6, 12, 24, 16), growth_rate=32, num_init_features=64, num_classes=num_classes, memory_efficient=memory_efficient)
+
+
+def densenet_169(num_classes=256, memory_efficient=False):
+    """
+        This function defines the DenseNet-169 architecture
+
+        :param num_classes: number of classes
+        :param memory_efficient: use the memory efficient implementation
+    """
+    return DenseNet(block_config=(6, 12, 32, 32), growth_rate=32, num_init_features=64, num_classes=num_classes, memory_efficient=memory_efficient)
+
+
+def densenet_201(num_classes=256, memory_efficient=False):
+    """
+        This function defines the DenseNet-201 architecture
+
+        :param num_classes: number of classes
+        :param memory_efficient: use the memory efficient implementation
+    """
+    return DenseNet(block_config=(6, 12, 48, 32), growth_rate=32, num_init_features=64, num_classes=num_classes, memory_efficient=memory_efficient)
+
+
+def densenet_161(num_classes=256, memory_efficient=False):
+    """
+        This function defines the DenseNet-161 architecture
+
+        :param num_classes: number of classes
+        :param memory_efficient: use the memory efficient implementation
+    """
+    return DenseNet(block_config=(6, 12, 36, 24), growth_rate=48, num_init_features=96, num_classes=num_classes, memory_efficient=memory_efficient)
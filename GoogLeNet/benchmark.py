@@ -0,0 +1,73 @@
+import copy
+import argparse
+from GoogLeNet.model import *
+from common.torch.utils.benchmark_util import *
+
+"""
+    Compares the reference InceptionModule against the version where the three sibling 1x1 convolutions
+    are merged into one convolution ( InceptionModule.fuse_1x1_convolutions() ).
+
+    1.  Verifies that both versions produce the same output ( module and full network ).
+    2.  Prints the CPU latency of each of the 9 inception modules at their real input shape.
+
+    Usage: python -m GoogLeNet.benchmark --batch-size 16
+"""
+
+
+def inception_inputs(model, x):
+    """
+        Walk through the sequential layers and capture the input of every InceptionModule.
+    """
+    inputs = []
+    with torch.no_grad():
+        for layer in model.model:
+            if isinstance(layer, InceptionModule):
+                inputs.append((layer, x))
+            x = layer(x)
+    return inputs
+
+
+def check_parity(reference, fused, x, atol=1e-5):
+    """
+        Assert the fused module produces the same output as the reference module.
+    """
+    with torch.no_grad():
+        difference = max_abs_difference(reference(x), fused(x))
+    assert difference <= atol, f"Fused output differs from the reference output by {difference}"
+    return difference
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    torch.manual_seed(0)
+    model = GoogLeNet(num_classes=256).eval()
+    fused_model = copy.deepcopy(model).fuse_inception_modules().eval()
+
+    x = torch.rand(args.batch_size, 3, 224, 224)
+
+    # Full network parity
+    print(f'GoogLeNet max abs difference: {check_parity(model, fused_model, x)}')
+
+    print(f'{"Module":<12}{"Input":<24}{"Reference (ms)":>16}{"Fused (ms)":>14}{"Speedup":>10}{"Max Diff":>12}')
+    names = ['3a', '3b', '4a', '4b', '4c', '4d', '4e', '5a', '5b']
+    for name, (module, module_input) in zip(names, inception_inputs(model, x)):
+        fused_module = copy.deepcopy(module).fuse_1x1_convolutions().eval()
+        difference = check_parity(module, fused_module, module_input)
+
+        reference_latency = measure_module_latency(module, module_input, repeat=args.repeat)['p50_ms']
+        fused_latency = measure_module_latency(fused_module, module_input, repeat=args.repeat)['p50_ms']
+
+        print(f'{name:<12}{str(tuple(module_input.shape)):<24}{reference_latency:>16.3f}{fused_latency:>14.3f}'
+              f'{reference_latency / fused_latency:>10.2f}{difference:>12.2e}')
+
+    reference_latency = measure_module_latency(model, x, repeat=args.repeat)['p50_ms']
+    fused_latency = measure_module_latency(fused_model, x, repeat=args.repeat)['p50_ms']
+    print(f'GoogLeNet: reference {reference_latency:.3f} ms, fused {fused_latency:.3f} ms, speedup {reference_latency / fused_latency:.2f}')
@@ -82,7 +82,7 @@ class Executor(BaseExecutor):
         for epoch in range(start_epoch, self.EPOCHS + 1):
 
             # Invoke the pre training operations
-            self.pre_training_loop_ops()
+            self.pre_training_loop_ops(epoch)
 
             correct = 0
             total = 0
@@ -101,8 +101,8 @@ class Executor(BaseExecutor):
             # Invoke the post training operations
             eval_accuracy = self.post_training_loop_ops(epoch, train_accuracy)
 
-            # Scheduler step() function
-            self.scheduler.step(eval_accuracy / 100)
+            # Scheduler step() function, with ASYNC_VALIDATION the step is done when the validation result arrives
+            self.step_scheduler_on_validation(eval_accuracy)
 
             # use this for CosineAnnealingLR
             # self.scheduler.step()
@@ -119,6 +119,11 @@ class Executor(BaseExecutor):
         # Load model from checkpoint
         self.load_checkpoint()
 
+        # Merge the sibling 1x1 convolutions of the inception modules for faster inference.
+        # This needs to happen after loading the checkpoint as the fused model has different state_dict keys.
+        if self.FUSE_INCEPTION:
+            self.model.fuse_inception_modules()
+
         test_accuracy = self.prediction_accuracy()
 
         self.logger.info(f"Test Prediction Accuracy is {test_accuracy}")
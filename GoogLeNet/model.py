@@ -63,7 +63,7 @@ class InceptionModule(CNNBaseModel):
         This class defines the Inception Module for the GoogLeNet Architecture.
     """
 
-    def __init__(self, in_channels, num1x1, num3x3reduce, num3x3, num5x5reduce, num5x5, num1x1reduce):
+    def __init__(self, in_channels, num1x1, num3x3reduce, num3x3, num5x5reduce, num5x5, num1x1reduce, fused=False):
         """
             The constructor of the InceptionModule class.
 
@@ -74,9 +74,16 @@ class InceptionModule(CNNBaseModel):
             :param num5x5reduce: bottleneck channel size of 5x5 convolution
             :param num5x5: channel size of 5x5 convolution
             :param num1x1reduce: bottleneck channel size of 1x1 convolution after max pool
+            :param fused: if True, the three 1x1 convolutions reading the input are merged into one wider convolution
         """
         super(InceptionModule, self).__init__()
 
+        # Output channel size of the three sibling 1x1 convolutions ( conv_1x1, 3x3 reduce, 5x5 reduce )
+        self.split_sizes = [num1x1, num3x3reduce, num5x5reduce]
+
+        # Holds the merged 1x1 convolution once fuse_1x1_convolutions() has been invoked
+        self.conv_reduce = None
+
         self.conv_1x1 = torch.nn.Sequential(
             DefaultConvolutionModule(in_channels=in_channels, out_channels=num1x1, kernel=1)
         )
@@ -96,15 +103,70 @@ class InceptionModule(CNNBaseModel):
             DefaultConvolutionModule(in_channels=in_channels, out_channels=num1x1reduce, kernel=3, padding=1)
         )
 
+        if fused:
+            self.fuse_1x1_convolutions()
+
+    @property
+    def fused(self):
+        return self.conv_reduce is not None
+
+    def fuse_1x1_convolutions(self):
+        """
+            Merge the conv_1x1, 3x3 reduce and 5x5 reduce convolutions into one DefaultConvolutionModule.
+            All three read the same input with a 1x1 kernel, hence their weights can be stacked along the
+            output channel and computed as one big GEMM. The BatchNorm2d is per channel, so its parameters
+            and running statistics are stacked the same way. The output is split back afterwards, hence
+            the module produces the same output as before ( in both train and eval mode ).
+
+            This can be used on a trained model ( after loading the checkpoint ) or in the constructor
+            to train the fused version directly. Note: the state_dict keys change after fusing.
+        """
+        if self.fused:
+            return self
+
+        branches = [self.conv_1x1[0], self.conv_3x3[0], self.conv_5x5[0]]
+
+        # The channel sizes change after structured pruning
+        self.split_sizes = [branch.conv.out_channels for branch in branches]
+
+        conv_reduce = DefaultConvolutionModule(in_channels=branches[0].conv.in_channels, out_channels=sum(self.split_sizes), kernel=1)
+        conv_reduce.to(branches[0].conv.weight.device)
+
+        # Copy the weights, bias and batch norm statistics of the branches to the fused module
+        with torch.no_grad():
+            conv_reduce.conv.weight.copy_(torch.cat([branch.conv.weight for branch in branches], dim=0))
+            conv_reduce.conv.bias.copy_(torch.cat([branch.conv.bias for branch in branches], dim=0))
+            for name in ['weight', 'bias', 'running_mean', 'running_var']:
+                getattr(conv_reduce.bn, name).copy_(torch.cat([getattr(branch.bn, name) for branch in branches], dim=0))
+            conv_reduce.bn.num_batches_tracked.copy_(branches[0].bn.num_batches_tracked)
+
+        conv_reduce.train(self.training)
+        self.conv_reduce = conv_reduce
+
+        # The 1x1 layers are now part of conv_reduce. Replace them with Identity so that the
+        # remaining layers keep their position ( and name ) inside the Sequential containers.
+        self.conv_1x1[0] = torch.nn.Identity()
+        self.conv_3x3[0] = torch.nn.Identity()
+        self.conv_5x5[0] = torch.nn.Identity()
+
+        return self
+
     def forward(self, x):
         """
             The forward function for the DefaultConvolutionModule
 
             :param x: input data
         """
-        conv_1x1 = self.conv_1x1(x)
-        conv_3x3 = self.conv_3x3(x)
-        conv_5x5 = self.conv_5x5(x)
+        if self.fused:
+            # One convolution for all the 1x1 layers, then split by channel for each branch
+            conv_1x1, conv_3x3, conv_5x5 = torch.split(self.conv_reduce(x), self.split_sizes, dim=1)
+            conv_1x1 = self.conv_1x1(conv_1x1)
+            conv_3x3 = self.conv_3x3(conv_3x3)
+            conv_5x5 = self.conv_5x5(conv_5x5)
+        else:
+            conv_1x1 = self.conv_1x1(x)
+            conv_3x3 = self.conv_3x3(x)
+            conv_5x5 = self.conv_5x5(x)
         pool = self.pool(x)
 
         # Combine the layers in array
@@ -119,9 +181,12 @@ class GoogLeNet(CNNBaseModel):
         This class defines the GoogLeNet Architecture.
     """
 
-    def __init__(self, num_classes=256):
+    def __init__(self, num_classes=256, fused=False):
         """
             This constructor is responsible for defining the layers in the architecture.
+
+            :param num_classes: number of classes
+            :param fused: if True, create the InceptionModules with the 1x1 convolutions merged.
         """
         super(GoogLeNet, self).__init__()
         self.model = torch.nn.Sequential(
@@ -176,6 +241,59 @@ class GoogLeNet(CNNBaseModel):
         # Use xavier normal initializer
         self.weights_init_xavier_normal()
 
+        if fused:
+            self.fuse_inception_modules()
+
+    def fuse_inception_modules(self):
+        """
+            Merge the sibling 1x1 convolutions of every InceptionModule. Invoke this after loading
+            the checkpoint for faster inference.
+        """
+        for module in self.modules():
+            if isinstance(module, InceptionModule):
+                module.fuse_1x1_convolutions()
+        return self
+
+    def pruning_groups(self):
+        """
+            Returns the channel groups for structured pruning. Every DefaultConvolutionModule is a group with its own
+            BatchNorm2d. The output of the four branches of an InceptionModule are concatenated, hence the channels of
+            a branch are at an offset in the input of the next InceptionModule ( or the Linear layer ).
+            Invoke this before fuse_inception_modules().
+        """
+        inceptions = [layer for layer in self.model if isinstance(layer, InceptionModule)]
+        if any(inception.fused for inception in inceptions):
+            raise ValueError('Prune the model before fusing the 1x1 convolutions')
+
+        def readers(inception, before=()):
+            # The first layer of every branch reads the input of the InceptionModule
+            modules = [inception.conv_1x1[0], inception.conv_3x3[0], inception.conv_5x5[0], inception.pool[1]]
+            return [Consumer(module.conv, before) for module in modules]
+
+        def group(name, module, consumers):
+            return PruningGroup(name, producers=[module.conv], channel_layers=[module.bn], consumers=consumers)
+
+        groups = [group('stem.0', self.model[0], [Consumer(self.model[2].conv)]),
+                  group('stem.1', self.model[2], [Consumer(self.model[3].conv)]),
+                  group('stem.2', self.model[3], readers(inceptions[0]))]
+
+        linear = [layer for layer in self.model if isinstance(layer, nn.Linear)][0]
+        for i, inception in enumerate(inceptions):
+            groups.append(group(f'inception{i}.conv_3x3.0', inception.conv_3x3[0], [Consumer(inception.conv_3x3[1].conv)]))
+            groups.append(group(f'inception{i}.conv_5x5.0', inception.conv_5x5[0], [Consumer(inception.conv_5x5[1].conv)]))
+
+            branches = [('conv_1x1', inception.conv_1x1[0]), ('conv_3x3', inception.conv_3x3[1]), ('conv_5x5', inception.conv_5x5[1]),
+                        ('pool', inception.pool[1])]
+            for j, (name, module) in enumerate(branches):
+                before = [branch.conv for _, branch in branches[:j]]
+                if i + 1 < len(inceptions):
+                    consumers = readers(inceptions[i + 1], before)
+                else:
+                    consumers = [Consumer(linear, before)]
+                groups.append(group(f'inception{i}.{name}', module, consumers))
+
+        return groups
+
     # @torch.cuda.amp.autocast()
     def forward(self, x):
         """
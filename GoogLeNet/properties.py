@@ -16,11 +16,54 @@ config['CHECKPOINT_INTERVAL'] = 10
 config['NUM_CLASSES'] = 256
 config['EPOCHS'] = 100
 
+# Merge the 1x1 convolutions of each InceptionModule during prediction
+config['FUSE_INCEPTION'] = True
+
 # ======================================= DEFAULT ============================================= #
 
 config['DEVICE'] = torch.device("cuda") if torch.cuda.is_available() else torch.device('cpu')
 config['MULTI_GPU'] = False
 config['FP16_MIXED'] = False
 
+# Iterative structured pruning, dict of epoch -> sparsity ( e.g. {110: 0.25, 120: 0.5} ). None to disable.
+# The channels are removed after the epoch and the following epochs fine-tune the smaller model.
+config['PRUNING_SCHEDULE'] = None
+config['PRUNING_CRITERION'] = 'l1'
+config['PRUNING_BATCHES'] = 10
+
+# Progressive resizing, first epoch -> training resolution, e.g. {1: 128, 6: 176, 11: 224}. None trains at the full resolution.
+config['RESOLUTION_SCHEDULE'] = None
+# Log the wall clock time when this validation accuracy is reached, None to disable
+config['TARGET_ACCURACY'] = None
+
+# CPU threads of the process, 'auto' splits the cores between the process and the DataLoader workers. None keeps the torch default.
+config['CPU_THREADS'] = 'auto' if config['DEVICE'].type == 'cpu' else None
+config['CPU_INTEROP_THREADS'] = None
+config['CPU_WORKER_THREADS'] = None
+config['CPU_AFFINITY'] = False
+
+# Test time augmentation of prediction(): none, flip, five_crop, ten_crop or multi_scale. Max images x views per forward pass.
+config['TTA_POLICY'] = 'none'
+config['TTA_MAX_BATCH_SIZE'] = 256
+
+# Validate every VALIDATION_INTERVAL epochs, on a fixed random subset of the validation images ( fraction or number ) if
+# VALIDATION_SUBSET is set. ASYNC_VALIDATION runs the validation on a CPU snapshot in a background process.
+config['VALIDATION_INTERVAL'] = 1
+config['VALIDATION_SUBSET'] = None
+config['ASYNC_VALIDATION'] = False
+config['ASYNC_VALIDATION_DEVICE'] = 'cpu'
+config['ASYNC_VALIDATION_WORKERS'] = 2
+config['ASYNC_VALIDATION_THREADS'] = None
+
+# Seconds between two flushes ( and fsync ) of the tensor board data written during the training, and between two
+# redraws of the progress bar.
+config['METRICS_FLUSH_SECS'] = 30
+config['PROGRESS_REFRESH_SECS'] = 1.0
+
+# Backend used by prediction(), torch or onnxruntime. The model is exported to ONNX_MODEL_FILE unless the file was
+# exported from the same checkpoint.
+config['INFERENCE_BACKEND'] = 'torch'
+config['ONNX_MODEL_FILE'] = None
+
 config["LOGFILE"] = "output.log"
 config["LOGLEVEL"] = "INFO"
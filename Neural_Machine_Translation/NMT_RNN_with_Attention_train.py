@@ -6,7 +6,8 @@ from torchtext.data import Field, BucketIterator
 import spacy
 import numpy as np
 import random
-from tqdm import tqdm
+from datetime import datetime
+from common.torch.utils.metrics_sink import MetricsSink, ProgressBar
 import torch.nn.functional as F
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -218,8 +219,12 @@ def train(train_iterator, valid_iterator, source, target, epochs=10):
 
     clip = 1
 
+    # The losses of every epoch are written to tensor board as soon as they are available
+    tb_writer = MetricsSink(f'runs/nmt_rnn_attention_{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+
     for epoch in range(1, epochs + 1):
-        pbar = tqdm(total=len(train_iterator), bar_format='{l_bar}{bar:10}{r_bar}{bar:-10b}', unit=' batches', ncols=200)
+        # Redrawn at most once per second
+        pbar = ProgressBar(len(train_iterator))
 
         training_loss = []
         # set training mode
@@ -258,8 +263,8 @@ def train(train_iterator, valid_iterator, source, target, epochs=10):
 
             training_loss.append(loss.item())
 
-            pbar.set_postfix(
-                epoch=f" {epoch}, train loss= {round(sum(training_loss) / len(training_loss), 4)}", refresh=True)
+            if pbar.due():
+                pbar.set_postfix(epoch=f" {epoch}, train loss= {round(sum(training_loss) / len(training_loss), 4)}")
             pbar.update()
 
         with torch.no_grad():
@@ -291,6 +296,10 @@ def train(train_iterator, valid_iterator, source, target, epochs=10):
             refresh=False)
         pbar.close()
 
+        tb_writer.add_scalars("Loss", {'train': sum(training_loss) / len(training_loss), 'val': sum(validation_loss) / len(validation_loss)}, epoch)
+
+    tb_writer.close()
+
     return model
 
 
@@ -0,0 +1,45 @@
+import argparse
+from ResNet.model import *
+from common.torch.utils.benchmark_util import *
+
+"""
+    Measures the peak memory vs the step time of a ResNet training step for different activation
+    checkpointing settings. Each measurement runs in a fresh process so that the peak RSS on CPU is
+    not shared between the runs.
+
+    Usage: python -m ResNet.benchmark --architecture resnet_50 --batch-size 32 --segments 0 2 4 8
+"""
+
+architectures = {
+    'resnet_20': resnet_20,
+    'resnet_26': resnet_26,
+    'resnet_29': resnet_29,
+    'resnet_38': resnet_38,
+    'resnet_50': resnet_50
+}
+
+
+def train_step_memory(architecture, batch_size, segments, device):
+    """
+        Build the model and measure the training step in the current process. Invoked through run_isolated().
+    """
+    torch.manual_seed(0)
+    model = architectures[architecture](num_classes=256).to(device)
+    if segments:
+        model.enable_activation_checkpointing(segments=segments)
+    return measure_train_step(model, batch_size, device)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--architecture', default='resnet_50', choices=list(architectures.keys()))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--segments', type=int, nargs='+', default=[0, 2, 4, 8], help='0 disables the checkpointing')
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    print(f'{args.architecture}, batch size {args.batch_size}, device {args.device}')
+    print(f'{"Segments":<12}{"Peak Memory (MB)":>20}{"Step Time (sec)":>20}')
+    for segments in args.segments:
+        result = run_isolated(train_step_memory, args.architecture, args.batch_size, segments, args.device)
+        print(f'{segments if segments else "disabled":<12}{result["peak_memory_mb"]:>20.1f}{result["step_time_sec"]:>20.3f}')
@@ -27,6 +27,9 @@ class Executor(BaseExecutor):
         # Save model to tensor board
         self.save_model_to_tensor_board()
 
+        # Trade compute for memory if configured
+        self.enable_activation_checkpointing()
+
         self.enable_multi_gpu_training()
 
         # Send the model to GPU
@@ -78,7 +81,7 @@ class Executor(BaseExecutor):
         for epoch in range(start_epoch, self.EPOCHS + 1):
 
             # Invoke the pre training operations
-            self.pre_training_loop_ops()
+            self.pre_training_loop_ops(epoch)
 
             correct = 0
             total = 0
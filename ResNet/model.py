@@ -168,6 +168,54 @@ class ResNet(CNNBaseModel):
         # Use xavier normal initializer
         self.weights_init_xavier_normal()
 
+    def pruning_groups(self):
+        """
+            Returns the channel groups for structured pruning.
+                1.  The two inner convolutions of every ResNetBottleNeck, read by the BatchNorm2d and the Conv2d of
+                    the next ConvWithPreActivation.
+                2.  The residual stream of every stage. The output of the last convolution of all the blocks and the
+                    down_sample convolution are added together, hence the same channels are removed from all of them
+                    and from every layer reading the stream ( the next blocks, the next stage and the Linear layer ).
+                3.  The first convolution, read by the first block of the first stage.
+        """
+        blocks = [layer for layer in self.model if isinstance(layer, ResNetBottleNeck)]
+
+        groups = []
+        for i, block in enumerate(blocks):
+            for j in range(2):
+                groups.append(PruningGroup(f'block{i}.conv{j}', producers=[block.model[j].model[1]], channel_layers=[block.model[j + 1].model[0]],
+                                           consumers=[Consumer(block.model[j + 1].model[1])]))
+
+        # A block with the down_sample convolution starts a new stage
+        stages = []
+        for block in blocks:
+            if block.down_sample is not None:
+                stages.append([])
+            stages[-1].append(block)
+
+        def readers(block):
+            # The layers reading the input of a block
+            consumers = [Consumer(block.model[0].model[1])]
+            if block.down_sample is not None:
+                consumers.append(Consumer(block.down_sample))
+            return [block.model[0].model[0]], consumers
+
+        channel_layers, consumers = readers(stages[0][0])
+        groups.append(PruningGroup('stem', producers=[self.model[0].model[1]], channel_layers=channel_layers, consumers=consumers))
+
+        linear = [layer for layer in self.model if isinstance(layer, nn.Linear)][0]
+        for i, stage in enumerate(stages):
+            group = PruningGroup(f'stage{i}', producers=[stage[0].down_sample] + [block.model[2].model[1] for block in stage])
+            for block in stage[1:] + (stages[i + 1][:1] if i + 1 < len(stages) else []):
+                channel_layers, consumers = readers(block)
+                group.channel_layers += channel_layers
+                group.consumers += consumers
+            if i + 1 == len(stages):
+                group.consumers.append(Consumer(linear))
+            groups.append(group)
+
+        return groups
+
     # @torch.cuda.amp.autocast()
     def forward(self, x):
         """
@@ -175,7 +223,7 @@ class ResNet(CNNBaseModel):
 
             :param x: input data
         """
-        x = self.model(x)
+        x = self.forward_model(x)
         return x
 
 
@@ -0,0 +1,37 @@
+from torch.utils.data import DataLoader
+from common.torch.dataset.dataset import ClassificationDataset
+import pandas as pd
+from common.torch.utils.sweep_executor import *
+from ResNet.transformation import *
+from ResNet.properties import *
+from common.torch.utils.autotune import load_tuned_settings
+import timeit
+
+if __name__ == '__main__':
+    def getDataLoader(csv_path, images_path, transformation, fields, training=False, batch_size=16, shuffle=False, num_workers=4,
+                      pin_memory=False,
+                      drop_last=True, **kwargs):
+        df = pd.read_csv(csv_path)
+        dataset = ClassificationDataset(images_path, df, transformation, fields, training)
+        data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers, pin_memory=pin_memory, drop_last=drop_last,
+                                 **kwargs)
+        return data_loader
+
+
+    # Use a different project name, so that the checkpoints of the ResNet training are not loaded
+    config['PROJECT_NAME'] = f"{config['PROJECT_NAME']}_sweep"
+
+    fields = {'image': 'image', 'label': 'class'}
+    # The batch size must fit the largest model of the sweep ( python -m common.torch.utils.autotune --model resnet_38 )
+    settings = load_tuned_settings('resnet_38', batch_size=128, num_workers=16, pin_memory=True)
+    train_data_loader = getDataLoader(csv_path=config['TRAIN_CSV'], images_path=config['TRAIN_DIR'], transformation=train_transformation,
+                                      fields=fields, training=True, shuffle=True, **settings)
+    val_data_loader = getDataLoader(csv_path=config['VALID_CSV'], images_path=config['VALID_DIR'], transformation=test_transformation, fields=fields,
+                                    training=False, batch_size=64, shuffle=True, num_workers=4, pin_memory=True, drop_last=False)
+
+    e = SweepExecutor("", {'TRAIN': train_data_loader, 'VAL': val_data_loader}, config=config)
+
+    start = timeit.default_timer()
+    e.train()
+    stop = timeit.default_timer()
+    print(f'Training Time: {round((stop - start) / 60, 2)} Minutes')
@@ -0,0 +1,67 @@
+import copy
+import argparse
+from SqueezeNet.model import *
+from common.torch.utils.benchmark_util import *
+
+"""
+    Compares the reference ExpandModule ( 1x1 + 3x3 convolution and torch.cat() ) against the
+    reparameterized version which runs a single 3x3 convolution ( ExpandModule.reparameterize() ).
+
+    1.  Verifies that both versions produce the same output for every FireModule and the full network.
+    2.  Prints the CPU latency of the full network for different batch sizes.
+
+    Usage: python -m SqueezeNet.benchmark --batch-sizes 1 8 32 64
+"""
+
+
+def check_parity(reference, candidate, x, atol=1e-5):
+    """
+        Assert the reparameterized module produces the same output as the reference module.
+    """
+    with torch.no_grad():
+        difference = max_abs_difference(reference(x), candidate(x))
+    assert difference <= atol, f"Reparameterized output differs from the reference output by {difference}"
+    return difference
+
+
+def check_expand_modules(model, x):
+    """
+        Run the parity check on every ExpandModule at its real input shape.
+    """
+    differences = []
+    with torch.no_grad():
+        for layer in model.model:
+            if isinstance(layer, FireModule):
+                squeezed = layer.model[0](x)
+                expand = layer.model[1]
+                differences.append(check_parity(expand, copy.deepcopy(expand).reparameterize().eval(), squeezed))
+            x = layer(x)
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    torch.manual_seed(0)
+    model = SqueezeNet(num_classes=256).eval()
+    fused_model = copy.deepcopy(model).reparameterize().eval()
+
+    x = torch.rand(2, 3, 224, 224)
+    print(f'ExpandModule max abs difference: {max(check_expand_modules(model, x))}')
+    print(f'SqueezeNet max abs difference: {check_parity(model, fused_model, x)}')
+
+    print(f'{"Batch":<8}{"Reference (ms)":>16}{"Fused (ms)":>14}{"Speedup":>10}{"Images/sec":>14}')
+    for batch_size in args.batch_sizes:
+        x = torch.rand(batch_size, 3, 224, 224)
+        reference_latency = measure_module_latency(model, x, repeat=args.repeat)['p50_ms']
+        fused_latency = measure_module_latency(fused_model, x, repeat=args.repeat)['p50_ms']
+
+        print(f'{batch_size:<8}{reference_latency:>16.3f}{fused_latency:>14.3f}{reference_latency / fused_latency:>10.2f}'
+              f'{1000.0 * batch_size / fused_latency:>14.1f}')
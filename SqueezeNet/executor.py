@@ -78,7 +78,7 @@ class Executor(BaseExecutor):
         for epoch in range(start_epoch, self.EPOCHS + 1):
 
             # Invoke the pre training operations
-            self.pre_training_loop_ops()
+            self.pre_training_loop_ops(epoch)
 
             correct = 0
             total = 0
@@ -115,8 +115,13 @@ class Executor(BaseExecutor):
         # Load model from checkpoint
         self.load_checkpoint()
 
+        # Use the single convolution expand layer for inference.
+        # This needs to happen after loading the checkpoint as the state_dict keys are different.
+        if self.REPARAMETERIZE:
+            self.model.reparameterize()
+
         test_accuracy, rank5_accuracy = self.prediction_accuracy()
 
         self.logger.info(f"Test rank 1 Accuracy is {test_accuracy} and rank 5 accuracy is {rank5_accuracy}")
         print(f"Test rank 1 Accuracy is {test_accuracy} and rank 5 accuracy is {rank5_accuracy}")
-        return test_accuracy
+        return test_accuracy, rank5_accuracy
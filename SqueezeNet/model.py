@@ -39,6 +39,10 @@ class ExpandModule(CNNBaseModel):
             This constructor is responsible for defining the layers in the ExpandModule.
         """
         super(ExpandModule, self).__init__()
+
+        # Holds the single 3x3 convolution once reparameterize() has been invoked
+        self.conv_fused = None
+
         self.conv_1x1 = torch.nn.Sequential(
             torch.nn.Conv2d(in_channels=in_channels, out_channels=out_channels, kernel_size=1, stride=1),
             torch.nn.ELU(inplace=True)
@@ -51,11 +55,49 @@ class ExpandModule(CNNBaseModel):
 
         self.weights_init_xavier_normal()
 
+    def reparameterize(self):
+        """
+            Replace the 1x1 and 3x3 convolution with a single 3x3 convolution for inference.
+            The 1x1 kernel is placed at the center of a zero padded 3x3 kernel, hence with padding=1 it
+            computes the same output as the 1x1 convolution. Both kernels are then stacked along the
+            output channel in the same order as torch.cat() in forward(). ELU is element wise, so one
+            ELU after the fused convolution is same as one ELU per branch.
+
+            Invoke this after loading the checkpoint, the state_dict keys change after reparameterization.
+        """
+        if self.conv_fused is not None:
+            return self
+
+        conv_1x1 = self.conv_1x1[0]
+        conv_3x3 = self.conv_3x3[0]
+
+        conv = torch.nn.Conv2d(in_channels=conv_3x3.in_channels, out_channels=conv_1x1.out_channels + conv_3x3.out_channels, kernel_size=3,
+                               stride=1, padding=1)
+        conv.to(conv_3x3.weight.device)
+
+        with torch.no_grad():
+            # Pad the 1x1 kernel with 1 zero on each side of the spatial dimension -> 3x3
+            weight_1x1 = torch.nn.functional.pad(conv_1x1.weight, [1, 1, 1, 1])
+            conv.weight.copy_(torch.cat([weight_1x1, conv_3x3.weight], dim=0))
+            conv.bias.copy_(torch.cat([conv_1x1.bias, conv_3x3.bias], dim=0))
+
+        self.conv_fused = torch.nn.Sequential(
+            conv,
+            torch.nn.ELU(inplace=True)
+        )
+        self.conv_1x1 = None
+        self.conv_3x3 = None
+
+        return self
+
     def forward(self, x):
         """
             The forward function for the ExpandModule
             :param x: input data
         """
+        if self.conv_fused is not None:
+            return self.conv_fused(x)
+
         conv_1x1 = self.conv_1x1(x)
         conv_3x3 = self.conv_3x3(x)
 
@@ -137,6 +179,46 @@ class SqueezeNet(CNNBaseModel):
         # Use xavier normal initializer
         self.weights_init_xavier_normal()
 
+    def reparameterize(self):
+        """
+            Convert every ExpandModule to the single convolution version for inference.
+            Invoke this after loading the checkpoint.
+        """
+        for module in self.modules():
+            if isinstance(module, ExpandModule):
+                module.reparameterize()
+        return self
+
+    def pruning_groups(self):
+        """
+            Returns the channel groups for structured pruning.
+                1.  The squeeze convolution of every FireModule, read by both the expand convolutions.
+                2.  The 1x1 and 3x3 expand convolutions, concatenated in the input of the next FireModule ( or the
+                    final convolution ). The channels of the 3x3 convolution are after the ones of the 1x1 convolution.
+                3.  The first convolution, read by the first FireModule.
+            The final convolution is not pruned, as its output channels are the classes. Invoke this before reparameterize().
+        """
+        fires = [layer for layer in self.model if isinstance(layer, FireModule)]
+        if any(fire.model[1].conv_fused is not None for fire in fires):
+            raise ValueError('Prune the model before reparameterize()')
+
+        # Read the last FireModule
+        classifier = [layer for layer in self.model if isinstance(layer, torch.nn.Conv2d)][-1]
+
+        groups = [PruningGroup('stem', producers=[self.model[0]], consumers=[Consumer(fires[0].model[0].model[0])])]
+        for i, fire in enumerate(fires):
+            squeeze = fire.model[0].model[0]
+            expand = fire.model[1]
+            groups.append(PruningGroup(f'fire{i}.squeeze', producers=[squeeze],
+                                       consumers=[Consumer(expand.conv_1x1[0]), Consumer(expand.conv_3x3[0])]))
+
+            reader = fires[i + 1].model[0].model[0] if i + 1 < len(fires) else classifier
+            groups.append(PruningGroup(f'fire{i}.expand_1x1', producers=[expand.conv_1x1[0]], consumers=[Consumer(reader)]))
+            groups.append(PruningGroup(f'fire{i}.expand_3x3', producers=[expand.conv_3x3[0]],
+                                       consumers=[Consumer(reader, before=[expand.conv_1x1[0]])]))
+
+        return groups
+
     # @torch.cuda.amp.autocast()
     def forward(self, x):
         """
@@ -0,0 +1,37 @@
+import argparse
+from VGGNet.model import *
+from common.torch.utils.benchmark_util import *
+
+"""
+    Measures the peak memory vs the step time of a VGG training step for different activation
+    checkpointing settings. Each measurement runs in a fresh process so that the peak RSS on CPU is
+    not shared between the runs.
+
+    Usage: python -m VGGNet.benchmark --network-type E --batch-size 16 --segments 0 2 4 8
+"""
+
+
+def train_step_memory(network_type, batch_size, segments, device):
+    """
+        Build the model and measure the training step in the current process. Invoked through run_isolated().
+    """
+    torch.manual_seed(0)
+    model = VGG(network_type=network_type, num_classes=256).to(device)
+    if segments:
+        model.enable_activation_checkpointing(segments=segments)
+    return measure_train_step(model, batch_size, device)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--network-type', default='E', choices=list(VGG.vgg_configs.keys()))
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--segments', type=int, nargs='+', default=[0, 2, 4, 8], help='0 disables the checkpointing')
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    print(f'VGG {args.network_type}, batch size {args.batch_size}, device {args.device}')
+    print(f'{"Segments":<12}{"Peak Memory (MB)":>20}{"Step Time (sec)":>20}')
+    for segments in args.segments:
+        result = run_isolated(train_step_memory, args.network_type, args.batch_size, segments, args.device)
+        print(f'{segments if segments else "disabled":<12}{result["peak_memory_mb"]:>20.1f}{result["step_time_sec"]:>20.3f}')
@@ -24,9 +24,15 @@ class Executor(BaseExecutor):
 
         # initialize the model
         self.model = VGG(network_type='B', num_classes=self.NUM_CLASSES)
+        # Replace the Linear layers by the low rank factorization if configured
+        self.enable_low_rank_factorization()
+
         # Save model to tensor board
         self.save_model_to_tensor_board()
 
+        # Trade compute for memory if configured
+        self.enable_activation_checkpointing()
+
         self.enable_multi_gpu_training()
 
         # Send the model to GPU
@@ -74,7 +80,7 @@ class Executor(BaseExecutor):
         for epoch in range(start_epoch, self.EPOCHS + 1):
 
             # Invoke the pre training operations
-            self.pre_training_loop_ops()
+            self.pre_training_loop_ops(epoch)
 
             correct = 0
             total = 0
@@ -93,8 +99,8 @@ class Executor(BaseExecutor):
             # Invoke the post training operations
             eval_accuracy = self.post_training_loop_ops(epoch, train_accuracy)
 
-            # Scheduler step() function
-            self.scheduler.step(eval_accuracy / 100)
+            # Scheduler step() function, with ASYNC_VALIDATION the step is done when the validation result arrives
+            self.step_scheduler_on_validation(eval_accuracy)
             # self.scheduler.step(self.val_loss_hist.value)
 
             # Close the progress bar
@@ -76,7 +76,8 @@ class VGG(CNNBaseModel):
 
     # @torch.cuda.amp.autocast()
     def forward(self, x):
-        x = self.model(x)
+        # Uses activation checkpointing if enabled
+        x = self.forward_model(x)
         return x
 
     def print_network(self):
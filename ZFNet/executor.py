@@ -24,6 +24,9 @@ class Executor(BaseExecutor):
 
         # initialize the model
         self.model = ZFNetModel(num_classes=self.NUM_CLASSES)
+        # Replace the Linear layers by the low rank factorization if configured
+        self.enable_low_rank_factorization()
+
         # Save model to tensor board
         self.save_model_to_tensor_board()
 
@@ -73,7 +76,7 @@ class Executor(BaseExecutor):
         for epoch in range(start_epoch, self.EPOCHS + 1):
 
             # Invoke the pre training operations
-            self.pre_training_loop_ops()
+            self.pre_training_loop_ops(epoch)
 
             correct = 0
             total = 0
@@ -0,0 +1,159 @@
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+"""
+    Import time of the entry points of the repository, each one measured in a fresh interpreter.
+
+    For every module the wall clock time of "python -c 'import <module>'" is measured repeat times ( median ), along
+    with the heaviest top level packages reported by "python -X importtime" and the optional packages loaded by the
+    import. The optional packages ( apex, tensorboard, tqdm, albumentations, sklearn, pandas, tensorflow ) must be
+    imported on first use only ( see common/lazy_import.py ).
+
+    Targets: the modules of TARGETS must not load any of their forbidden packages and their import must not take more
+    than max_overhead seconds on top of the import of their framework ( torch or tensorflow ), i.e. importing
+    common.torch.utils.base_executor costs about as much as importing torch. A target which fails to import is missed.
+    With --check the script exits with 1 if a target is missed.
+
+    Usage:
+        python -m common.import_time
+        python -m common.import_time --modules common.torch.utils.base_executor ResNet.executor --repeat 10 --check
+"""
+
+OPTIONAL_PACKAGES = ['apex', 'torch.utils.tensorboard', 'tensorboard', 'tqdm', 'albumentations', 'sklearn', 'pandas', 'tensorflow']
+
+TORCH_FORBIDDEN = ['apex', 'torch.utils.tensorboard', 'tensorboard', 'tqdm', 'albumentations', 'sklearn', 'pandas', 'tensorflow']
+
+# module: ( framework, max overhead in seconds over the framework import, packages which must not be loaded )
+TARGETS = {
+    'common.torch.utils.model_registry': (None, 0.1, TORCH_FORBIDDEN + ['torch']),
+    'common.torch.utils.init_executor': (None, 0.1, TORCH_FORBIDDEN + ['torch']),
+    # --help of the launcher does not import torch, the executor is imported once selected
+    'common.torch.utils.launcher': (None, 0.1, TORCH_FORBIDDEN + ['torch']),
+    'common.torch.utils.metrics_sink': (None, 0.1, TORCH_FORBIDDEN + ['torch']),
+    'common.torch.utils.base_executor': ('torch', 0.3, TORCH_FORBIDDEN),
+    'common.torch.dataset.dataset': ('torch', 0.3, TORCH_FORBIDDEN),
+    'common.torch.utils.inference_backend': ('torch', 0.1, TORCH_FORBIDDEN),
+    'common.tf.utils.base_executor': ('tensorflow', 0.3, ['torch', 'apex', 'tqdm']),
+}
+
+ENTRY_POINTS = list(TARGETS.keys()) + ['common.torch.utils.inference_server', 'common.torch.utils.bulk_inference', 'AlexNet.executor',
+                                       'ResNet.executor', 'GoogLeNet.executor', 'AlexNet.train', 'ResNet.train', 'ResNet.test']
+
+
+def run_import(module):
+    """
+        Imports the module in a new interpreter. Returns the seconds, the -X importtime report and the optional packages
+        loaded by the import, None if the import failed.
+    """
+    # json is not imported by the probe, it would be reported as an import of the module
+    code = f'import sys\nimport {module}\nprint(",".join(m for m in {OPTIONAL_PACKAGES!r} + ["torch"] if m in sys.modules))' \
+        if module else 'pass'
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        return None, process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'failed', None
+    lines = process.stdout.strip().splitlines()
+    loaded = [m for m in lines[-1].split(',') if m] if module and lines else []
+    return seconds, process.stderr, loaded
+
+
+def heaviest_packages(report):
+    """
+        Returns the top level packages of a -X importtime report, sorted by cumulative import time ( seconds ).
+    """
+    packages = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            # Header line
+            continue
+        # The nesting level is the indentation of the name ( 2 spaces per level ), only the top level imports are counted
+        if not name.startswith('  '):
+            package = name.strip().split('.')[0]
+            packages[package] = packages.get(package, 0) + int(cumulative) / 1e6
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure(module, repeat):
+    """
+        Returns the median seconds of repeat imports, the imported packages by import time and the loaded optional packages.
+    """
+    times = []
+    report, loaded = '', []
+    for _ in range(repeat):
+        seconds, report, loaded = run_import(module)
+        if seconds is None:
+            return None, report, None
+        times.append(seconds)
+    return statistics.median(times), heaviest_packages(report), loaded
+
+
+def check_target(module, seconds, loaded, framework_seconds, interpreter_seconds):
+    """
+        Returns the list of the missed targets of the module.
+    """
+    framework, max_overhead, forbidden = TARGETS[module]
+    errors = [f'loads {package}' for package in forbidden if package in loaded]
+    baseline = framework_seconds.get(framework) if framework else interpreter_seconds
+    if baseline is not None and seconds - baseline > max_overhead:
+        errors.append(f'{seconds - baseline:.2f} sec over {framework or "python"} > {max_overhead} sec')
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=ENTRY_POINTS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help='exit with 1 if a module misses its target')
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    interpreter_seconds, startup, _ = measure(None, args.repeat)
+    # Packages imported by the interpreter startup ( site, encodings, ... ) are not reported
+    startup = {name for name, _ in startup}
+    framework_seconds = {}
+    for framework in ['torch', 'tensorflow']:
+        seconds, _, _ = measure(framework, args.repeat)
+        framework_seconds[framework] = seconds
+    print(f'python: {interpreter_seconds:.3f} sec, ' + ', '.join(f'import {name}: ' + (f'{seconds:.3f} sec' if seconds is not None else 'not installed')
+                                                                 for name, seconds in framework_seconds.items()))
+
+    report = {'python': interpreter_seconds, 'frameworks': framework_seconds, 'modules': {}}
+    failed = False
+    print(f'\n{"Module":<40}{"Seconds":>9}  {"Optional packages loaded":<32}{"Heaviest imports"}')
+    for module in args.modules:
+        seconds, heaviest, loaded = measure(module, args.repeat)
+        if seconds is None:
+            print(f'{module:<40}{"-":>9}  import failed: {heaviest}')
+            report['modules'][module] = {'error': heaviest}
+            # A target which can not be imported ( e.g. a missing optional package imported eagerly ) is missed
+            if module in TARGETS:
+                report['modules'][module]['target_errors'] = [f'import failed: {heaviest}']
+                failed = True
+            continue
+
+        optional = [package for package in loaded if package != 'torch']
+        heaviest = [(name, s) for name, s in heaviest if name not in startup][:5]
+        print(f'{module:<40}{seconds:>9.3f}  {", ".join(optional) or "-":<32}{", ".join(f"{name} {s:.2f}" for name, s in heaviest)}')
+        report['modules'][module] = {'seconds': seconds, 'loaded': loaded, 'heaviest': heaviest}
+
+        if module in TARGETS:
+            errors = check_target(module, seconds, loaded, framework_seconds, interpreter_seconds)
+            report['modules'][module]['target_errors'] = errors
+            if errors:
+                failed = True
+                print(f'{"":<40}{"":>9}  target missed: {"; ".join(errors)}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.check and failed:
+        sys.exit(1)
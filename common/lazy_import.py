@@ -0,0 +1,73 @@
+import importlib
+import importlib.util
+
+"""
+    Lazy imports of the optional and heavy packages ( apex, tensorboard, tqdm, albumentations, sklearn, tensorflow ).
+
+    lazy_import() returns a proxy which imports the module ( or the attribute of the module ) on first use, hence a
+    module can keep its top level "names" while importing it costs nothing:
+
+        amp = lazy_import('apex.amp', install='https://github.com/NVIDIA/apex')
+        tqdm = lazy_import('tqdm', 'tqdm')
+        SummaryWriter = lazy_import('torch.utils.tensorboard', 'SummaryWriter', install='pip install tensorboard')
+
+        amp.initialize(...)             # apex is imported here
+        pbar = tqdm(total=10)           # tqdm is imported here
+
+    A missing package only fails when it is used, with an ImportError naming the package and how to install it.
+    is_available() checks whether the package is installed without importing it.
+
+    Measure the startup of the entry points with: python -m common.import_time
+"""
+
+
+class LazyImport:
+    def __init__(self, module, attribute=None, install=None):
+        """
+            :param module: module name, e.g. apex.amp
+            :param attribute: attribute of the module returned instead of the module, e.g. SummaryWriter
+            :param install: install hint of the error message, the pip package by default
+        """
+        # Set through __dict__, __setattr__ is not overridden but __getattr__ must not see missing fields
+        self.__dict__.update(_module=module, _attribute=attribute, _install=install, _target=None)
+
+    def _load(self):
+        if self._target is None:
+            try:
+                target = importlib.import_module(self._module)
+            except ImportError as e:
+                install = self._install or f"pip install {self._module.split('.')[0]}"
+                raise ImportError(f"{self._module} is required for this feature but could not be imported ( {e} ). Install it with: {install}") from e
+            self.__dict__['_target'] = getattr(target, self._attribute) if self._attribute else target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = f'{self._module}.{self._attribute}' if self._attribute else self._module
+        return f"<lazy {'loaded' if self._target is not None else 'not loaded'} {name}>"
+
+
+def lazy_import(module, attribute=None, install=None):
+    return LazyImport(module, attribute, install)
+
+
+def is_available(module):
+    """
+        Returns True if the top level package of the module is installed, without importing it. Accepts a LazyImport.
+    """
+    name = module._module if isinstance(module, LazyImport) else module
+    try:
+        # find_spec() of a sub module would import the parent package
+        return importlib.util.find_spec(name.split('.')[0]) is not None
+    except (ImportError, ValueError):
+        # The parent package is missing
+        return False
+
+
+def is_loaded(module):
+    return isinstance(module, LazyImport) and module._target is not None
@@ -172,7 +172,8 @@ def define_train_valid_split():
     """
 
     # Find all the directories
-    dirs = glob(f'{INPUT_PATH}/*')
+    # Sort the paths so that the class ids and the split do not depend on the file system order
+    dirs = sorted(glob(f'{INPUT_PATH}/*'))
     categories = {}
 
     # Create a dict with id and class label names.
@@ -180,7 +181,7 @@ def define_train_valid_split():
         categories[read_class_labels(dir_names)] = len(categories)
 
     # Find all the jpg files
-    files = glob(f'{INPUT_PATH}/**/**.jpg')
+    files = sorted(glob(f'{INPUT_PATH}/**/**.jpg'))
     paths = []
     labels = []
 
@@ -195,7 +196,7 @@ def define_train_valid_split():
     pbar.close()
 
     # Use train_test_split function to create train/validation split.
-    X_train, X_test, y_train, y_test = train_test_split(paths, labels, test_size=VALIDATION_SPLIT, stratify=labels)
+    X_train, X_test, y_train, y_test = train_test_split(paths, labels, test_size=VALIDATION_SPLIT, stratify=labels, random_state=RANDOM_SEED)
 
     # switch the key and value of the categories dict
     categories = {categories[k]: k for k in categories}
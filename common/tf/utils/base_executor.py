@@ -1,7 +1,7 @@
-import torch
 from common.tf.utils.training_util import *
-from tqdm import tqdm
-from apex import amp
+from common.lazy_import import lazy_import
+# torch and apex are not used by the TF executor, tqdm is imported on first use
+tqdm = lazy_import('tqdm', 'tqdm')
 from common.tf.utils.init_executor import *
 import numpy as np
 import tensorflow as tf
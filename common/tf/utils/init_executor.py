@@ -2,7 +2,10 @@ import os
 import logging
 import logging.handlers
 from datetime import datetime
-from torch.utils.tensorboard import SummaryWriter
+from common.lazy_import import lazy_import
+
+# Imported when the first run is created, importing the executor does not load tensorboard
+SummaryWriter = lazy_import('torch.utils.tensorboard', 'SummaryWriter', install='pip install tensorboard')
 
 
 class InitExecutor(object):
@@ -1,10 +1,66 @@
 import numpy as np
 import cv2
 import torch
-import pandas as pd
-from sklearn.utils import shuffle
-import albumentations as A
 import json
+from common.lazy_import import lazy_import
+
+# sklearn is only needed when a dataset is created
+shuffle = lazy_import('sklearn.utils', 'shuffle', install='pip install scikit-learn')
+
+
+def decode_image(data):
+    """
+        Decode an encoded image ( e.g. the bytes of a JPEG file ) to a BGR numpy array, same as cv2.imread().
+    """
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def preprocess_image(image, transform, rgb_means=None):
+    """
+        Convert a BGR image read by open cv to the normalized tensor used by the models. Shared by the
+        ClassificationDataset and the inference scripts, hence the served images are processed exactly like
+        the test images.
+
+        :param image: BGR numpy array
+        :param transform: albumentations transformation, e.g. the test_transformation of the model
+        :param rgb_means: dict with the R, G, B means, None to divide by 255.0
+    """
+    # Convert the image from BGR to RGB
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    if rgb_means:
+        # Split the image to separate channel.
+        # Since we have already converted the image from BGR to RGB
+        # we will get the channel as RGB here.
+        (R, G, B) = cv2.split(image.astype('float32'))
+
+        # Subtract the mean
+        R -= rgb_means['R']
+        G -= rgb_means['G']
+        B -= rgb_means['B']
+
+        # Merge the channels
+        image = cv2.merge([R, G, B])
+
+    if transform:
+        # Create the dict needed for transformation
+        transform_input = {
+            'image': image
+        }
+        # Transform the image
+        transform_output = transform(**transform_input)
+
+        # Get the transformed image
+        image = transform_output['image']
+
+    # Convert the image to PyTorch Tensor
+    image = torch.as_tensor(image, dtype=torch.float32)
+
+    if not rgb_means:
+        # Basic Normalization by dividing 255.0
+        image /= 255.0
+
+    return image
 
 
 class ClassificationDataset(torch.utils.data.Dataset):
@@ -36,39 +92,6 @@ class ClassificationDataset(torch.utils.data.Dataset):
         # Read the image from disk using open cv
         image = cv2.imread(f'{self.image_dir}/{image_id}', cv2.IMREAD_COLOR)
 
-        # Convert the image from BGR to RGB
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        if self.rgb_means:
-            # Split the image to separate channel.
-            # Since we have already converted the image from BGR to RGB
-            # we will get the channel as RGB here.
-            (R, G, B) = cv2.split(image.astype('float32'))
-
-            # Subtract the mean
-            R -= self.rgb_means['R']
-            G -= self.rgb_means['G']
-            B -= self.rgb_means['B']
-
-            # Merge the channels
-            image = cv2.merge([R, G, B])
-
-        if self.transform:
-            # Create the dict needed for transformation
-            transform_input = {
-                'image': image
-            }
-            # Transform the image
-            transform_output = self.transform(**transform_input)
-
-            # Get the transformed image
-            image = transform_output['image']
-
-        # Convert the image to PyTorch Tensor
-        image = torch.as_tensor(image, dtype=torch.float32)
-
-        if not self.rgb_means:
-            # Basic Normalization by dividing 255.0
-            image /= 255.0
+        image = preprocess_image(image, self.transform, self.rgb_means)
 
         return image, image_class, image_id
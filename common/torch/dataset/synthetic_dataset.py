@@ -0,0 +1,160 @@
+import os
+import json
+import argparse
+import importlib
+import numpy as np
+import cv2
+import pandas as pd
+
+"""
+    Creates small synthetic datasets on disk, in the same layout produced by the image_dir_preprocessor.py
+    ( <type>/<image>.jpg, <type>.csv and rgb_<type>.json ), so that the ClassificationDataset and the
+    DataLoader can be benchmarked without downloading the Caltech dataset.
+
+    It can also create a raw dataset with the Caltech 256 directory structure ( <n>.<label>/*.jpg ) and run both
+    the torch ( csv ) and the tf ( tfrecord ) image_dir_preprocessor.py on it.
+
+    The images are generated from a seeded random number generator, hence the same arguments always
+    produce the same dataset.
+
+    Usage: python -m common.torch.dataset.synthetic_dataset --output-dir /tmp/caltech --num-classes 16 --images-per-class 20 60
+"""
+
+
+def random_image(rng, height, width):
+    """
+        Generate a random RGB image. A low resolution random image is upscaled and some noise is added,
+        so that the JPEG compression ratio ( and the decode cost ) is closer to a natural image than pure noise.
+
+        :param rng: numpy RandomState
+        :param height: image height
+        :param width: image width
+    """
+    base = rng.randint(0, 256, size=(max(height // 16, 2), max(width // 16, 2), 3)).astype(np.uint8)
+    image = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.randint(-12, 13, size=image.shape)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def create_processed_dataset(output_dir, type='train', num_images=256, num_classes=8, image_size=(256, 256), seed=0, jpeg_quality=90):
+    """
+        Create the processed dataset layout used by the train.py/test.py scripts.
+
+        :param output_dir: root folder ( INPUT_DIR in properties.py )
+        :param type: train/val
+        :param num_images: number of images
+        :param num_classes: number of classes, the images are assigned round robin
+        :param image_size: (height, width) of the images
+        :param seed: random seed
+        :param jpeg_quality: JPEG compression quality
+        :return: the path of the csv file
+    """
+    rng = np.random.RandomState(seed)
+    image_dir = f'{output_dir}/{type}'
+    os.makedirs(image_dir, exist_ok=True)
+
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+
+    dataset = []
+    (R, G, B) = ([], [], [])
+    for i in range(num_images):
+        image = random_image(rng, image_size[0], image_size[1])
+        name = f'{i:08d}.jpg'
+        cv2.imwrite(f'{image_dir}/{name}', image, encode_param)
+
+        # opencv uses BGR format
+        (b, g, r) = cv2.mean(image)[:3]
+        R.append(r)
+        G.append(g)
+        B.append(b)
+
+        dataset.append({'image': name, 'class': i % num_classes})
+
+    df = pd.DataFrame(dataset, columns=['image', 'class'])
+    df.to_csv(f'{output_dir}/{type}.csv', index=False)
+
+    with open(f'{output_dir}/rgb_{type}.json', 'w+') as f:
+        f.write(json.dumps({"R": np.mean(R), "G": np.mean(G), "B": np.mean(B)}))
+
+    return f'{output_dir}/{type}.csv'
+
+
+def create_caltech_dataset(output_dir, num_classes=256, images_per_class=(80, 120), min_size=(150, 150), max_size=(500, 500), seed=0,
+                           jpeg_quality=90):
+    """
+        Create a raw dataset with the same directory structure as Caltech 256 ( <n>.<label>/<n>_<i>.jpg ).
+
+        :param output_dir: root folder ( INPUT_PATH in the preprocessing properties.py )
+        :param num_classes: number of class folders
+        :param images_per_class: (min, max) number of images per class, or an int for a fixed number
+        :param min_size: minimum (height, width) of the images
+        :param max_size: maximum (height, width) of the images, the size is uniformly distributed in between
+        :param seed: random seed
+        :param jpeg_quality: JPEG compression quality
+        :return: number of images created
+    """
+    rng = np.random.RandomState(seed)
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+
+    if isinstance(images_per_class, int):
+        images_per_class = (images_per_class, images_per_class)
+
+    total = 0
+    for n in range(1, num_classes + 1):
+        class_dir = f'{output_dir}/{n:03d}.class{n:03d}'
+        os.makedirs(class_dir, exist_ok=True)
+
+        for i in range(1, rng.randint(images_per_class[0], images_per_class[1] + 1) + 1):
+            height = rng.randint(min_size[0], max_size[0] + 1)
+            width = rng.randint(min_size[1], max_size[1] + 1)
+            cv2.imwrite(f'{class_dir}/{n:03d}_{i:04d}.jpg', random_image(rng, height, width), encode_param)
+            total += 1
+
+    return total
+
+
+def run_preprocessor(framework, input_path, output_path, seed=0, **properties):
+    """
+        Run the image_dir_preprocessor.py of the given framework on a raw dataset. The preprocessor reads
+        its configuration from module level properties, hence they are overridden on the imported module.
+
+        :param framework: torch ( creates the csv files and images ) or tf ( creates the tfrecord files )
+        :param input_path: root folder of the raw dataset
+        :param output_path: output folder
+        :param seed: random seed for the train/validation split
+        :param properties: override any other property, e.g. OUTPUT_DIM=(128, 128)
+    """
+    preprocessor = importlib.import_module(f'common.{framework}.preprocessing.image_dir_preprocessor')
+    preprocessor.INPUT_PATH = input_path
+    preprocessor.OUTPUT_PATH = output_path
+    preprocessor.RANDOM_SEED = seed
+    for key, value in properties.items():
+        setattr(preprocessor, key, value)
+
+    os.makedirs(output_path, exist_ok=True)
+    preprocessor.process()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--images-per-class', type=int, nargs=2, default=[80, 120], metavar=('MIN', 'MAX'))
+    parser.add_argument('--min-size', type=int, nargs=2, default=[150, 150], metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--max-size', type=int, nargs=2, default=[500, 500], metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--preprocess', nargs='*', default=['torch', 'tf'], choices=['torch', 'tf'])
+    args = parser.parse_args()
+
+    raw_dir = f'{args.output_dir}/256_ObjectCategories'
+    count = create_caltech_dataset(raw_dir, num_classes=args.num_classes, images_per_class=tuple(args.images_per_class),
+                                   min_size=tuple(args.min_size), max_size=tuple(args.max_size), seed=args.seed)
+    print(f'Created {count} images in {raw_dir}')
+
+    outputs = {'torch': f'{args.output_dir}/processed', 'tf': f'{args.output_dir}/processed_tfrecords'}
+    for framework in args.preprocess:
+        try:
+            run_preprocessor(framework, raw_dir, outputs[framework], seed=args.seed)
+            print(f'Preprocessed with {framework} to {outputs[framework]}')
+        except ImportError as e:
+            print(f'Skipping the {framework} preprocessor: {e}')
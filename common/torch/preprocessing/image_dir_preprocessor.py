@@ -7,6 +7,7 @@ from common.torch.preprocessing.properties import *
 import pandas as pd
 from sklearn.model_selection import train_test_split
 import uuid
+import random
 import os
 import shutil
 import json
@@ -107,6 +108,9 @@ def create_dataset(X, y, type):
     # Placeholder for RGB Mean Calculation
     (R, G, B) = ([], [], [])
 
+    # Use reproducible image names when the random seed is set
+    rng = random.Random(f'{RANDOM_SEED}-{type}') if RANDOM_SEED is not None else None
+
     # Loop through the file paths.
     for i in range(len(X)):
         # Read the image using opencv library.
@@ -124,7 +128,7 @@ def create_dataset(X, y, type):
             B.append(b)
 
         # Generate unique name for each image.
-        name = f'{uuid.uuid4()}.jpg'
+        name = f'{uuid.UUID(int=rng.getrandbits(128), version=4) if rng else uuid.uuid4()}.jpg'
 
         # Save the processed image to a the output folder
         cv2.imwrite(f'{OUTPUT_PATH}/{type}/{name}', image)
@@ -163,7 +167,8 @@ def define_train_valid_split():
     """
 
     # Find all the directories
-    dirs = glob(f'{INPUT_PATH}/*')
+    # Sort the paths so that the class ids and the split do not depend on the file system order
+    dirs = sorted(glob(f'{INPUT_PATH}/*'))
     categories = {}
 
     # Create a dict with id and class label names.
@@ -171,7 +176,7 @@ def define_train_valid_split():
         categories[read_class_labels(dir_names)] = len(categories)
 
     # Find all the jpg files
-    files = glob(f'{INPUT_PATH}/**/**.jpg')
+    files = sorted(glob(f'{INPUT_PATH}/**/**.jpg'))
     paths = []
     labels = []
 
@@ -186,7 +191,7 @@ def define_train_valid_split():
     pbar.close()
 
     # Use train_test_split function to create train/validation split.
-    X_train, X_test, y_train, y_test = train_test_split(paths, labels, test_size=VALIDATION_SPLIT, stratify=labels)
+    X_train, X_test, y_train, y_test = train_test_split(paths, labels, test_size=VALIDATION_SPLIT, stratify=labels, random_state=RANDOM_SEED)
 
     # switch the key and value of the categories dict
     categories = {categories[k]: k for k in categories}
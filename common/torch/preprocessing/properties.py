@@ -4,6 +4,8 @@ INPUT_PATH = '/media/4TB/datasets/caltech/256_ObjectCategories'
 OUTPUT_PATH = '/media/4TB/datasets/caltech/processed_resize'
 # Validation split. Range - [ 0.0 - 1.0 ]
 VALIDATION_SPLIT = 0.2
+# Set to an integer for a reproducible train/validation split ( and image names ). None means random.
+RANDOM_SEED = None
 # Output image dimension. ( height,width )
 OUTPUT_DIM = (256, 256)
 # If RGB mean is needed, set this to True
@@ -0,0 +1,176 @@
+import copy
+import time
+import queue
+import torch
+from torch.utils.data import DataLoader, Subset
+from common.torch.utils.training_util import AverageLoss
+
+"""
+    Validation in a background process, so that the training of the next epoch does not wait for the validation pass.
+
+    After an epoch, AsyncValidator.submit() copies the weights to the CPU ( a snapshot, the training keeps updating
+    the model on the GPU ) and sends the snapshot to the evaluator process. The evaluator runs the validation set on
+    ASYNC_VALIDATION_DEVICE ( the CPU by default, hence it does not use the GPU memory of the training ) and sends back
+    the epoch, the accuracy and the loss. BaseExecutor.receive_validation_results() polls the results at the end of
+    every epoch, writes them to tensor board ( MetricsSink ) and steps ReduceLROnPlateau, i.e. the scheduler decision
+    is made with a delay of about one epoch.
+
+    If the evaluator process dies ( e.g. killed by the OOM killer ), the epochs it did not return are reported as
+    errors instead of waiting for them forever.
+
+    At most one snapshot is waiting while another one is evaluated. If the evaluator is slower than the training, the
+    training waits, as it did with the synchronous validation.
+
+    validation_subset() creates the quick validation set ( VALIDATION_SUBSET ), a fixed random subset of the validation
+    images, used by both the synchronous and the asynchronous validation.
+"""
+
+
+def validation_subset(dataset, subset, seed=0):
+    """
+        Returns a fixed random subset of the dataset, the same images are used for every epoch.
+
+        :param subset: fraction ( < 1 ) or number of images, None for the whole dataset
+    """
+    if not subset:
+        return dataset
+    size = int(len(dataset) * subset) if subset < 1 else int(subset)
+    generator = torch.Generator().manual_seed(seed)
+    indices = torch.randperm(len(dataset), generator=generator)[:max(1, min(size, len(dataset)))]
+    return Subset(dataset, indices.tolist())
+
+
+def validate(model, data_loader, criterion, device):
+    """
+        Returns the accuracy ( in percentage ) and the average loss of the model on the data loader.
+    """
+    model.to(device).eval()
+    loss_hist = AverageLoss()
+    correct = 0
+    total = 0
+    with torch.no_grad():
+        for images, labels, _ in data_loader:
+            images = images.to(device)
+            labels = labels.to(device)
+
+            predictions = model(images)
+            loss_hist.send(criterion(predictions, labels.squeeze()).item())
+
+            _, predicted = torch.max(predictions, dim=1)
+            total += labels.size(0)
+            correct += (predicted == labels.view(-1)).sum().item()
+    return 100.0 * correct / total, loss_hist.value
+
+
+def evaluator_process(requests, results, dataset, batch_size, num_workers, criterion, device, threads):
+    """
+        Main loop of the evaluator process. Validates the snapshots until it receives None.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    device = torch.device(device)
+    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, drop_last=False,
+                             persistent_workers=num_workers > 0)
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        epoch, model = request
+        start = time.perf_counter()
+        try:
+            accuracy, loss = validate(model, data_loader, criterion, device)
+            results.put((epoch, accuracy, loss, time.perf_counter() - start, None))
+        except Exception as e:
+            results.put((epoch, None, None, time.perf_counter() - start, repr(e)))
+
+
+class AsyncValidator:
+    def __init__(self, dataset, batch_size, criterion, device='cpu', num_workers=2, threads=None):
+        """
+            :param dataset: validation dataset ( or the quick validation subset )
+            :param batch_size: batch size of the validation
+            :param criterion: loss function of the executor
+            :param device: device of the evaluator
+            :param num_workers: DataLoader workers of the evaluator
+            :param threads: torch threads of the evaluator, None for the torch default
+        """
+        context = torch.multiprocessing.get_context('spawn')
+        self.requests = context.Queue(maxsize=1)
+        self.results = context.Queue()
+        # Not a daemon process, the evaluator starts its own DataLoader workers
+        self.process = context.Process(target=evaluator_process,
+                                       args=(self.requests, self.results, dataset, batch_size, num_workers, criterion, str(device), threads))
+        self.process.start()
+        self.template = None
+        self.template_shapes = None
+        # Epochs submitted and not received yet
+        self.submitted = []
+        # Epochs which could not be submitted as the evaluator is not running
+        self.lost = []
+
+    def snapshot(self, model):
+        """
+            Returns a CPU copy of the model. The model structure is copied once ( and again if it changes, e.g. after
+            pruning ), then only the weights are copied.
+        """
+        model = model.module if isinstance(model, torch.nn.DataParallel) else model
+        state_dict = {key: value.detach().to('cpu', copy=True) for key, value in model.state_dict().items()}
+
+        shapes = {key: tuple(value.shape) for key, value in state_dict.items()}
+        if self.template is None or shapes != self.template_shapes:
+            self.template = copy.deepcopy(model).cpu()
+            self.template_shapes = shapes
+
+        snapshot = copy.deepcopy(self.template)
+        snapshot.load_state_dict(state_dict)
+        return snapshot
+
+    def submit(self, epoch, model, timeout=1.0):
+        snapshot = self.snapshot(model)
+        # The queue holds one snapshot, a dead evaluator would block the put forever
+        while self.process.is_alive():
+            try:
+                self.requests.put((epoch, snapshot), timeout=timeout)
+                self.submitted.append(epoch)
+                return
+            except queue.Full:
+                continue
+        self.lost.append(epoch)
+
+    def error(self, epoch):
+        return epoch, None, None, 0.0, f'the evaluator process exited with code {self.process.exitcode}'
+
+    def poll(self, block=False, timeout=1.0):
+        """
+            Returns the results received so far ( epoch, accuracy, loss, seconds, error ). With block, waits for all
+            the submitted snapshots. The epochs which will not be received as the evaluator process died are returned
+            with an error.
+
+            :param timeout: seconds between two checks of the evaluator process while waiting
+        """
+        received = [self.error(epoch) for epoch in self.lost]
+        self.lost = []
+        while self.submitted:
+            try:
+                result = self.results.get(block=block, timeout=timeout if block else None)
+            except queue.Empty:
+                if self.process.is_alive():
+                    if block:
+                        continue
+                    break
+                # The results sent before the process died are still in the queue
+                try:
+                    result = self.results.get(timeout=timeout)
+                except queue.Empty:
+                    received.extend(self.error(epoch) for epoch in self.submitted)
+                    self.submitted = []
+                    break
+            self.submitted.remove(result[0])
+            received.append(result)
+        return received
+
+    def close(self):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join()
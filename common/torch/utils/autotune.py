@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import platform
+import argparse
+import tempfile
+import torch
+from torch.utils.data import DataLoader
+from common.torch.utils.benchmark_util import measure_train_step, run_isolated
+from common.torch.utils.model_registry import MODELS, create_model, get_image_size, get_train_transformation
+
+"""
+    Tune the training batch size and the DataLoader settings for a model on the current machine.
+
+        1.  Batch size : the largest batch size ( multiple of 8 ) whose training step fits in the memory budget, i.e. a
+                         fraction of the GPU memory or of the RAM. The model is built as the executor builds it, using
+                         the memory related settings of the properties.py of the executor ( see executor_options() ):
+                         low rank factorization, activation checkpointing and FP16_MIXED ( torch.cuda.amp.autocast in
+                         place of apex O1 ). Every trial runs in a fresh process ( run_isolated() ),
+                         the batch size is doubled and then refined with a binary search. The peak memory grows about
+                         linearly with the batch size, hence batch sizes predicted to exceed the budget are not run, a
+                         CPU run would be killed by the OOM killer otherwise.
+        2.  DataLoader : num_workers, prefetch_factor and pin_memory. The steady state images/sec of the DataLoader alone
+                         ( the first batches are not timed ) is measured for each combination. The training runs at the
+                         speed of the slower of the DataLoader and the model, hence the fewest workers whose throughput
+                         covers the training step are selected, more workers only cost memory.
+
+    The results are saved in a json file per machine fingerprint ( host, CPU, memory, GPU, torch version ) and model,
+    load_tuned_settings() returns them to the train.py scripts, with the hard coded values as defaults.
+
+    Usage:
+        python -m common.torch.utils.autotune --model resnet_38 --data-dir /media/4TB/datasets/caltech/processed
+        python -m common.torch.utils.autotune --model resnet_38 --show
+"""
+
+# The tuned values of all the machines and models
+DEFAULT_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'deep_learning_autotune.json')
+
+
+def total_memory_mb(device):
+    """
+        Returns the total memory of the GPU or the physical memory of the machine in MB.
+    """
+    if torch.device(device).type == 'cuda':
+        return torch.cuda.get_device_properties(device).total_memory / 1024.0 ** 2
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024.0 ** 2
+
+
+def machine_fingerprint():
+    """
+        Returns a short hash identifying the machine, the tuned values are only reused on the same hardware and torch.
+    """
+    info = {
+        'hostname': socket.gethostname(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'memory_mb': int(total_memory_mb('cpu')),
+        'torch': torch.__version__,
+        'gpus': [torch.cuda.get_device_name(i) for i in range(torch.cuda.device_count())] if torch.cuda.is_available() else []
+    }
+    return hashlib.sha1(json.dumps(info, sort_keys=True).encode()).hexdigest()[:16], info
+
+
+def settings_key(name, device, image_size):
+    return f'{name}:{torch.device(device).type}:{image_size}'
+
+
+def load_results(file_name=DEFAULT_FILE):
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name) as file:
+        return json.load(file)
+
+
+def save_settings(name, device, image_size, settings, file_name=DEFAULT_FILE):
+    """
+        Save the tuned settings of the model under the fingerprint of the current machine. The file is replaced
+        atomically, hence an interrupted run does not corrupt the values of the other models.
+    """
+    fingerprint, info = machine_fingerprint()
+    results = load_results(file_name)
+    machine = results.setdefault(fingerprint, {'machine': info, 'settings': {}})
+    machine['settings'][settings_key(name, device, image_size)] = settings
+
+    os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+    temp_file = f'{file_name}.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump(results, file, indent=2)
+    os.replace(temp_file, file_name)
+
+
+def load_tuned_settings(name, device=None, image_size=None, file_name=DEFAULT_FILE, **defaults):
+    """
+        Returns the DataLoader arguments ( batch_size, num_workers, pin_memory and prefetch_factor ) tuned for the model on
+        this machine. The defaults are returned when the model was not tuned.
+
+        :param name: name in model_registry.py
+        :param device: training device, cuda if available by default
+        :param image_size: training resolution, the one of the model by default
+        :param defaults: values used when there is no tuned value, e.g. batch_size=128, num_workers=16, pin_memory=True
+    """
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    image_size = image_size or get_image_size(name)
+    fingerprint, _ = machine_fingerprint()
+    tuned = load_results(file_name).get(fingerprint, {}).get('settings', {}).get(settings_key(name, device, image_size))
+
+    settings = dict(defaults)
+    if tuned:
+        print(f'Using the tuned DataLoader settings of {name}: {tuned["data_loader"]}')
+        settings.update(tuned['data_loader'])
+
+    # prefetch_factor can only be set with worker processes
+    if settings.get('num_workers', 0) == 0:
+        settings.pop('prefetch_factor', None)
+    return settings
+
+
+# Settings of the executors changing the memory of the training step
+EXECUTOR_OPTIONS = ['LOW_RANK_RANK', 'LOW_RANK_ENERGY', 'LOW_RANK_LAYERS', 'ACTIVATION_CHECKPOINT_SEGMENTS', 'ACTIVATION_CHECKPOINT_EVERY',
+                    'FP16_MIXED']
+
+
+def executor_options(name):
+    """
+        Returns the memory related settings of the properties.py of the first executor training the model ( see
+        executor_registry.py ), empty for a model without executor.
+    """
+    from common.torch.utils.executor_registry import EXECUTORS, get_default_config
+
+    for entry, values in EXECUTORS.items():
+        if values['model'] == name:
+            config = get_default_config(entry)
+            return {key: config[key] for key in EXECUTOR_OPTIONS if config.get(key)}
+    return {}
+
+
+def train_step_memory(name, batch_size, device, image_size, options=None):
+    """
+        Build the model as the executor does and measure the training step in the current process. Invoked through
+        run_isolated(). The low rank factorization uses the random weights, with LOW_RANK_ENERGY the ranks may differ
+        from the ones of the trained weights.
+
+        :param options: memory related settings of the executor, see executor_options()
+    """
+    options = options or {}
+    torch.manual_seed(0)
+    model = create_model(name)
+    # Same order as the executors: factorized right after the model is created, then checkpointed
+    if options.get('LOW_RANK_RANK') or options.get('LOW_RANK_ENERGY'):
+        from common.torch.utils.low_rank import factorize_model
+
+        factorize_model(model, rank=options.get('LOW_RANK_RANK'), energy=options.get('LOW_RANK_ENERGY'), layers=options.get('LOW_RANK_LAYERS'))
+    if options.get('ACTIVATION_CHECKPOINT_SEGMENTS') or options.get('ACTIVATION_CHECKPOINT_EVERY'):
+        model.enable_activation_checkpointing(segments=options.get('ACTIVATION_CHECKPOINT_SEGMENTS'), every=options.get('ACTIVATION_CHECKPOINT_EVERY'))
+    model = model.to(device)
+    try:
+        return measure_train_step(model, batch_size, device, steps=2, image_size=image_size, mixed_precision=bool(options.get('FP16_MIXED')))
+    except RuntimeError as e:
+        if 'out of memory' not in str(e):
+            raise
+        return None
+
+
+def find_max_batch_size(name, device, image_size, memory_budget_mb, start=8, max_batch_size=1024, multiple=8, options=None):
+    """
+        Returns the largest batch size fitting the memory budget and the measurements of all the trials.
+
+        :param name: name in model_registry.py
+        :param memory_budget_mb: maximum peak memory of the training step
+        :param start: first batch size tried
+        :param max_batch_size: upper limit of the search
+        :param multiple: the batch size is a multiple of this value
+        :param options: memory related settings of the executor, see executor_options()
+    """
+    trials = {}
+
+    def fits(batch_size):
+        # Predict the memory from the two largest successful trials, the memory grows about linearly with the batch size
+        succeeded = sorted((b, r['peak_memory_mb']) for b, r in trials.items() if r and r['peak_memory_mb'] <= memory_budget_mb)
+        if len(succeeded) >= 2:
+            (b1, m1), (b2, m2) = succeeded[-2:]
+            predicted = m2 + (m2 - m1) / (b2 - b1) * (batch_size - b2)
+            if predicted > memory_budget_mb:
+                print(f'\tbatch size {batch_size}: predicted {predicted:.0f} MB > budget, skipped')
+                return False
+
+        if batch_size not in trials:
+            trials[batch_size] = run_isolated(train_step_memory, name, batch_size, device, image_size, options)
+        result = trials[batch_size]
+        if result is None:
+            print(f'\tbatch size {batch_size}: out of memory')
+            return False
+        print(f'\tbatch size {batch_size}: {result["peak_memory_mb"]:.0f} MB, {result["step_time_sec"]:.3f} sec per step')
+        return result['peak_memory_mb'] <= memory_budget_mb
+
+    # Double the batch size until it does not fit
+    good, bad = None, None
+    batch_size = start
+    while batch_size <= max_batch_size:
+        if fits(batch_size):
+            good = batch_size
+            batch_size *= 2
+        else:
+            bad = batch_size
+            break
+
+    if good is None:
+        return None, trials
+
+    # Binary search between the last batch size fitting and the first one not fitting
+    if bad is not None:
+        while bad - good > multiple:
+            middle = (good + bad) // 2 // multiple * multiple
+            if middle in (good, bad):
+                break
+            if fits(middle):
+                good = middle
+            else:
+                bad = middle
+
+    return good, trials
+
+
+def loader_throughput(dataset, batch_size, num_workers, prefetch_factor, pin_memory, batches=20, warmup=5):
+    """
+        Returns the steady state images/sec of a DataLoader. The first batches include the start of the workers
+        and are not timed.
+    """
+    arguments = {'prefetch_factor': prefetch_factor, 'persistent_workers': True} if num_workers > 0 else {}
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers, pin_memory=pin_memory, drop_last=True, **arguments)
+
+    # A small dataset is read several times to get enough batches
+    i, images, start = 0, 0, None
+    while i < warmup + batches:
+        for batch, _, _ in loader:
+            if i == warmup:
+                start = time.perf_counter()
+            if i >= warmup:
+                images += batch.size(0)
+            i += 1
+            if i >= warmup + batches:
+                break
+    elapsed = time.perf_counter() - start
+    del loader
+    return images / elapsed
+
+
+def tune_data_loader(dataset, batch_size, device, target_images_per_sec=None, workers=None, prefetch_factors=(2, 4), batches=20):
+    """
+        Measure all the combinations of the DataLoader settings and select the fewest workers reaching the target
+        throughput ( the training step speed ), or the fastest settings if none reaches it.
+
+        :param target_images_per_sec: images/sec of the training step, None to select the fastest settings
+        :param workers: list of num_workers to try, 0 to the number of CPUs by default
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = workers or sorted({0, 1, 2, 4, 8, 16, cpu_count} & set(range(cpu_count + 1)))
+    pin_memory_options = [True, False] if torch.device(device).type == 'cuda' else [False]
+
+    measurements = []
+    for num_workers in workers:
+        for prefetch_factor in (prefetch_factors if num_workers > 0 else [None]):
+            for pin_memory in pin_memory_options:
+                images_per_sec = loader_throughput(dataset, batch_size, num_workers, prefetch_factor, pin_memory, batches=batches)
+                print(f'\tnum_workers={num_workers}, prefetch_factor={prefetch_factor}, pin_memory={pin_memory}: {images_per_sec:.1f} images/sec')
+                measurements.append({'num_workers': num_workers, 'prefetch_factor': prefetch_factor, 'pin_memory': pin_memory,
+                                     'images_per_sec': images_per_sec})
+
+    best = max(measurements, key=lambda m: m['images_per_sec'])
+    if target_images_per_sec:
+        # 10% margin, the workers also compete with the training for the CPU
+        enough = [m for m in measurements if m['images_per_sec'] >= 1.1 * target_images_per_sec]
+        if enough:
+            best = min(enough, key=lambda m: (m['num_workers'], -m['images_per_sec']))
+
+    settings = {key: best[key] for key in ['num_workers', 'prefetch_factor', 'pin_memory']}
+    if settings['prefetch_factor'] is None:
+        del settings['prefetch_factor']
+    return settings, measurements
+
+
+def tune(name, data_dir, device, memory_fraction=0.9, image_size=None, max_batch_size=1024, workers=None, batches=20, options=None):
+    """
+        Tune the batch size and the DataLoader of the model and return the settings saved by save_settings().
+
+        :param options: memory related settings of the executor ( see executor_options() ), None for the plain model
+    """
+    import pandas as pd
+    from common.torch.dataset.dataset import ClassificationDataset
+
+    image_size = image_size or get_image_size(name)
+    memory_budget_mb = memory_fraction * total_memory_mb(device)
+
+    print(f'Searching the max batch size of {name} ( {options or "plain model"} ) for a budget of {memory_budget_mb:.0f} MB on {device} ...')
+    batch_size, trials = find_max_batch_size(name, device, image_size, memory_budget_mb, max_batch_size=max_batch_size, options=options)
+    if batch_size is None:
+        raise RuntimeError(f'The smallest batch size does not fit in {memory_budget_mb:.0f} MB')
+    step_images_per_sec = batch_size / trials[batch_size]['step_time_sec']
+    print(f'Max batch size {batch_size}, training step {step_images_per_sec:.1f} images/sec')
+
+    print('Tuning the DataLoader ...')
+    dataset = ClassificationDataset(f'{data_dir}/train', pd.read_csv(f'{data_dir}/train.csv'), get_train_transformation(name),
+                                    {'image': 'image', 'label': 'class'})
+    data_loader, measurements = tune_data_loader(dataset, batch_size, device, step_images_per_sec, workers=workers, batches=batches)
+    data_loader['batch_size'] = batch_size
+    print(f'Selected DataLoader settings: {data_loader}')
+
+    return {
+        'data_loader': data_loader,
+        'memory_budget_mb': memory_budget_mb,
+        'executor_options': options or {},
+        'step_images_per_sec': step_images_per_sec,
+        'batch_size_trials': {str(b): r for b, r in sorted(trials.items())},
+        'data_loader_measurements': measurements
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--data-dir', default=None, help='processed dataset with train.csv, a synthetic dataset is created if not set')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--memory-fraction', type=float, default=0.9, help='fraction of the GPU memory ( or RAM ) used by the training step')
+    parser.add_argument('--max-batch-size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, nargs='+', default=None)
+    parser.add_argument('--batches', type=int, default=20, help='timed batches per DataLoader setting')
+    parser.add_argument('--plain', action='store_true', help='measure the plain model, without the memory settings of the executor')
+    parser.add_argument('--file', default=DEFAULT_FILE)
+    parser.add_argument('--show', action='store_true', help='print the tuned settings of this machine')
+    args = parser.parse_args()
+
+    if args.show:
+        fingerprint, _ = machine_fingerprint()
+        settings = load_results(args.file).get(fingerprint, {}).get('settings', {})
+        print(json.dumps({key: value['data_loader'] for key, value in settings.items() if key.startswith(f'{args.model}:')}, indent=2))
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            data_dir = args.data_dir
+            if data_dir is None:
+                from common.torch.dataset.synthetic_dataset import create_processed_dataset
+
+                data_dir = temp_dir
+                create_processed_dataset(data_dir, type='train', num_images=1024, seed=0)
+
+            settings = tune(args.model, data_dir, args.device, args.memory_fraction, max_batch_size=args.max_batch_size, workers=args.workers,
+                            batches=args.batches, options=None if args.plain else executor_options(args.model))
+
+        save_settings(args.model, args.device, get_image_size(args.model), settings, args.file)
+        print(f'Saved to {args.file} for machine {machine_fingerprint()[0]}')
@@ -1,8 +1,16 @@
+import time
 import torch
 from common.torch.utils.training_util import *
-from tqdm import tqdm
-from apex import amp
+from common.lazy_import import lazy_import, is_available
+# Optional packages, imported on first use ( see common/lazy_import.py )
+tqdm = lazy_import('tqdm', 'tqdm')
+amp = lazy_import('apex.amp', install='https://github.com/NVIDIA/apex')
 from common.torch.utils.init_executor import *
+from common.torch.utils.metrics_sink import ProgressBar
+from common.torch.utils.inference_backend import TorchBackend, create_backend
+from common.torch.utils.tta import tta_predict
+from common.torch.utils.async_validation import AsyncValidator, validation_subset
+from torch.utils.data import DataLoader
 
 """
     This class was written to reduce and simply the lines of reusable codes needed for a functioning 
@@ -15,10 +23,11 @@ from common.torch.utils.init_executor import *
         1.  Data Augmentation is outside of this class and can be defined in a 
             semi declarative way using albumentations library inside the transformation.py class.
         2.  Automatic Loading and Saving models from and to checkpoint. 
-        3.  Integration with Tensor Board. The Tensor Board data is being written after a checkpoint save.
-            This is to make sure that upon restarting the training, the plots are properly drawn.
-                A.  Both Training Loss and Validation Accuracy is being written. The code will be modified to 
-                    also include Training Accuracy and Validation Loss.
+        3.  Integration with Tensor Board through MetricsSink ( metrics_sink.py ). The scalars are written at the end
+            of every epoch by a background thread and synced to disk every METRICS_FLUSH_SECS seconds and at every
+            checkpoint save. Upon restarting the training, the epochs written after the last checkpoint are hidden
+            ( purge_step ), so that the plots are properly drawn.
+                A.  Training Loss/Accuracy, Validation Loss/Accuracy and the Learning Rate are being written.
                 B.  The model is also being stored as graph for visualization.
         4.  Logging has been enabled in both console and external file. The external file name can be configured 
             using the configuration.
@@ -44,22 +53,12 @@ class BaseExecutor(InitExecutor):
         # Initialize Logging
         self.init_logging()
 
-        # Init Checkpoint
-        self.init_checkpoint()
-
-        # Initialize the arrays for tensor boards
-        # This is needed as scalar data will be pushed to tensor board
-        # only when the checkpoint is being saved.
-        # So that in the next run the plot will be properly appended.
-        self.init_temp_arrays_for_tensor_board()
+        # Split the cores between the main process and the DataLoader workers
+        self.configure_cpu_threads()
 
-    def init_temp_arrays_for_tensor_board(self):
-        # Reset the temp lists
-        self.val_acc = []
-        self.val_loss = []
-        self.train_loss = []
-        self.train_acc = []
-        self.learning_rate = []
+        # Init Checkpoint. The scalars are written to tensor board as soon as they are available ( see metrics_sink.py ),
+        # on resume the epochs written after the last checkpoint are replaced.
+        self.init_checkpoint()
 
     def forward_backward_pass(self, images, labels, epoch, i):
         """
@@ -100,8 +99,10 @@ class BaseExecutor(InitExecutor):
         # update parameters
         self.optimizer.step()
 
-        # Update Progress Bar with the running average loss. Later add the validation accuracy
-        self.pbar.set_postfix(epoch=f" {epoch}, loss= {round(self.train_loss_hist.value, 4)}", refresh=True)
+        # Update Progress Bar with the running average loss. Later add the validation accuracy.
+        # The bar is redrawn every PROGRESS_REFRESH_SECS seconds, not for every batch.
+        if self.pbar.due():
+            self.pbar.set_postfix(epoch=f" {epoch}, loss= {round(self.train_loss_hist.value, 4)}")
         self.pbar.update()
 
         return output
@@ -123,7 +124,7 @@ class BaseExecutor(InitExecutor):
         # with no gradient mode on
         with torch.no_grad():
             # Loop through the validation data loader
-            for images, labels, _ in self.val_data_loader:
+            for images, labels, _ in self.get_validation_data_loader():
                 # Move the tensors to GPU
                 images = images.to(self.DEVICE)
                 labels = labels.to(self.DEVICE)
@@ -145,7 +146,8 @@ class BaseExecutor(InitExecutor):
 
     def prediction_accuracy(self):
         """
-            This function is for predicting test accuracy
+            This function is for predicting test accuracy. TTA_POLICY enables the test time augmentation ( see tta.py ),
+            the views of each image are averaged.
         """
 
         # Set the model to eval mode.
@@ -158,6 +160,9 @@ class BaseExecutor(InitExecutor):
         total_rank5 = 0
         pbar = tqdm(total=len(self.test_data_loader), bar_format='{l_bar}{bar:10}{r_bar}{bar:-10b}', unit=' batches', ncols=200)
 
+        # Run either on PyTorch or on ONNX Runtime
+        backend = self.init_inference_backend()
+
         # with no gradient mode on
         with torch.no_grad():
             # Loop through the validation data loader
@@ -167,7 +172,11 @@ class BaseExecutor(InitExecutor):
                 labels = labels.to(self.DEVICE)
 
                 # Forward pass
-                predictions = self.model(images)
+                # ONNX Runtime returns the predictions on the CPU
+                if self.TTA_POLICY in [None, 'none']:
+                    predictions = backend(images).to(labels.device)
+                else:
+                    predictions = tta_predict(backend, images, self.TTA_POLICY, self.TTA_MAX_BATCH_SIZE or 256)
 
                 total, correct = self.cal_prediction(predictions, labels, total, correct)
                 total_rank5, correct_rank5 = self.rank5_accuracy(predictions, labels, total_rank5, correct_rank5)
@@ -180,6 +189,44 @@ class BaseExecutor(InitExecutor):
         rank5_accuracy = (100 * correct_rank5 / total_rank5)
         return accuracy, rank5_accuracy
 
+    def init_inference_backend(self):
+        """
+            This function is for creating the inference backend used by prediction_accuracy().
+                INFERENCE_BACKEND : torch ( default ) or onnxruntime
+                ONNX_MODEL_FILE   : ONNX model used by the onnxruntime backend. The loaded model is exported to this
+                                    file first, unless the file was exported from the same checkpoint ( path and
+                                    modification time, recorded in <ONNX_MODEL_FILE>.checkpoint ).
+        """
+        if self.INFERENCE_BACKEND in [None, 'torch']:
+            return TorchBackend(self.model)
+
+        from common.torch.utils.onnx_export import export_onnx
+
+        onnx_file = self.ONNX_MODEL_FILE or f'{self.INPUT_DIR}/{self.PROJECT_NAME}.onnx'
+
+        # The checkpoint loaded by load_checkpoint(), an existing file of older weights is exported again
+        key = f'{self.last_checkpoint_file}:{os.path.getmtime(self.last_checkpoint_file)}' \
+            if self.load_from_check_point and os.path.isfile(self.last_checkpoint_file) else None
+        exported_key = None
+        if key and os.path.isfile(f'{onnx_file}.checkpoint'):
+            with open(f'{onnx_file}.checkpoint') as file:
+                exported_key = file.read().strip()
+
+        if not os.path.isfile(onnx_file) or key is None or key != exported_key:
+            # Get the image size from a test batch
+            images, _, _ = next(iter(self.test_data_loader))
+            model = self.model.module if isinstance(self.model, torch.nn.DataParallel) else self.model
+            self.logger.info(f"\tExporting model to ONNX [{onnx_file}] ...")
+            export_onnx(model, onnx_file, image_size=images.shape[-1])
+            # Move the model back to the configured device
+            self.model.to(self.DEVICE)
+            if key:
+                with open(f'{onnx_file}.checkpoint', 'w') as file:
+                    file.write(key)
+
+        self.logger.info(f"\tUsing ONNX Runtime with [{onnx_file}] for prediction ...")
+        return create_backend(self.INFERENCE_BACKEND, onnx_file=onnx_file)
+
     def create_checkpoint_folder(self):
         """
             This function is for creating an empty checkpoint folder. The folder does not get created until
@@ -187,10 +234,16 @@ class BaseExecutor(InitExecutor):
         """
         self.CHECKPOINT_PATH = f'{self.INPUT_DIR}/checkpoint/{datetime.now().strftime("%b-%d-%Y-%H-%M-%S")}'
 
-    def pre_training_loop_ops(self):
+    def pre_training_loop_ops(self, epoch=None):
         """
             This function is for defining common steps before starting the each training loop.
         """
+        if self.training_start_time is None:
+            self.training_start_time = time.perf_counter()
+
+        # Change the training resolution if needed. This may replace the training data loader.
+        if epoch is not None:
+            self.apply_resolution_schedule(epoch)
 
         # Set model to training mode
         self.model.train()
@@ -199,44 +252,145 @@ class BaseExecutor(InitExecutor):
         self.train_loss_hist.reset()
 
         # Initialize the progress bar
-        self.pbar = tqdm(total=len(self.train_data_loader), bar_format='{l_bar}{bar:10}{r_bar}{bar:-10b}', unit=' batches', ncols=200)
+        self.pbar = ProgressBar(len(self.train_data_loader), self.PROGRESS_REFRESH_SECS)
 
     def post_training_loop_ops(self, epoch, train_accuracy):
-        # add to train loss
-        self.train_loss.append((round(self.train_loss_hist.value, 4), epoch))
-
-        # Train Accuracy for the epoch
-        self.train_acc.append((round(train_accuracy, 3), epoch))
-
-        eval_accuracy = self.calculate_validation_loss_accuracy()
+        # Train loss and accuracy of the epoch to tensor board. The validation results are added to the same charts
+        # by record_validation(), some epochs are not validated ( VALIDATION_INTERVAL ) and the background validation
+        # results arrive later than the training ones.
+        self.tb_writer.add_scalars("Loss", {'train': round(self.train_loss_hist.value, 4)}, epoch)
+        self.tb_writer.add_scalars("Accuracy", {'train': round(train_accuracy, 3)}, epoch)
+
+        # The validation runs either here or in the background process ( ASYNC_VALIDATION ). eval_accuracy is None
+        # when the result is not available yet or when the epoch is not validated ( VALIDATION_INTERVAL ).
+        eval_accuracy = None
+        if self.is_validation_epoch(epoch):
+            if self.ASYNC_VALIDATION:
+                self.submit_async_validation(epoch)
+            else:
+                eval_accuracy = self.calculate_validation_loss_accuracy()
+                self.record_validation(epoch, eval_accuracy, self.val_loss_hist.value)
+
+        # Results of the background validation, wait for all of them after the last epoch
+        self.receive_validation_results(block=epoch == self.EPOCHS)
 
         current_lr = self.get_lr()
 
+        # The last validation accuracy available
+        val_accuracy = round(self.last_val_accuracy, 3) if self.last_val_accuracy is not None else None
+
         # Display the validation loss/accuracy in the progress bar
         self.pbar.set_postfix(
-            epoch=f"{epoch}, loss={round(self.train_loss_hist.value, 4)}, val acc={round(eval_accuracy, 3)}, train acc={round(train_accuracy, 3)}, lr={current_lr}",
+            epoch=f"{epoch}, loss={round(self.train_loss_hist.value, 4)}, val acc={val_accuracy}, train acc={round(train_accuracy, 3)}, lr={current_lr}",
             refresh=False)
 
         self.logger.info(
-            f"epoch={epoch}, loss={round(self.train_loss_hist.value, 4)}, val acc={round(eval_accuracy, 3)}, train acc={round(train_accuracy, 3)}, lr={current_lr}")
+            f"epoch={epoch}, loss={round(self.train_loss_hist.value, 4)}, val acc={val_accuracy}, train acc={round(train_accuracy, 3)}, lr={current_lr}")
 
-        # Add to validation loss
-        self.val_acc.append((round(eval_accuracy, 3), epoch))
-        self.val_loss.append((round(self.val_loss_hist.value, 4), epoch))
+        self.tb_writer.add_scalar("Learning Rate", current_lr, epoch)
 
-        self.learning_rate.append((current_lr, epoch))
+        # Remove the channels if the pruning schedule has reached this epoch. This is done before saving
+        # the checkpoint, so that the pruned model is restored when the training is resumed.
+        self.apply_pruning_schedule(epoch)
 
         # Save the model ( if needed )
         self.save_checkpoint(epoch)
 
         return eval_accuracy
 
-    def save_checkpoint(self, epoch):
+    def is_validation_epoch(self, epoch):
+        """
+            The validation runs every VALIDATION_INTERVAL epochs and after the last epoch.
+        """
+        return epoch % (self.VALIDATION_INTERVAL or 1) == 0 or epoch == self.EPOCHS
+
+    def record_validation(self, epoch, eval_accuracy, val_loss):
+        """
+            This function is for adding the validation result of an epoch to tensor board.
+        """
+        self.last_val_accuracy = eval_accuracy
+
+        # Log the wall clock time when the target accuracy is reached for the first time
+        if self.TARGET_ACCURACY and not self.target_accuracy_reached and eval_accuracy >= self.TARGET_ACCURACY:
+            self.target_accuracy_reached = True
+            self.logger.info(f"Reached the target accuracy {self.TARGET_ACCURACY} at epoch {epoch} in "
+                             f"{round(time.perf_counter() - self.training_start_time, 1)} seconds")
+
+        # Add to validation loss
+        self.tb_writer.add_scalars("Loss", {'val': round(val_loss, 4)}, epoch)
+        self.tb_writer.add_scalars("Accuracy", {'val': round(eval_accuracy, 3)}, epoch)
+
+    def get_validation_data_loader(self):
+        """
+            Returns the validation data loader, or the quick validation data loader using a fixed random subset
+            of the validation images when VALIDATION_SUBSET ( fraction or number of images ) is set.
+        """
+        if not self.VALIDATION_SUBSET:
+            return self.val_data_loader
+
+        if self.quick_val_data_loader is None:
+            loader = self.val_data_loader
+            self.quick_val_data_loader = DataLoader(validation_subset(loader.dataset, self.VALIDATION_SUBSET), batch_size=loader.batch_size,
+                                                    shuffle=False, num_workers=loader.num_workers, pin_memory=loader.pin_memory, drop_last=False,
+                                                    worker_init_fn=loader.worker_init_fn)
+            self.logger.info(f"\tQuick validation using {len(self.quick_val_data_loader.dataset)} images ...")
+        return self.quick_val_data_loader
+
+    def submit_async_validation(self, epoch):
+        """
+            This function is for sending a CPU snapshot of the model to the background evaluator ( see async_validation.py ).
+                ASYNC_VALIDATION_DEVICE  : device of the evaluator, cpu by default
+                ASYNC_VALIDATION_WORKERS : DataLoader workers of the evaluator
+                ASYNC_VALIDATION_THREADS : torch threads of the evaluator
+        """
+        if self.async_validator is None:
+            loader = self.val_data_loader
+            self.async_validator = AsyncValidator(validation_subset(loader.dataset, self.VALIDATION_SUBSET), loader.batch_size, self.criterion,
+                                                  self.ASYNC_VALIDATION_DEVICE or 'cpu', self.ASYNC_VALIDATION_WORKERS or 0, self.ASYNC_VALIDATION_THREADS)
+        self.async_validator.submit(epoch, self.model)
+
+    def receive_validation_results(self, block=False):
+        """
+            This function is for recording the results of the background evaluator as soon as they arrive. The
+            ReduceLROnPlateau scheduler is stepped with the result, see step_scheduler_on_validation().
+
+            :param block: wait for all the submitted snapshots and stop the evaluator
+        """
+        if self.async_validator is None:
+            return
+
+        for epoch, eval_accuracy, val_loss, seconds, error in self.async_validator.poll(block=block):
+            if error:
+                self.logger.error(f"Background validation of epoch {epoch} failed: {error}")
+                continue
+            self.logger.info(f"epoch={epoch}, background validation: val acc={round(eval_accuracy, 3)}, val loss={round(val_loss, 4)} "
+                             f"in {round(seconds, 1)} seconds")
+            self.record_validation(epoch, eval_accuracy, val_loss)
+            if self.plateau_on_validation:
+                self.scheduler.step(eval_accuracy / 100)
+
+        if block:
+            self.async_validator.close()
+            self.async_validator = None
+
+    def step_scheduler_on_validation(self, eval_accuracy):
+        """
+            This function is for stepping ReduceLROnPlateau with the validation accuracy. With ASYNC_VALIDATION the
+            accuracy is not available at the end of the epoch ( None ), the scheduler is stepped when the result
+            arrives instead.
+        """
+        self.plateau_on_validation = True
+        if eval_accuracy is not None:
+            self.scheduler.step(eval_accuracy / 100)
+
+    def save_checkpoint(self, epoch, force=False):
         """
             This function is for saving model to disk.
+
+            :param force: save even if the epoch is not a multiple of CHECKPOINT_INTERVAL
         """
 
-        if epoch % self.CHECKPOINT_INTERVAL == 0:
+        if force or epoch % self.CHECKPOINT_INTERVAL == 0:
             # Create the checkpoint dir
             if not os.path.isdir(self.CHECKPOINT_PATH):
                 os.makedirs(self.CHECKPOINT_PATH)
@@ -255,6 +409,12 @@ class BaseExecutor(InitExecutor):
             if self.scheduler:
                 checkpoint['scheduler'] = self.scheduler.state_dict()
 
+            # The layer sizes of a pruned model are different from the one created by build_model(),
+            # hence save the whole model.
+            if self.pruning_sparsity > 0:
+                checkpoint['pruned_model'] = self.model
+                checkpoint['pruning_sparsity'] = self.pruning_sparsity
+
             # Save the checkpoint file to disk
             torch.save(checkpoint, file_name)
 
@@ -263,18 +423,8 @@ class BaseExecutor(InitExecutor):
             with open(f'{self.INPUT_DIR}/last.checkpoint.{self.PROJECT_NAME}', 'w+') as file:
                 file.writelines('\n'.join([file_name, self.tb_writer.get_logdir()]))
 
-            # Write to tensor board
-            for (tr_y, tr_x), (val_y, val_x) in zip(self.train_loss, self.val_loss):
-                self.tb_writer.add_scalars("Loss", {'train': tr_y, 'val': val_y}, tr_x)
-
-            for (tr_y, tr_x), (val_y, val_x) in zip(self.train_acc, self.val_acc):
-                self.tb_writer.add_scalars("Accuracy", {'train': tr_y, 'val': val_y}, tr_x)
-
-            for y, x in self.learning_rate:
-                self.tb_writer.add_scalar("Learning Rate", y, x)
-
-            # Reset the arrays
-            self.init_temp_arrays_for_tensor_board()
+            # The tensor board data of the checkpointed epochs is on disk along with the checkpoint
+            self.tb_writer.flush()
 
     def load_checkpoint(self):
         """
@@ -286,6 +436,11 @@ class BaseExecutor(InitExecutor):
             self.logger.info(f"\tAttempting to load from checkpoint {self.last_checkpoint_file} ...")
 
             checkpoint = torch.load(self.last_checkpoint_file)
+            if 'pruned_model' in checkpoint:
+                # Replace the model created by build_model() with the pruned model
+                self.model = checkpoint['pruned_model'].to(self.DEVICE)
+                self.pruning_sparsity = checkpoint['pruning_sparsity']
+                self.rebuild_optimizer()
             self.model.load_state_dict(checkpoint['model_state_dict'])
             self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
 
@@ -318,6 +473,150 @@ class BaseExecutor(InitExecutor):
                 else:
                     self.model = torch.nn.DataParallel(self.model)
 
+    def enable_activation_checkpointing(self):
+        """
+            This function is for trading compute for memory. When enabled, only the input of each segment
+            of the model is stored during the forward pass and the rest is recomputed in the backward pass,
+            hence larger batch size can be used.
+                ACTIVATION_CHECKPOINT_SEGMENTS : number of segments ( less segments -> less memory, more compute )
+                ACTIVATION_CHECKPOINT_EVERY    : alternatively, one segment for every k layers
+
+            Needs to be invoked before enable_multi_gpu_training() as the model must be a CNNBaseModel.
+        """
+        if self.ACTIVATION_CHECKPOINT_SEGMENTS or self.ACTIVATION_CHECKPOINT_EVERY:
+            self.model.enable_activation_checkpointing(segments=self.ACTIVATION_CHECKPOINT_SEGMENTS, every=self.ACTIVATION_CHECKPOINT_EVERY)
+            self.logger.info(f"\tActivation checkpointing enabled with {self.model.checkpoint_segments} segments ...")
+
+    def enable_low_rank_factorization(self):
+        """
+            This function is for fine-tuning a model with the large Linear layers replaced by their truncated SVD
+            ( see low_rank.py ).
+                PRETRAINED_CHECKPOINT : checkpoint of the original model, loaded before the factorization
+                LOW_RANK_RANK         : rank of the factorization
+                LOW_RANK_ENERGY       : alternatively, fraction of the energy of the singular values to retain
+                LOW_RANK_LAYERS       : names of the Linear layers to factorize, None for all
+
+            Needs to be invoked right after the model is created. Use a different PROJECT_NAME than the original
+            training, otherwise the last checkpoint of the original model would be loaded.
+        """
+        if self.LOW_RANK_RANK or self.LOW_RANK_ENERGY:
+            from common.torch.utils.low_rank import factorize_model
+            from common.torch.utils.quantization_util import load_checkpoint_weights
+
+            if self.PRETRAINED_CHECKPOINT:
+                self.logger.info(f"\tLoading pretrained weights from {self.PRETRAINED_CHECKPOINT} ...")
+                self.model = load_checkpoint_weights(self.model, self.PRETRAINED_CHECKPOINT)
+
+            ranks = factorize_model(self.model, rank=self.LOW_RANK_RANK, energy=self.LOW_RANK_ENERGY, layers=self.LOW_RANK_LAYERS)
+            self.logger.info(f"\tLow rank factorization of the Linear layers {ranks} ...")
+
+    def configure_cpu_threads(self):
+        """
+            This function is for setting the intra-op/inter-op threads of the process and the threads and cores of the
+            DataLoader workers ( see cpu_threading.py ). Enabled by CPU_THREADS, 'auto' or a number of threads.
+        """
+        if self.CPU_THREADS is None:
+            return
+
+        from common.torch.utils.cpu_threading import plan_threads, apply_main_threads, configure_data_loader
+
+        # The train and validation workers do not run at the same time
+        loaders = [self.train_data_loader, self.val_data_loader, self.test_data_loader]
+        num_workers = max(loader.num_workers if loader is not None else 0 for loader in loaders)
+
+        plan = plan_threads(num_workers, self.CPU_THREADS, self.CPU_INTEROP_THREADS, self.CPU_WORKER_THREADS, self.CPU_AFFINITY)
+        apply_main_threads(plan, self.logger)
+        for loader in loaders:
+            configure_data_loader(loader, plan)
+
+        self.logger.info(f"CPU threads: {plan['intra_op_threads']} intra-op, {plan['interop_threads']} inter-op, {plan['worker_threads']} per "
+                         f"worker for {num_workers} workers on {len(plan['cores'])} cores, affinity {'on' if self.CPU_AFFINITY else 'off'}")
+
+    def apply_resolution_schedule(self, epoch):
+        """
+            This function is for progressive resizing ( see progressive_resizing.py ). The early epochs use a lower
+            training resolution and a larger batch size, so that the memory usage stays about the same.
+                RESOLUTION_SCHEDULE : dict of first epoch -> resolution, e.g. {1: 128, 6: 176, 11: 224}
+
+            The validation always uses the full resolution. The model must use AdaptiveAvgPool2d.
+        """
+        if not self.RESOLUTION_SCHEDULE:
+            return
+
+        from common.torch.utils.progressive_resizing import supports_progressive_resizing, resolution_for_epoch, transformation_size, \
+            rescale_transformation, scaled_batch_size, rebuild_data_loader
+
+        if self.full_train_data_loader is None:
+            model = self.model.module if isinstance(self.model, torch.nn.DataParallel) else self.model
+            if not supports_progressive_resizing(model):
+                self.logger.error("RESOLUTION_SCHEDULE needs a model with AdaptiveAvgPool2d")
+                raise Exception("Compatibility error, please review logs ...")
+            self.full_train_data_loader = self.train_data_loader
+            self.train_resolution = transformation_size(self.train_data_loader.dataset.transform)
+
+        full_size = transformation_size(self.full_train_data_loader.dataset.transform)
+        size = resolution_for_epoch(self.RESOLUTION_SCHEDULE, epoch) or full_size
+        if size == self.train_resolution:
+            return
+
+        if size == full_size:
+            self.train_data_loader = self.full_train_data_loader
+        else:
+            batch_size = scaled_batch_size(self.full_train_data_loader.batch_size, full_size, size)
+            transformation = rescale_transformation(self.full_train_data_loader.dataset.transform, size)
+            self.train_data_loader = rebuild_data_loader(self.full_train_data_loader, transformation, batch_size)
+
+        self.train_resolution = size
+        self.logger.info(f"\tTraining resolution changed to {size} with batch size {self.train_data_loader.batch_size} at epoch {epoch}")
+
+    def rebuild_optimizer(self):
+        """
+            This function is for creating the optimizer again after the parameters of the model have been replaced
+            ( e.g. structured pruning ). The type, hyper parameters and current learning rate are kept and the
+            scheduler is pointed to the new optimizer. The momentum buffers of the old parameters are dropped.
+        """
+        old_optimizer = self.optimizer
+        self.optimizer = type(old_optimizer)(self.model.parameters(), **old_optimizer.defaults)
+
+        for group, old_group in zip(self.optimizer.param_groups, old_optimizer.param_groups):
+            group['lr'] = old_group['lr']
+            if 'initial_lr' in old_group:
+                group['initial_lr'] = old_group['initial_lr']
+
+        if self.scheduler:
+            self.scheduler.optimizer = self.optimizer
+
+    def apply_pruning_schedule(self, epoch):
+        """
+            This function is for iterative structured pruning ( see pruning_util.py ). After each epoch in the schedule
+            the channels are removed from the model and the training continues ( fine-tuning ) with the smaller model.
+                PRUNING_SCHEDULE  : dict of epoch -> target sparsity ( fraction of the channels of the original model ),
+                                    e.g. {10: 0.25, 20: 0.5}
+                PRUNING_CRITERION : l1, l2 or taylor
+                PRUNING_BATCHES   : number of training batches used by the taylor criterion
+
+            To prune a trained model, resume its training with a larger EPOCHS and a schedule after the last epoch.
+        """
+        if not self.PRUNING_SCHEDULE or epoch not in self.PRUNING_SCHEDULE:
+            return
+
+        from common.torch.utils.pruning_util import prune_model, step_ratio
+
+        if self.FP16_MIXED:
+            self.logger.error("Pruning can not be used with FP16_MIXED enabled")
+            raise Exception("Compatibility error, please review logs ...")
+
+        target = self.PRUNING_SCHEDULE[epoch]
+        model = self.model.module if isinstance(self.model, torch.nn.DataParallel) else self.model
+
+        summary = prune_model(model, step_ratio(self.pruning_sparsity, target), criterion=self.PRUNING_CRITERION or 'l1',
+                              data_loader=self.train_data_loader, loss_function=self.criterion, device=self.DEVICE,
+                              batches=self.PRUNING_BATCHES or 10)
+        self.pruning_sparsity = target
+        self.rebuild_optimizer()
+
+        self.logger.info(f"\tPruned the model to sparsity {target} after epoch {epoch}: {summary}")
+
     def enable_precision_mode(self):
         """
             This function is for using FP16 with Mixed Precision.
@@ -329,6 +628,10 @@ class BaseExecutor(InitExecutor):
             https://nvidia.github.io/apex/amp.html
         """
         if self.FP16_MIXED:
+            if not is_available(amp):
+                self.logger.error("FP16_MIXED needs the Nvidia apex library, install it from https://github.com/NVIDIA/apex or set FP16_MIXED to False")
+                raise Exception("Compatibility error, please review logs ...")
+
             # '00' : FP32 training
             # '01' : Mixed Precision (recommended for typical use)
             # '02' : “Almost FP16” Mixed Precision
@@ -349,7 +652,7 @@ class BaseExecutor(InitExecutor):
         images, labels, _ = loader.next()
         if self.tb_writer is None:
             now = datetime.now()
-            self.tb_writer = SummaryWriter(log_dir=f'runs/{self.PROJECT_NAME}_{now.strftime("%Y%m%d-%H%M%S")}')
+            self.tb_writer = MetricsSink(f'runs/{self.PROJECT_NAME}_{now.strftime("%Y%m%d-%H%M%S")}', flush_secs=self.METRICS_FLUSH_SECS)
 
         # save the model graph to tensor board
         self.tb_writer.add_graph(self.model, images)
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import torch
+from common.torch.utils.benchmark_util import *
+from common.torch.utils.model_registry import MODELS, create_model, get_image_size, get_test_transformation
+
+"""
+    Cross architecture CPU benchmark suite. It does not need the Caltech dataset, all the inputs are synthetic.
+
+    For each model, thread count and batch size it measures:
+        1.  forward only ( inference ) images/sec and p50/p99 latency
+        2.  forward + backward + optimizer step ( training ) images/sec and p50/p99 latency
+        3.  peak RSS of the process
+        4.  ( optional ) end to end images/sec of ClassificationDataset -> DataLoader -> model using
+            a synthetic JPEG dataset written to disk.
+
+    Every (model, thread count) runs in a fresh process, hence the peak RSS is not shared between models.
+    The peak RSS of a process only grows, so within one process it is the peak up to that batch size
+    ( the batch sizes are run in increasing order ).
+
+    The results are written to a versioned json file which can be compared with a previous run.
+
+    Usage:
+        python -m common.torch.utils.benchmark_suite --models resnet_20 squeezenet --batch-sizes 1 8 32 --threads 1 4 --output results.json
+        python -m common.torch.utils.benchmark_suite --compare baseline.json results.json
+"""
+
+# Increase this when the structure of the results file changes
+SCHEMA_VERSION = 1
+
+
+def machine_info():
+    """
+        Information about the machine and the software, stored with the results.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, OSError):
+        commit = None
+
+    return {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'git_commit': commit
+    }
+
+
+def throughput(batch_size, latency):
+    return 1000.0 * batch_size / latency['p50_ms']
+
+
+def benchmark_inference(model, batch_size, image_size, repeat):
+    x = torch.rand(batch_size, 3, image_size, image_size)
+    latency = measure_module_latency(model, x, warmup=2, repeat=repeat)
+    return {'images_per_sec': throughput(batch_size, latency), 'p50_ms': latency['p50_ms'], 'p99_ms': latency['p99_ms']}
+
+
+def benchmark_training(model, batch_size, image_size, repeat):
+    x = torch.rand(batch_size, 3, image_size, image_size)
+    labels = torch.randint(0, 256, (batch_size,))
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.001, momentum=0.9)
+    # All the models end with LogSoftmax
+    criterion = torch.nn.NLLLoss()
+
+    def step():
+        optimizer.zero_grad()
+        loss = criterion(model(x), labels)
+        loss.backward()
+        optimizer.step()
+
+    model.train()
+    latency = measure_latency(step, warmup=1, repeat=repeat)
+    model.eval()
+    return {'images_per_sec': throughput(batch_size, latency), 'p50_ms': latency['p50_ms'], 'p99_ms': latency['p99_ms']}
+
+
+def benchmark_pipeline(model, name, data_dir, batch_size, num_workers, repeat):
+    """
+        End to end inference throughput, reading and decoding the synthetic JPEG dataset with the
+        ClassificationDataset and the test_transformation of the model.
+    """
+    import pandas as pd
+    from torch.utils.data import DataLoader
+    from common.torch.dataset.dataset import ClassificationDataset
+
+    df = pd.read_csv(f'{data_dir}/train.csv')
+    dataset = ClassificationDataset(f'{data_dir}/train', df, get_test_transformation(name), {'image': 'image', 'label': 'class'}, training=False)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, drop_last=False)
+
+    model.eval()
+    images_seen = 0
+    start = time.perf_counter()
+    with torch.no_grad():
+        for _ in range(repeat):
+            for images, _, _ in loader:
+                model(images)
+                images_seen += images.size(0)
+    elapsed = time.perf_counter() - start
+    return {'images_per_sec': images_seen / elapsed}
+
+
+def run_model(name, threads, batch_sizes, repeat, modes, data_dir, num_workers):
+    """
+        Runs all the benchmarks of one model with the given thread count. Invoked in a fresh process.
+    """
+    torch.set_num_threads(threads)
+    torch.manual_seed(0)
+
+    model = create_model(name).eval()
+    image_size = get_image_size(name)
+
+    results = []
+    for batch_size in batch_sizes:
+        result = {'model': name, 'threads': threads, 'batch_size': batch_size, 'image_size': image_size}
+        if 'inference' in modes:
+            result['inference'] = benchmark_inference(model, batch_size, image_size, repeat)
+        # BatchNorm1d ( AlexNet/ZFNet ) can not be trained with a single image
+        if 'training' in modes and batch_size > 1:
+            result['training'] = benchmark_training(model, batch_size, image_size, max(repeat // 4, 2))
+        if 'pipeline' in modes and data_dir:
+            result['pipeline'] = benchmark_pipeline(model, name, data_dir, batch_size, num_workers, 1)
+        result['peak_rss_mb'] = peak_rss_mb()
+        results.append(result)
+    return results
+
+
+def result_key(result):
+    return result['model'], result['threads'], result['batch_size']
+
+
+def compare(baseline_file, current_file, tolerance=0.05):
+    """
+        Compare two result files and print the change of images/sec. Returns the regressions which are
+        slower than the tolerance ( 5% by default ).
+    """
+    with open(baseline_file) as file:
+        baseline = json.load(file)
+    with open(current_file) as file:
+        current = json.load(file)
+
+    if baseline.get('schema_version') != current.get('schema_version'):
+        print(f"Warning: comparing schema version {baseline.get('schema_version')} with {current.get('schema_version')}")
+
+    baseline_results = {result_key(r): r for r in baseline['results']}
+    regressions = []
+
+    print(f'{"Model":<16}{"Threads":>8}{"Batch":>8}{"Mode":>12}{"Baseline":>12}{"Current":>12}{"Change":>10}')
+    for result in current['results']:
+        key = result_key(result)
+        if key not in baseline_results:
+            continue
+        for mode in ['inference', 'training', 'pipeline']:
+            if mode not in result or mode not in baseline_results[key]:
+                continue
+            old = baseline_results[key][mode]['images_per_sec']
+            new = result[mode]['images_per_sec']
+            change = (new - old) / old
+            print(f'{key[0]:<16}{key[1]:>8}{key[2]:>8}{mode:>12}{old:>12.1f}{new:>12.1f}{change * 100:>9.1f}%')
+            if change < -tolerance:
+                regressions.append((key, mode, change))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=list(MODELS.keys()), choices=list(MODELS.keys()))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--threads', type=int, nargs='+', default=[os.cpu_count()])
+    parser.add_argument('--modes', nargs='+', default=['inference', 'training'], choices=['inference', 'training', 'pipeline'])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--pipeline-images', type=int, default=256, help='number of synthetic JPEG images for the pipeline mode')
+    parser.add_argument('--num-workers', type=int, default=2)
+    parser.add_argument('--output', default=f'benchmark_{datetime.now().strftime("%Y%m%d-%H%M%S")}.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), default=None)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare)
+        for key, mode, change in regressions:
+            print(f'Regression: {key} {mode} {change * 100:.1f}%')
+        sys.exit(1 if regressions else 0)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        if 'pipeline' in args.modes:
+            from common.torch.dataset.synthetic_dataset import create_processed_dataset
+
+            create_processed_dataset(data_dir, type='train', num_images=args.pipeline_images, seed=0)
+
+        results = []
+        for name in args.models:
+            for threads in args.threads:
+                print(f'Running {name} with {threads} threads ...')
+                results += run_isolated(run_model, name, threads, args.batch_sizes, args.repeat, args.modes, data_dir, args.num_workers)
+
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'timestamp': datetime.now().isoformat(),
+        'machine': machine_info(),
+        'settings': vars(args),
+        'results': results
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(f'{"Model":<16}{"Threads":>8}{"Batch":>8}{"Infer img/s":>14}{"p99 ms":>10}{"Train img/s":>14}{"p99 ms":>10}{"Peak RSS MB":>14}')
+    for result in results:
+        inference = result.get('inference', {})
+        training = result.get('training', {})
+        print(f'{result["model"]:<16}{result["threads"]:>8}{result["batch_size"]:>8}'
+              f'{inference.get("images_per_sec", float("nan")):>14.1f}{inference.get("p99_ms", float("nan")):>10.1f}'
+              f'{training.get("images_per_sec", float("nan")):>14.1f}{training.get("p99_ms", float("nan")):>10.1f}'
+              f'{result["peak_rss_mb"]:>14.1f}')
+    print(f'Results saved to {args.output}')
@@ -0,0 +1,154 @@
+import time
+import resource
+import multiprocessing
+import numpy as np
+import torch
+
+"""
+    Small helpers for timing torch modules on CPU/GPU. These are shared by the benchmark.py scripts
+    inside each model folder so that all the numbers are measured in the same way.
+"""
+
+
+def synchronize(device):
+    """
+        Wait for all the queued kernels to complete. This is a no-op on CPU.
+
+        :param device: torch.device the module is running on
+    """
+    if device is not None and torch.device(device).type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def measure_latency(fn, warmup=5, repeat=20, device=None):
+    """
+        Time a callable and return the latency statistics in milliseconds.
+
+        :param fn: callable without any argument, e.g. lambda: model(x)
+        :param warmup: number of un-timed runs ( lets the allocator and kernels settle )
+        :param repeat: number of timed runs
+        :param device: device used by the callable, needed to synchronize CUDA kernels
+        :return: dict with mean, p50, p99, min latency (ms) and the raw timings
+    """
+    for _ in range(warmup):
+        fn()
+    synchronize(device)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    timings = np.array(timings)
+    return {
+        'mean_ms': float(np.mean(timings)),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'min_ms': float(np.min(timings)),
+        'timings_ms': timings.tolist()
+    }
+
+
+def measure_module_latency(module, x, warmup=5, repeat=20):
+    """
+        Time the forward pass of a module in eval mode with gradients disabled.
+
+        :param module: torch.nn.Module
+        :param x: input tensor
+        :param warmup: number of un-timed runs
+        :param repeat: number of timed runs
+        :return: same dict as measure_latency()
+    """
+    module.eval()
+    with torch.no_grad():
+        return measure_latency(lambda: module(x), warmup=warmup, repeat=repeat, device=x.device)
+
+
+def max_abs_difference(reference, candidate):
+    """
+        Returns the maximum absolute element wise difference of two tensors. Used for parity checks.
+    """
+    return (reference - candidate).abs().max().item()
+
+
+def peak_rss_mb():
+    """
+        Returns the peak resident set size of the current process in MB. ( ru_maxrss is in KB on Linux )
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def reset_peak_memory(device):
+    """
+        Reset the CUDA peak memory counter. The peak RSS of a process can not be reset, hence
+        CPU measurements need a fresh process, see run_isolated().
+    """
+    if torch.device(device).type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def peak_memory_mb(device):
+    """
+        Returns the peak memory in MB since the last reset, CUDA allocator memory for GPU and peak RSS for CPU.
+    """
+    if torch.device(device).type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 1024.0 ** 2
+    return peak_rss_mb()
+
+
+def run_isolated(fn, *args):
+    """
+        Run a function in a fresh ( spawned ) process and return its result. Needed for peak memory
+        measurement on CPU as the peak RSS of a process never goes down.
+
+        :param fn: function defined at module level ( needs to be picklable )
+        :param args: arguments of the function
+    """
+    with multiprocessing.get_context('spawn').Pool(processes=1) as pool:
+        return pool.apply(fn, args)
+
+
+def measure_train_step(model, batch_size, device, steps=3, image_size=224, num_classes=256, mixed_precision=False):
+    """
+        Run a few SGD training steps on random data and return the peak memory and the step time.
+        The peak memory is reported over the memory used after building the model.
+
+        :param model: the model, already moved to the device
+        :param batch_size: batch size
+        :param device: torch.device
+        :param steps: number of training steps ( the fastest one is reported )
+        :param image_size: height/width of the input
+        :param num_classes: number of classes of the model
+        :param mixed_precision: run the forward pass in float16 using torch.cuda.amp.autocast ( same casts as the apex O1
+                                mode of FP16_MIXED ), cuda only
+        :return: dict with peak_memory_mb and step_time_sec
+    """
+    device = torch.device(device)
+    model.train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+    # All the models end with LogSoftmax
+    criterion = torch.nn.NLLLoss()
+
+    images = torch.rand(batch_size, 3, image_size, image_size, device=device)
+    labels = torch.randint(0, num_classes, (batch_size,), device=device)
+
+    reset_peak_memory(device)
+    baseline = peak_rss_mb() if device.type == 'cpu' else torch.cuda.memory_allocated(device) / 1024.0 ** 2
+
+    timings = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        with torch.cuda.amp.autocast(enabled=mixed_precision and device.type == 'cuda'):
+            loss = criterion(model(images), labels)
+        loss.backward()
+        optimizer.step()
+        synchronize(device)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'peak_memory_mb': peak_memory_mb(device) - baseline,
+        'step_time_sec': min(timings)
+    }
@@ -0,0 +1,335 @@
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from common.lazy_import import lazy_import
+from common.torch.dataset.dataset import decode_image, preprocess_image
+
+tqdm = lazy_import('tqdm', 'tqdm')
+
+"""
+    Offline bulk classification of images which are not part of a dataset csv, e.g. millions of files in a directory
+    tree or listed in a manifest.
+
+        1.  The paths are generated lazily ( os.scandir, one directory at a time, or line by line from the manifest ),
+            in a deterministic order, hence the n-th image is always the same one.
+        2.  A ProcessPoolExecutor reads, decodes and preprocesses one batch of paths per task ( test_transformation of
+            the model ). Only a fixed window of batches is in flight, the memory does not depend on the number of
+            images. The number of processes scales the decoding with the cores.
+        3.  The main process runs the batches on the inference backend ( torch or onnxruntime ) in order.
+        4.  The top-k predictions are appended to a CSV file ( flushed after every batch ) or to Parquet part files.
+            Images which can not be decoded are written with an error status.
+
+    With --resume the rows already written are counted ( the partial last line of an interrupted CSV is removed )
+    and the same number of paths is skipped.
+
+    Usage:
+        python -m common.torch.utils.bulk_inference --model resnet_38 --checkpoint resnet.pth --categories categories.csv \
+            --input /media/4TB/images --output predictions.csv --workers 8 --resume
+        python -m common.torch.utils.bulk_inference --model resnet_38 --input manifest.txt --output predictions/ --format parquet
+"""
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def iter_directory(root, extensions=IMAGE_EXTENSIONS):
+    """
+        Yields the image files below the root directory. The entries of each directory are sorted, hence the order
+        is stable between runs, and only one directory listing is kept in memory per level.
+    """
+    with os.scandir(root) as iterator:
+        entries = sorted(iterator, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_directory(entry.path, extensions)
+        elif entry.name.lower().endswith(extensions):
+            yield entry.path
+
+
+def iter_manifest(manifest):
+    """
+        Yields the paths of a manifest, one path per line ( the first column of a csv file, without header ).
+    """
+    with open(manifest) as file:
+        for line in file:
+            path = line.strip().split(',')[0]
+            if path:
+                yield path
+
+
+def iter_paths(source):
+    return iter_directory(source) if os.path.isdir(source) else iter_manifest(source)
+
+
+def prediction_columns(top_k):
+    return ['offset', 'path', 'status'] + [f'{field}_{i + 1}' for i in range(top_k) for field in ('id', 'label', 'probability')]
+
+
+class CsvPredictionWriter:
+    """
+        Appends the predictions to a single CSV file.
+    """
+
+    def __init__(self, file_name, top_k):
+        self.file_name = file_name
+        self.columns = prediction_columns(top_k)
+        self.file = None
+        self.writer = None
+
+    def offset(self):
+        """
+            Returns the number of rows already written. A partial last line ( interrupted write ) is truncated.
+        """
+        if not os.path.isfile(self.file_name):
+            return 0
+        lines, position, end = 0, 0, 0
+        with open(self.file_name, 'rb+') as file:
+            # Read in chunks, the file can be larger than the memory
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                count = chunk.count(b'\n')
+                if count:
+                    lines += count
+                    end = position + chunk.rfind(b'\n') + 1
+                position += len(chunk)
+            if end != position:
+                file.truncate(end)
+        # The first line is the header
+        return max(lines - 1, 0)
+
+    def open(self, resume):
+        append = resume and os.path.isfile(self.file_name) and os.path.getsize(self.file_name) > 0
+        self.file = open(self.file_name, 'a' if append else 'w', newline='')
+        self.writer = csv.writer(self.file)
+        if not append:
+            self.writer.writerow(self.columns)
+
+    def write(self, rows):
+        self.writer.writerows([[row.get(column, '') for column in self.columns] for row in rows])
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+class ParquetPredictionWriter:
+    """
+        Writes the predictions to Parquet part files ( part-00000.parquet, ... ) of rows_per_file rows in a directory.
+        A Parquet file can not be appended, hence a part file is written once it is full. A part is first written to
+        a temporary file and renamed, the directory only contains complete parts.
+    """
+
+    def __init__(self, directory, top_k, rows_per_file=100000):
+        self.directory = directory
+        self.columns = prediction_columns(top_k)
+        self.rows_per_file = rows_per_file
+        self.rows = []
+        self.part = 0
+
+    def parts(self):
+        return sorted(f for f in os.listdir(self.directory) if f.startswith('part-') and f.endswith('.parquet')) if os.path.isdir(self.directory) else []
+
+    def offset(self):
+        import pyarrow.parquet as pq
+
+        return sum(pq.ParquetFile(os.path.join(self.directory, part)).metadata.num_rows for part in self.parts())
+
+    def open(self, resume):
+        os.makedirs(self.directory, exist_ok=True)
+        if not resume:
+            for part in self.parts():
+                os.remove(os.path.join(self.directory, part))
+        self.part = len(self.parts())
+
+    def flush(self):
+        import pandas as pd
+
+        if not self.rows:
+            return
+        file_name = os.path.join(self.directory, f'part-{self.part:05d}.parquet')
+        pd.DataFrame(self.rows, columns=self.columns).to_parquet(f'{file_name}.tmp', index=False, engine='pyarrow')
+        os.replace(f'{file_name}.tmp', file_name)
+        self.rows = []
+        self.part += 1
+
+    def write(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.rows_per_file:
+            self.flush()
+
+    def close(self):
+        self.flush()
+
+
+# Preprocessing state of the worker processes, set by init_worker()
+_transformation = None
+_rgb_means = None
+
+
+def init_worker(name, rgb_means):
+    global _transformation, _rgb_means
+    from common.torch.utils.model_registry import get_test_transformation
+
+    # One process per core, the workers must not start a thread pool each
+    torch.set_num_threads(1)
+    import cv2
+    cv2.setNumThreads(1)
+
+    _transformation = get_test_transformation(name)
+    _rgb_means = rgb_means
+
+
+def preprocess_batch(paths):
+    """
+        Read and preprocess a batch of files in a worker. Returns the stacked images of the files which could be decoded
+        and the flag of every file.
+    """
+    images = []
+    valid = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                image = decode_image(file.read())
+            if image is None:
+                raise ValueError('can not decode the image')
+            images.append(preprocess_image(image, _transformation, _rgb_means))
+            valid.append(True)
+        except (OSError, ValueError):
+            valid.append(False)
+    return (torch.stack(images) if images else None), valid
+
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def preprocessed_batches(paths, name, rgb_means, batch_size, workers, window):
+    """
+        Yields ( paths, images, valid ) in the order of the paths, keeping at most window batches in flight.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(name, rgb_means)) as pool:
+        pending = collections.deque()
+        for batch in batched(paths, batch_size):
+            pending.append((batch, pool.submit(preprocess_batch, batch)))
+            if len(pending) >= window:
+                batch, future = pending.popleft()
+                yield (batch,) + future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield (batch,) + future.result()
+
+
+def prediction_rows(offset, paths, valid, output, categories, top_k):
+    """
+        Returns the output rows of a batch. The output only contains the rows of the valid images.
+    """
+    rows = []
+    probabilities, class_ids = (None, None)
+    if output is not None:
+        # The models end with LogSoftmax
+        probabilities, class_ids = torch.topk(output.float().exp(), k=min(top_k, output.size(1)), dim=1)
+        probabilities, class_ids = probabilities.tolist(), class_ids.tolist()
+
+    j = 0
+    for i, (path, is_valid) in enumerate(zip(paths, valid)):
+        row = {'offset': offset + i, 'path': path, 'status': 'ok' if is_valid else 'error'}
+        if is_valid:
+            for rank, (class_id, probability) in enumerate(zip(class_ids[j], probabilities[j])):
+                row[f'id_{rank + 1}'] = class_id
+                row[f'label_{rank + 1}'] = categories[class_id] if categories else ''
+                row[f'probability_{rank + 1}'] = round(probability, 6)
+            j += 1
+        rows.append(row)
+    return rows
+
+
+def run(backend, name, source, writer, categories=None, rgb_means=None, top_k=5, batch_size=64, workers=None, resume=False, limit=None):
+    """
+        Classify all the images of the source and write the predictions. Returns the number of images and the seconds.
+
+        :param backend: inference backend ( inference_backend.py )
+        :param name: name of the model in model_registry.py, used for the test_transformation
+        :param source: directory or manifest file
+        :param writer: CsvPredictionWriter or ParquetPredictionWriter
+        :param limit: stop after this many images ( including the resumed ones ), None for all
+    """
+    workers = workers or os.cpu_count()
+    offset = writer.offset() if resume else 0
+    writer.open(resume)
+    if offset:
+        print(f'Resuming after {offset} images')
+
+    paths = itertools.islice(iter_paths(source), offset, limit)
+    pbar = tqdm(initial=offset, unit=' images', smoothing=0.1)
+    images_done = 0
+    start = time.perf_counter()
+    try:
+        # Two batches per worker keep the workers busy while the model runs
+        for paths_batch, images, valid in preprocessed_batches(paths, name, rgb_means, batch_size, workers, window=2 * workers):
+            output = backend(images).cpu() if images is not None else None
+            writer.write(prediction_rows(offset, paths_batch, valid, output, categories, top_k))
+            offset += len(paths_batch)
+            images_done += len(paths_batch)
+            pbar.update(len(paths_batch))
+    finally:
+        writer.close()
+        pbar.close()
+
+    return images_done, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    from common.torch.utils.inference_backend import load_backend
+    from common.torch.utils.inference_server import load_categories
+    from common.torch.utils.model_registry import MODELS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--categories', default=None, help='categories.csv created by the image_dir_preprocessor.py')
+    parser.add_argument('--mean-rgb', default=None, help='rgb json if the model was trained with the mean RGB normalization')
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnxruntime'])
+    parser.add_argument('--onnx-file', default=None)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--input', required=True, help='image directory or manifest file ( one path per line )')
+    parser.add_argument('--output', required=True, help='csv file, or directory of the parquet part files')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--rows-per-file', type=int, default=100000, help='rows per parquet part file')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None, help='decoding processes, the number of cores by default')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads of the main process')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--resume', action='store_true', help='continue after the rows already in the output')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    rgb_means = None
+    if args.mean_rgb:
+        with open(args.mean_rgb) as file:
+            rgb_means = json.load(file)
+
+    if args.format == 'csv':
+        writer = CsvPredictionWriter(args.output, args.top_k)
+    else:
+        writer = ParquetPredictionWriter(args.output, args.top_k, args.rows_per_file)
+
+    backend = load_backend(args.backend, args.model, args.checkpoint, args.num_classes, args.onnx_file, args.device)
+    categories = load_categories(args.categories) if args.categories else None
+
+    count, seconds = run(backend, args.model, args.input, writer, categories, rgb_means, args.top_k, args.batch_size, args.workers, args.resume,
+                         args.limit)
+    print(f'{count} images in {seconds:.1f} sec, {count / max(seconds, 1e-9):.1f} images/sec')
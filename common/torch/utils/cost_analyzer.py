@@ -0,0 +1,291 @@
+import csv
+import json
+import time
+import argparse
+import importlib
+import numpy as np
+import torch
+from common.torch.utils.model_registry import create_model
+
+"""
+    This is a model cost analyzer for any torch.nn.Module. Unlike CNNBaseModel.print_network(), it does not
+    need a self.model Sequential, it registers forward hooks on every leaf module ( Conv2d, Linear, BatchNorm2d etc ),
+    hence the branching modules such as InceptionModule and ResNetBottleNeck are covered too.
+
+    For each layer it reports:
+        1.  Number of parameters
+        2.  MACs ( multiply-accumulate ) and FLOPs
+        3.  Activation memory ( bytes of the output tensor )
+        4.  Measured latency ( average of multiple forward passes )
+
+    The report can be exported to CSV/JSON along with the totals.
+    Note: torch functions invoked inside forward() ( e.g. torch.cat, the residual addition ) are not modules,
+    hence not counted. Their cost is negligible compared to the convolution layers.
+
+    Usage: python -m common.torch.utils.cost_analyzer --model ResNet.model:resnet_50 --batch-size 1 --csv resnet_50.csv
+"""
+
+
+def count_parameters(module):
+    """
+        Number of parameters owned by the module itself ( not by the children ).
+    """
+    return sum(p.numel() for p in module.parameters(recurse=False))
+
+
+def layer_macs_flops(module, inputs, output):
+    """
+        Returns the MACs and FLOPs of one forward call of a leaf module.
+
+        :param module: leaf module
+        :param inputs: tuple of input tensors
+        :param output: output tensor
+    """
+    x = inputs[0] if len(inputs) > 0 else None
+
+    if isinstance(module, torch.nn.modules.conv._ConvNd):
+        # Each output element is a dot product of in_channels/groups * kernel elements
+        kernel_ops = int(np.prod(module.kernel_size)) * (module.in_channels // module.groups)
+        macs = output.numel() * kernel_ops
+        flops = 2 * macs + (output.numel() if module.bias is not None else 0)
+    elif isinstance(module, torch.nn.Linear):
+        macs = output.numel() * module.in_features
+        flops = 2 * macs + (output.numel() if module.bias is not None else 0)
+    elif isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+        # Normalize and scale/shift can be folded into one multiply-add per element
+        macs = output.numel()
+        flops = 2 * output.numel()
+    elif isinstance(module, (torch.nn.MaxPool2d, torch.nn.AvgPool2d)):
+        kernel_size = module.kernel_size if isinstance(module.kernel_size, tuple) else (module.kernel_size, module.kernel_size)
+        macs = 0
+        flops = output.numel() * int(np.prod(kernel_size))
+    elif isinstance(module, (torch.nn.AdaptiveAvgPool2d, torch.nn.AdaptiveMaxPool2d)):
+        macs = 0
+        flops = x.numel() if x is not None else 0
+    elif isinstance(module, (torch.nn.ReLU, torch.nn.ELU, torch.nn.PReLU, torch.nn.LogSoftmax, torch.nn.Softmax, torch.nn.Dropout)):
+        # Element wise operations
+        macs = 0
+        flops = output.numel() if not (isinstance(module, torch.nn.Dropout) and not module.training) else 0
+    else:
+        # Reshape/Identity/Flatten and unknown layers
+        macs = 0
+        flops = 0
+
+    return int(macs), int(flops)
+
+
+class CostAnalyzer:
+    """
+        Collects the per layer cost of a model using forward hooks.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.records = None
+        self.handles = []
+
+    def leaf_modules(self):
+        return [(name, module) for name, module in self.model.named_modules() if len(list(module.children())) == 0]
+
+    def register_hooks(self):
+        for name, module in self.leaf_modules():
+            self.handles.append(module.register_forward_pre_hook(self.pre_hook(name)))
+            self.handles.append(module.register_forward_hook(self.post_hook(name, module)))
+
+    def remove_hooks(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def pre_hook(self, name):
+        def inner(module, inputs):
+            self.start_time[name] = time.perf_counter()
+
+        return inner
+
+    def post_hook(self, name, module):
+        def inner(module, inputs, output):
+            elapsed = (time.perf_counter() - self.start_time[name]) * 1000.0
+
+            # The same module can be invoked multiple times per forward pass, hence key by the call order
+            key = (name, self.call_index)
+            self.call_index += 1
+
+            if key not in self.records:
+                macs, flops = layer_macs_flops(module, inputs, output)
+                self.records[key] = {
+                    'layer': name,
+                    'type': module.__class__.__name__,
+                    'output_shape': list(output.shape),
+                    'parameters': count_parameters(module),
+                    'macs': macs,
+                    'flops': flops,
+                    'activation_bytes': output.numel() * output.element_size(),
+                    'latency_ms': []
+                }
+            self.records[key]['latency_ms'].append(elapsed)
+
+        return inner
+
+    def analyze(self, x, repeat=5, warmup=1):
+        """
+            Run the model and collect the per layer cost.
+
+            :param x: input tensor ( the batch size is taken from here )
+            :param repeat: number of timed forward passes, the latency is averaged
+            :param warmup: number of forward passes without recording
+            :return: list of dict, one per layer invocation
+        """
+        self.model.eval()
+        with torch.no_grad():
+            for _ in range(warmup):
+                self.model(x)
+
+            self.records = {}
+            self.start_time = {}
+            self.register_hooks()
+            try:
+                for _ in range(repeat):
+                    self.call_index = 0
+                    self.model(x)
+            finally:
+                self.remove_hooks()
+
+        rows = []
+        for record in self.records.values():
+            record = dict(record)
+            record['latency_ms'] = float(np.mean(record['latency_ms']))
+            rows.append(record)
+        return rows
+
+    @staticmethod
+    def totals(rows):
+        """
+            Returns the totals of all the layers. The parameters are counted once per module.
+        """
+        seen = set()
+        parameters = 0
+        for row in rows:
+            if row['layer'] not in seen:
+                seen.add(row['layer'])
+                parameters += row['parameters']
+
+        return {
+            'layers': len(rows),
+            'parameters': parameters,
+            'macs': sum(row['macs'] for row in rows),
+            'flops': sum(row['flops'] for row in rows),
+            'activation_bytes': sum(row['activation_bytes'] for row in rows),
+            'latency_ms': sum(row['latency_ms'] for row in rows)
+        }
+
+
+def analyze_model(model, input_size=(1, 3, 224, 224), repeat=5, device='cpu'):
+    """
+        Returns the per layer cost and the totals of a model for the given input size.
+
+        :param model: torch.nn.Module
+        :param input_size: (N, C, H, W)
+        :param repeat: number of timed forward passes
+        :param device: device to run on, the latency is meant for CPU
+    """
+    model = model.to(device)
+    x = torch.rand(*input_size, device=device)
+    rows = CostAnalyzer(model).analyze(x, repeat=repeat)
+    return rows, CostAnalyzer.totals(rows)
+
+
+def export_csv(rows, totals, file_name):
+    """
+        Export the per layer cost to a csv file. The last row contains the totals.
+    """
+    fields = ['layer', 'type', 'output_shape', 'parameters', 'macs', 'flops', 'activation_bytes', 'latency_ms']
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: row[k] for k in fields})
+        writer.writerow({'layer': 'TOTAL', 'type': '', 'output_shape': '', 'parameters': totals['parameters'], 'macs': totals['macs'],
+                         'flops': totals['flops'], 'activation_bytes': totals['activation_bytes'], 'latency_ms': totals['latency_ms']})
+
+
+def export_json(rows, totals, file_name, metadata=None):
+    """
+        Export the per layer cost and the totals to a json file.
+    """
+    with open(file_name, 'w') as file:
+        json.dump({'metadata': metadata or {}, 'totals': totals, 'layers': rows}, file, indent=2)
+
+
+def max_batch_size_for_budget(model, latency_budget_ms, image_size=224, batch_sizes=(1, 2, 4, 8, 16, 32, 64), repeat=3, device='cpu'):
+    """
+        Find the largest batch size whose forward pass fits in the latency budget. The batch sizes are tried
+        in increasing order and the search stops at the first one which exceeds the budget.
+
+        :return: tuple of ( batch size or None, list of (batch size, latency ms) )
+    """
+    model = model.to(device).eval()
+    measured = []
+    selected = None
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            x = torch.rand(batch_size, 3, image_size, image_size, device=device)
+            model(x)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                model(x)
+            latency = (time.perf_counter() - start) * 1000.0 / repeat
+            measured.append((batch_size, latency))
+            if latency > latency_budget_ms:
+                break
+            selected = batch_size
+    return selected, measured
+
+
+def load_model(path, num_classes=256):
+    """
+        Create a model from a "<module>:<function or class>" string, e.g. ResNet.model:resnet_50 or VGGNet.model:VGG
+        or from a name registered in model_registry.py, e.g. resnet_50
+    """
+    if ':' not in path:
+        return create_model(path, num_classes=num_classes)
+    module_name, attribute = path.split(':')
+    return getattr(importlib.import_module(module_name), attribute)(num_classes=num_classes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, help='<module>:<factory> or a registered name, e.g. ResNet.model:resnet_50 or resnet_50')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--csv', default=None)
+    parser.add_argument('--json', default=None)
+    parser.add_argument('--latency-budget-ms', type=float, default=None, help='find the largest batch size within this budget')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model = load_model(args.model)
+    rows, totals = analyze_model(model, input_size=(args.batch_size, 3, args.image_size, args.image_size), repeat=args.repeat)
+
+    print(f'{"Layer":<40}{"Type":<20}{"Params":>12}{"MACs":>16}{"Act. KB":>12}{"Latency (ms)":>14}')
+    for row in rows:
+        print(f'{row["layer"]:<40}{row["type"]:<20}{row["parameters"]:>12}{row["macs"]:>16}{row["activation_bytes"] / 1024:>12.1f}'
+              f'{row["latency_ms"]:>14.3f}')
+    print(f'Total: {totals["parameters"] / 1e6:.2f}M parameters, {totals["macs"] / 1e9:.3f} GMACs, {totals["flops"] / 1e9:.3f} GFLOPs, '
+          f'{totals["activation_bytes"] / 1024 ** 2:.1f} MB activations, {totals["latency_ms"]:.2f} ms')
+
+    metadata = {'model': args.model, 'batch_size': args.batch_size, 'image_size': args.image_size, 'threads': torch.get_num_threads()}
+    if args.csv:
+        export_csv(rows, totals, args.csv)
+    if args.json:
+        export_json(rows, totals, args.json, metadata)
+
+    if args.latency_budget_ms:
+        selected, measured = max_batch_size_for_budget(model, args.latency_budget_ms, image_size=args.image_size)
+        for batch_size, latency in measured:
+            print(f'batch size {batch_size:<6} {latency:>10.2f} ms')
+        print(f'Largest batch size within {args.latency_budget_ms} ms: {selected}')
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import torch
+from torch.utils.data import DataLoader
+
+"""
+    Thread and core configuration of the training / inference process and of its DataLoader workers.
+
+    By default every process uses all the cores: torch starts one intra-op thread per core in the main process and
+    OpenCV starts its own thread pool in every DataLoader worker. With 16 workers on a 16 core machine there are
+    far more busy threads than cores and the main process, which runs the model, is slowed down by the workers.
+
+    plan_threads() splits the cores available to the process ( sched_getaffinity, hence it respects taskset and the
+    container CPU set ) between the main process and the workers:
+        1.  each worker gets CPU_WORKER_THREADS cores ( torch and OpenCV threads of the worker ), the workers get at most
+            half of the cores together
+        2.  the main process gets the remaining cores as intra-op threads, hence at least half of the cores. With 16
+            workers on 16 cores the model still runs on 8 threads, the workers share the other 8 cores.
+        3.  with CPU_AFFINITY the main process and every worker are pinned to their own cores, when there are enough
+            cores. Pinning avoids the migration of the threads between cores and keeps the caches warm.
+
+    The configuration keys are:
+        CPU_THREADS         : intra-op threads of the main process, 'auto' to use plan_threads(), None to keep the torch default
+        CPU_INTEROP_THREADS : inter-op threads, None for 1. The models run their layers sequentially in eager mode.
+        CPU_WORKER_THREADS  : threads per DataLoader worker, None for 1
+        CPU_AFFINITY        : pin the main process and the workers to their cores
+
+    BaseExecutor.configure_cpu_threads() applies the plan. The CLI sweeps the settings for a model and reports the
+    images/sec of each one, running every setting in a fresh process.
+
+    Usage:
+        python -m common.torch.utils.cpu_threading --model resnet_20 --mode training --batch-size 32 --num-workers 0 2 4 \
+            --threads 2 4 8 --affinity
+"""
+
+
+def available_cores():
+    """
+        Returns the sorted list of the cores the process is allowed to run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_threads(num_workers, intra_op_threads='auto', interop_threads=None, worker_threads=None, affinity=False, cores=None):
+    """
+        Returns the thread counts and the cores of the main process and of each DataLoader worker.
+
+        :param num_workers: number of DataLoader worker processes running at the same time
+        :param intra_op_threads: threads of the main process, 'auto' ( or None ) to use the cores left by the workers, at
+                                 least half of the cores
+        :param interop_threads: inter-op threads of the main process, None for 1
+        :param worker_threads: threads of each worker, None for 1
+        :param affinity: pin the main process and the workers to separate cores
+        :param cores: cores to split, the available cores by default
+    """
+    cores = sorted(cores) if cores else available_cores()
+    worker_threads = worker_threads or 1
+
+    if intra_op_threads in (None, 'auto'):
+        # Many workers would leave a single thread to the model, which runs the heaviest part of the step
+        intra_op_threads = max(1, len(cores) - min(num_workers * worker_threads, len(cores) // 2))
+
+    plan = {
+        'cores': cores,
+        'intra_op_threads': int(intra_op_threads),
+        'interop_threads': interop_threads or 1,
+        'worker_threads': worker_threads,
+        'main_cores': None,
+        'worker_cores': None
+    }
+
+    if affinity:
+        plan['main_cores'] = cores[:intra_op_threads]
+        free_cores = cores[intra_op_threads:]
+        if len(free_cores) >= num_workers * worker_threads:
+            # Every worker gets its own cores
+            plan['worker_cores'] = [free_cores[i * worker_threads:(i + 1) * worker_threads] for i in range(num_workers)]
+        else:
+            # Not enough cores, the workers share the cores which are not used by the main process ( or all of them )
+            plan['worker_cores'] = [free_cores or cores] * num_workers
+
+    return plan
+
+
+def set_affinity(cores):
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+
+def apply_main_threads(plan, logger=None):
+    """
+        Configure the threads and the cores of the current ( main ) process. torch only allows to set the inter-op
+        threads before the first parallel work, a warning is logged if it is too late.
+    """
+    set_affinity(plan['main_cores'])
+    torch.set_num_threads(plan['intra_op_threads'])
+    try:
+        torch.set_num_interop_threads(plan['interop_threads'])
+    except RuntimeError as e:
+        message = f'The inter-op threads can not be changed anymore: {e}'
+        if logger:
+            logger.warning(message)
+        else:
+            print(message)
+
+
+class WorkerThreadInit:
+    """
+        worker_init_fn of the DataLoader limiting the torch and OpenCV threads of the worker and pinning it to its cores.
+        Defined as a class so that it can be pickled when the workers are spawned.
+    """
+
+    def __init__(self, plan, worker_init_fn=None):
+        self.worker_threads = plan['worker_threads']
+        self.worker_cores = plan['worker_cores']
+        self.worker_init_fn = worker_init_fn
+
+    def __call__(self, worker_id):
+        import cv2
+
+        if self.worker_cores:
+            set_affinity(self.worker_cores[worker_id % len(self.worker_cores)])
+        torch.set_num_threads(self.worker_threads)
+        cv2.setNumThreads(self.worker_threads)
+
+        # The worker_init_fn already set on the DataLoader
+        if self.worker_init_fn is not None:
+            self.worker_init_fn(worker_id)
+
+
+def configure_data_loader(data_loader, plan):
+    """
+        Set the WorkerThreadInit of the data loader, keeping the existing worker_init_fn. Applies to the next epoch
+        ( the workers are started for each epoch unless persistent_workers is set ).
+    """
+    if data_loader is None or data_loader.num_workers == 0:
+        return
+    existing = data_loader.worker_init_fn
+    if isinstance(existing, WorkerThreadInit):
+        existing = existing.worker_init_fn
+    data_loader.worker_init_fn = WorkerThreadInit(plan, existing)
+
+
+def run_setting(name, mode, batch_size, num_workers, threads, worker_threads, affinity, data_dir, batches):
+    """
+        Measure the images/sec of the model with one thread setting. Invoked in a fresh process through run_isolated().
+    """
+    import pandas as pd
+    from common.torch.dataset.dataset import ClassificationDataset
+    from common.torch.utils.model_registry import create_model, get_train_transformation, get_test_transformation
+
+    plan = plan_threads(num_workers, threads, None, worker_threads, affinity)
+    apply_main_threads(plan)
+    torch.manual_seed(0)
+
+    model = create_model(name)
+    transformation = get_train_transformation(name) if mode == 'training' else get_test_transformation(name)
+    dataset = ClassificationDataset(f'{data_dir}/train', pd.read_csv(f'{data_dir}/train.csv'), transformation, {'image': 'image', 'label': 'class'})
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers, drop_last=True,
+                        worker_init_fn=WorkerThreadInit(plan) if num_workers > 0 else None, persistent_workers=num_workers > 0)
+
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.001, momentum=0.9)
+    # All the models end with LogSoftmax
+    criterion = torch.nn.NLLLoss()
+    model.train(mode == 'training')
+
+    # The first batches are not timed ( worker start, allocator warm up )
+    warmup = 2
+    images, step, start = 0, 0, None
+    while step < warmup + batches:
+        for x, labels, _ in loader:
+            if step == warmup:
+                start = time.perf_counter()
+            if mode == 'training':
+                optimizer.zero_grad()
+                criterion(model(x), labels.view(-1)).backward()
+                optimizer.step()
+            else:
+                with torch.no_grad():
+                    model(x)
+            if step >= warmup:
+                images += x.size(0)
+            step += 1
+            if step >= warmup + batches:
+                break
+
+    return {'threads': plan['intra_op_threads'], 'num_workers': num_workers, 'worker_threads': plan['worker_threads'], 'affinity': affinity,
+            'images_per_sec': images / (time.perf_counter() - start)}
+
+
+if __name__ == '__main__':
+    from common.torch.utils.benchmark_util import run_isolated
+    from common.torch.utils.model_registry import MODELS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--mode', default='inference', choices=['inference', 'training'])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--num-workers', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--threads', nargs='+', default=['auto'], help="intra-op threads of the main process, 'auto' uses the cores left by the workers")
+    parser.add_argument('--worker-threads', type=int, nargs='+', default=[1])
+    parser.add_argument('--affinity', action='store_true', help='also run every setting with core pinning')
+    parser.add_argument('--data-dir', default=None, help='processed dataset with train.csv, a synthetic dataset is created if not set')
+    parser.add_argument('--batches', type=int, default=10)
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            from common.torch.dataset.synthetic_dataset import create_processed_dataset
+
+            data_dir = temp_dir
+            create_processed_dataset(data_dir, type='train', num_images=max(256, 4 * args.batch_size), seed=0)
+
+        results = []
+        for num_workers in args.num_workers:
+            for threads in [threads if threads == 'auto' else int(threads) for threads in args.threads]:
+                for worker_threads in args.worker_threads:
+                    for affinity in ([False, True] if args.affinity else [False]):
+                        result = run_isolated(run_setting, args.model, args.mode, args.batch_size, num_workers, threads, worker_threads, affinity,
+                                              data_dir, args.batches)
+                        print(f'num_workers={num_workers}, threads={result["threads"]}, worker_threads={worker_threads}, affinity={affinity}: '
+                              f'{result["images_per_sec"]:.1f} images/sec')
+                        results.append(result)
+
+    best = max(results, key=lambda r: r['images_per_sec'])
+    print(f'Best setting on {len(available_cores())} cores: {best}')
+    print(f"properties.py: config['CPU_THREADS'] = {best['threads']}, config['CPU_WORKER_THREADS'] = {best['worker_threads']}, "
+          f"config['CPU_AFFINITY'] = {best['affinity']}, DataLoader num_workers = {best['num_workers']}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'model': args.model, 'mode': args.mode, 'batch_size': args.batch_size, 'cores': available_cores(), 'results': results}, file, indent=2)
@@ -0,0 +1,300 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from common.torch.dataset.dataset import ClassificationDataset
+from common.torch.utils.base_executor import *
+from common.torch.utils.model_registry import create_model, get_test_transformation
+from common.torch.utils.quantization_util import load_checkpoint_weights
+
+"""
+    The DistillationExecutor trains a small student model ( e.g. SqueezeNet, resnet_20 ) using the soft predictions of a
+    trained teacher model ( e.g. resnet_50, VGG ) in addition to the labels ( Hinton et al. 2015 ).
+
+        loss = alpha * T^2 * KL( softmax(teacher / T) || softmax(student / T) ) + (1 - alpha) * NLL( student, label )
+
+    All the models end with LogSoftmax. The log probabilities only differ from the logits by a constant per image,
+    hence they can be used in place of the logits with the temperature.
+
+    Running the teacher every epoch costs more than training the student. When TEACHER_LOGIT_CACHE is set, the teacher
+    runs once over the training set ( without augmentation, using its own test_transformation and normalization ) and
+    its outputs are stored in a memory mapped float16 file keyed by the ClassificationDataset image id. Every epoch
+    only reads the rows of the batch. Without the cache, the teacher runs on the augmented student batch, hence both
+    models must use the same normalization.
+
+    The configuration needs the following keys in addition to the ones used by BaseExecutor:
+        STUDENT_MODEL       : name in model_registry.py, e.g. squeezenet
+        TEACHER_MODEL       : name in model_registry.py, e.g. resnet_50
+        TEACHER_CHECKPOINT  : checkpoint of the teacher
+        TEACHER_MEAN_RGB    : rgb json if the teacher was trained with the mean RGB normalization, None otherwise
+        TEACHER_LOGIT_CACHE : path ( without extension ) of the cache, None to run the teacher every epoch
+        KD_TEMPERATURE      : temperature T
+        KD_ALPHA            : weight of the distillation loss
+"""
+
+
+class TeacherLogitCache:
+    """
+        Memory mapped ( images x classes ) float16 matrix with a json file containing the image ids and the metadata.
+    """
+
+    def __init__(self, file_name):
+        self.data_file = f'{file_name}.npy'
+        self.index_file = f'{file_name}.json'
+        self.logits = None
+        self.rows = None
+
+    def is_valid(self, image_ids, metadata):
+        """
+            The cache is reused only when it is complete and was created for the same images and teacher.
+        """
+        if not os.path.isfile(self.data_file) or not os.path.isfile(self.index_file):
+            return False
+        with open(self.index_file) as file:
+            index = json.load(file)
+        return index['complete'] and index['metadata'] == metadata and sorted(index['image_ids']) == sorted(image_ids)
+
+    def create(self, image_ids, num_classes, metadata):
+        self.rows = {image_id: i for i, image_id in enumerate(image_ids)}
+        self.logits = np.lib.format.open_memmap(self.data_file, mode='w+', dtype=np.float16, shape=(len(image_ids), num_classes))
+        self.save_index(metadata, complete=False)
+
+    def save_index(self, metadata, complete):
+        image_ids = sorted(self.rows, key=self.rows.get)
+        with open(self.index_file, 'w') as file:
+            json.dump({'metadata': metadata, 'complete': complete, 'image_ids': image_ids}, file)
+
+    def finalize(self, metadata):
+        self.logits.flush()
+        self.save_index(metadata, complete=True)
+        self.open()
+
+    def open(self):
+        with open(self.index_file) as file:
+            self.rows = {image_id: i for i, image_id in enumerate(json.load(file)['image_ids'])}
+        self.logits = np.load(self.data_file, mmap_mode='r')
+
+    def write(self, image_ids, logits):
+        rows = [self.rows[str(image_id)] for image_id in image_ids]
+        self.logits[rows] = logits.detach().cpu().numpy().astype(np.float16)
+
+    def read(self, image_ids):
+        rows = [self.rows[str(image_id)] for image_id in image_ids]
+        return torch.from_numpy(self.logits[rows].astype(np.float32))
+
+
+class DistillationExecutor(BaseExecutor):
+    def __init__(self, version, data_loaders, config):
+        super().__init__(data_loaders, config)
+        self.version = version
+        self.teacher = None
+        self.logit_cache = None
+
+    def build_model(self, prediction=False):
+        """
+            This function is for instantiating the student model, optimizer, learning rate scheduler and loss function.
+        """
+
+        # initialize the student model
+        self.model = create_model(self.STUDENT_MODEL, num_classes=self.NUM_CLASSES)
+
+        if not prediction:
+            # Save model to tensor board
+            self.save_model_to_tensor_board()
+
+        self.enable_multi_gpu_training()
+
+        # Send the model to GPU
+        self.model.to(self.DEVICE)
+
+        # Adam helps faster optimization of the algorithm.
+        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=0.001, weight_decay=0.0001)
+
+        # The CosineAnnealingLR learning rate scheduler provides a better accuracy and loss.
+        self.scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(self.optimizer, T_max=5, eta_min=1e-5)
+
+        # The models end with LogSoftmax, hence NLLLoss is used for the labels
+        self.criterion = torch.nn.NLLLoss()
+
+        # Loss Average
+        self.train_loss_hist = AverageLoss()
+
+        # Enable Precision Mode
+        self.enable_precision_mode()
+
+    def build_teacher(self):
+        """
+            This function is for loading the trained teacher model. The teacher is only used for inference.
+        """
+        self.logger.info(f"Loading the teacher {self.TEACHER_MODEL} from {self.TEACHER_CHECKPOINT} ...")
+        self.teacher = load_checkpoint_weights(create_model(self.TEACHER_MODEL, num_classes=self.NUM_CLASSES), self.TEACHER_CHECKPOINT)
+        self.teacher.to(self.DEVICE).eval()
+        for parameter in self.teacher.parameters():
+            parameter.requires_grad = False
+
+    def cache_metadata(self):
+        return {'teacher': self.TEACHER_MODEL, 'checkpoint': self.TEACHER_CHECKPOINT, 'num_classes': self.NUM_CLASSES,
+                'mean_rgb': self.TEACHER_MEAN_RGB}
+
+    def build_logit_cache(self):
+        """
+            This function is for creating ( or reusing ) the memory mapped cache of the teacher outputs for every
+            training image.
+        """
+        cache = TeacherLogitCache(self.TEACHER_LOGIT_CACHE)
+        df = pd.read_csv(self.TRAIN_CSV)
+        image_ids = [str(image_id) for image_id in df['image'].unique()]
+        metadata = self.cache_metadata()
+
+        if cache.is_valid(image_ids, metadata):
+            self.logger.info(f"Using the teacher logit cache {cache.data_file} ...")
+            cache.open()
+            return cache
+
+        if self.teacher is None:
+            self.build_teacher()
+
+        # Un-augmented training images using the transformation and normalization of the teacher
+        dataset = ClassificationDataset(self.TRAIN_DIR, df, get_test_transformation(self.TEACHER_MODEL), {'image': 'image', 'label': 'class'},
+                                        training=False, mean_rgb=self.TEACHER_MEAN_RGB)
+        data_loader = DataLoader(dataset, batch_size=self.train_data_loader.batch_size, shuffle=False, num_workers=4, pin_memory=True)
+
+        self.logger.info(f"Creating the teacher logit cache {cache.data_file} ...")
+        start = time.perf_counter()
+        cache.create(image_ids, self.NUM_CLASSES, metadata)
+
+        pbar = tqdm(total=len(data_loader), bar_format='{l_bar}{bar:10}{r_bar}{bar:-10b}', unit=' batches', ncols=200)
+        with torch.no_grad():
+            for images, _, batch_image_ids in data_loader:
+                cache.write(batch_image_ids, self.teacher(images.to(self.DEVICE)))
+                pbar.update()
+        pbar.close()
+
+        cache.finalize(metadata)
+        self.logger.info(f"Teacher logit cache created in {round(time.perf_counter() - start, 1)} seconds")
+        return cache
+
+    def teacher_output(self, images, image_ids):
+        """
+            Returns the teacher output of the batch, either from the cache or by running the teacher.
+        """
+        if self.logit_cache is not None:
+            return self.logit_cache.read(image_ids).to(self.DEVICE, non_blocking=True)
+
+        with torch.no_grad():
+            return self.teacher(images)
+
+    @staticmethod
+    def distillation_loss(student_output, teacher_output, labels, temperature, alpha):
+        """
+            Combined knowledge distillation loss. The KL divergence is multiplied by T^2 so that the magnitude of its
+            gradient does not change with the temperature.
+
+            :param student_output: log probabilities ( or logits ) of the student
+            :param teacher_output: log probabilities ( or logits ) of the teacher
+            :param labels: [ batch ] class indices
+            :param temperature: softmax temperature
+            :param alpha: weight of the distillation loss
+        """
+        soft_student = F.log_softmax(student_output / temperature, dim=1)
+        soft_teacher = F.softmax(teacher_output.float() / temperature, dim=1)
+        kd_loss = F.kl_div(soft_student, soft_teacher, reduction='batchmean') * (temperature ** 2)
+        hard_loss = F.nll_loss(F.log_softmax(student_output, dim=1), labels)
+        return alpha * kd_loss + (1.0 - alpha) * hard_loss
+
+    def distillation_pass(self, images, labels, teacher_output, epoch):
+        """
+            This function is for one time forward and backward pass of the student. Same as forward_backward_pass(),
+            using the distillation loss.
+        """
+        self.optimizer.zero_grad()
+
+        output = self.model(images)
+
+        loss = self.distillation_loss(output, teacher_output, labels.view(-1), self.KD_TEMPERATURE, self.KD_ALPHA)
+
+        # Calculate the average loss
+        self.train_loss_hist.send(loss.item())
+
+        if self.FP16_MIXED:
+            with amp.scale_loss(loss, self.optimizer) as scaled_loss:
+                scaled_loss.backward()
+        else:
+            loss.backward()
+
+        self.optimizer.step()
+
+        if self.pbar.due():
+            self.pbar.set_postfix(epoch=f" {epoch}, loss= {round(self.train_loss_hist.value, 4)}")
+        self.pbar.update()
+
+        return output
+
+    def train(self):
+        """
+            This function is used for training the student network.
+        """
+
+        # Build the model
+        self.logger.info("Building model ...")
+        self.build_model()
+
+        if self.TEACHER_LOGIT_CACHE:
+            self.logit_cache = self.build_logit_cache()
+            # The teacher is not needed anymore
+            self.teacher = None
+        else:
+            self.build_teacher()
+
+        self.create_checkpoint_folder()
+
+        # Load model from checkpoint if needed
+        start_epoch = self.load_checkpoint()
+
+        # Training Loop
+        self.logger.info("Training starting now ...")
+        for epoch in range(start_epoch, self.EPOCHS + 1):
+
+            # Invoke the pre training operations
+            self.pre_training_loop_ops(epoch)
+
+            correct = 0
+            total = 0
+            for i, (images, labels, image_ids) in enumerate(self.train_data_loader):
+                images = images.to(self.DEVICE)
+                labels = labels.to(self.DEVICE)
+
+                teacher_output = self.teacher_output(images, image_ids)
+                predictions = self.distillation_pass(images, labels, teacher_output, epoch)
+
+                # Calculate Train Accuracy
+                total, correct = self.cal_prediction(predictions, labels, total, correct)
+
+            # Calculate the training accuracy
+            train_accuracy = (100 * correct) / total
+
+            # Invoke the post training operations
+            self.post_training_loop_ops(epoch, train_accuracy)
+
+            # use this for CosineAnnealingLR
+            self.scheduler.step()
+
+            # Close the progress bar
+            self.pbar.close()
+
+        self.tb_writer.close()
+
+    def prediction(self):
+        self.logger.info("Building model ...")
+        self.build_model(prediction=True)
+
+        # Load model from checkpoint
+        self.load_checkpoint()
+
+        test_accuracy, rank5_accuracy = self.prediction_accuracy()
+
+        self.logger.info(f"Test rank 1 Accuracy is {test_accuracy} and rank 5 accuracy is {rank5_accuracy}")
+        print(f"Test rank 1 Accuracy is {test_accuracy} and rank 5 accuracy is {rank5_accuracy}")
+        return test_accuracy, rank5_accuracy
@@ -0,0 +1,444 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+"""
+    Image similarity using the penultimate layer of the trained classifiers.
+
+    The models end with AdaptiveAvgPool2d -> Flatten -> Linear -> LogSoftmax ( AlexNet, ZFNet and VGG end with
+    Linear -> ReLU -> Dropout -> Linear ). The input of the last Linear layer is the embedding of the image, it is
+    captured with a forward pre hook, hence the models do not change.
+
+        1.  extract_embeddings() runs the model over a DataLoader ( shuffle=False ) and writes the L2 normalized
+            embeddings to a memory mapped ( images x dim ) float16 .npy file, with a .json file containing the image
+            ids and the metadata ( model, checkpoint, ... ). The similarity is the inner product ( cosine ).
+        2.  ExactIndex compares the queries with blocks of block_size rows of the matrix ( one matmul and one topk per
+            block, merged with the running top-k ), the matrix is never fully converted to float32.
+        3.  IVFPQIndex is the approximate index: a coarse k-means quantizer splits the embeddings in num_lists inverted
+            lists, the residual of every embedding ( embedding - list centroid ) is encoded with product quantization
+            ( num_subvectors sub-vectors of num_codes centroids each, one uint8 per sub-vector ). A query searches the
+            nprobe closest lists, the scores are q.centroid + sum of the query/code lookup table, and optionally the
+            best rerank candidates are scored exactly using the embeddings.
+
+    The CLI extracts the embeddings ( reused when they exist for the same model and checkpoint ), builds both indexes
+    and reports the recall@k against the exact search and the latency per query.
+
+    Usage:
+        python -m common.torch.utils.embedding_index --model resnet_38 --checkpoint resnet.pth --data-dir /media/4TB/datasets/caltech/processed \
+            --output /media/4TB/datasets/caltech/embeddings_resnet_38 --nprobe 1 4 16 --rerank 100
+        python -m common.torch.utils.embedding_index --model resnet_38 --checkpoint resnet.pth --data-dir ... --output ... --query image.jpg
+"""
+
+
+def penultimate_layer(model):
+    """
+        Returns the last Linear layer of the model, its input is the embedding.
+    """
+    model = model.module if isinstance(model, torch.nn.DataParallel) else model
+    linears = [module for module in model.modules() if isinstance(module, torch.nn.Linear)]
+    if not linears:
+        raise ValueError(f'{type(model).__name__} has no Linear layer, the embedding can not be extracted')
+    return linears[-1]
+
+
+class EmbeddingExtractor:
+    """
+        Runs the model and returns the input of its last Linear layer.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.layer = penultimate_layer(model)
+        self.features = None
+        self.handle = self.layer.register_forward_pre_hook(self.hook)
+
+    @property
+    def dim(self):
+        return self.layer.in_features
+
+    def hook(self, module, inputs):
+        self.features = inputs[0]
+
+    def __call__(self, images):
+        self.model(images)
+        return self.features
+
+    def close(self):
+        self.handle.remove()
+
+
+def load_embeddings(file_name):
+    """
+        Returns the memory mapped embeddings and the index ( image ids and metadata ), None if they do not exist or
+        are incomplete.
+    """
+    if not os.path.isfile(f'{file_name}.npy') or not os.path.isfile(f'{file_name}.json'):
+        return None, None
+    with open(f'{file_name}.json') as file:
+        index = json.load(file)
+    if not index['complete']:
+        return None, None
+    return np.load(f'{file_name}.npy', mmap_mode='r'), index
+
+
+def extract_embeddings(model, data_loader, file_name, device, metadata=None, normalize=True):
+    """
+        Write the embeddings of all the images of the data loader to {file_name}.npy ( float16 ) and the image ids to
+        {file_name}.json. Returns the memory mapped embeddings and the index.
+
+        :param model: trained model, in eval mode on the device
+        :param data_loader: DataLoader over a ClassificationDataset, without shuffle
+        :param normalize: L2 normalize the embeddings, the inner product is then the cosine similarity
+    """
+    extractor = EmbeddingExtractor(model)
+    embeddings = np.lib.format.open_memmap(f'{file_name}.npy', mode='w+', dtype=np.float16, shape=(len(data_loader.dataset), extractor.dim))
+    index = {'metadata': metadata or {}, 'normalized': normalize, 'complete': False, 'image_ids': []}
+
+    row = 0
+    try:
+        with torch.no_grad():
+            for images, _, image_ids in data_loader:
+                features = extractor(images.to(device)).float()
+                if normalize:
+                    features = F.normalize(features, dim=1)
+                embeddings[row:row + features.size(0)] = features.cpu().numpy().astype(np.float16)
+                index['image_ids'] += [str(image_id) for image_id in image_ids]
+                row += features.size(0)
+    finally:
+        extractor.close()
+
+    embeddings.flush()
+    index['complete'] = True
+    with open(f'{file_name}.json', 'w') as file:
+        json.dump(index, file)
+    return load_embeddings(file_name)
+
+
+def merge_topk(scores, ids, block_scores, block_ids, k):
+    """
+        Merge the running top-k with the top-k of a block.
+    """
+    scores = torch.cat([scores, block_scores], dim=1)
+    ids = torch.cat([ids, block_ids], dim=1)
+    scores, order = scores.topk(min(k, scores.size(1)), dim=1)
+    return scores, ids.gather(1, order)
+
+
+def as_queries(queries, device):
+    queries = torch.as_tensor(np.asarray(queries, dtype=np.float32), device=device)
+    return queries.unsqueeze(0) if queries.dim() == 1 else queries
+
+
+class ExactIndex:
+    def __init__(self, embeddings, block_size=65536, device='cpu', in_memory=False):
+        """
+            :param embeddings: ( images x dim ) array, e.g. the memory mapped float16 matrix
+            :param block_size: rows compared per matmul, bounds the memory used by the scores
+            :param in_memory: copy the blocks to the device once instead of reading them for every search
+        """
+        self.embeddings = embeddings
+        self.block_size = block_size
+        self.device = torch.device(device)
+        self.blocks = [self.block(start) for start in range(0, len(embeddings), block_size)] if in_memory else None
+
+    def block(self, start):
+        block = torch.from_numpy(np.ascontiguousarray(self.embeddings[start:start + self.block_size])).to(self.device)
+        # float16 matmul is only fast ( and supported everywhere ) on the GPU
+        return block if self.device.type == 'cuda' else block.float()
+
+    def search(self, queries, k=10):
+        """
+            Returns the scores and the rows of the k most similar embeddings of every query ( queries x k arrays ).
+        """
+        queries = as_queries(queries, self.device)
+        scores = torch.empty((queries.size(0), 0), device=self.device)
+        ids = torch.empty((queries.size(0), 0), dtype=torch.int64, device=self.device)
+        for i, start in enumerate(range(0, len(self.embeddings), self.block_size)):
+            block = self.blocks[i] if self.blocks is not None else self.block(start)
+            block_scores = (queries.to(block.dtype) @ block.T).float()
+            block_scores, block_ids = block_scores.topk(min(k, block_scores.size(1)), dim=1)
+            scores, ids = merge_topk(scores, ids, block_scores, block_ids + start, k)
+        return scores.cpu().numpy(), ids.cpu().numpy()
+
+
+def nearest_centroids(x, centroids, block_size=65536):
+    """
+        Returns the index of the closest centroid ( L2 ) of every row of x.
+    """
+    half_norms = 0.5 * (centroids * centroids).sum(dim=1)
+    # argmin |x - c|^2 = argmax x.c - |c|^2 / 2
+    return torch.cat([(x[i:i + block_size] @ centroids.T - half_norms).argmax(dim=1) for i in range(0, x.size(0), block_size)])
+
+
+def kmeans(x, num_clusters, iterations=20, seed=0):
+    """
+        Lloyd's k-means on the rows of x ( float32 tensor ), returns the ( num_clusters x dim ) centroids. Empty
+        clusters are restarted from random rows.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    centroids = x[torch.randperm(x.size(0), generator=generator)[:num_clusters].to(x.device)].clone()
+    for _ in range(iterations):
+        assignment = nearest_centroids(x, centroids)
+        counts = torch.bincount(assignment, minlength=num_clusters).float()
+        sums = torch.zeros_like(centroids).index_add_(0, assignment, x)
+        empty = counts == 0
+        centroids = sums / counts.clamp(min=1).unsqueeze(1)
+        if empty.any():
+            restart = torch.randint(0, x.size(0), (int(empty.sum()),), generator=generator).to(x.device)
+            centroids[empty] = x[restart]
+    return centroids
+
+
+class IVFPQIndex:
+    def __init__(self, num_lists=256, num_subvectors=16, num_codes=256, device='cpu', seed=0):
+        """
+            :param num_lists: number of inverted lists ( coarse centroids ), about 4 x sqrt(images)
+            :param num_subvectors: product quantization sub-vectors, must divide the embedding dim
+            :param num_codes: centroids per sub-vector, at most 256 ( uint8 codes )
+        """
+        self.num_lists = num_lists
+        self.num_subvectors = num_subvectors
+        self.num_codes = num_codes
+        self.device = torch.device(device)
+        self.seed = seed
+        self.coarse = None
+        self.codebooks = None
+        self.codes = None
+        self.ids = None
+        self.offsets = None
+
+    def split(self, x):
+        # ( n x dim ) -> ( n x num_subvectors x sub dim )
+        if x.size(1) % self.num_subvectors:
+            raise ValueError(f'The embedding dim {x.size(1)} is not divisible by num_subvectors={self.num_subvectors}')
+        return x.view(x.size(0), self.num_subvectors, -1)
+
+    def train(self, sample, iterations=20):
+        """
+            Train the coarse quantizer and the product quantization codebooks on a sample of the embeddings.
+        """
+        sample = torch.as_tensor(np.asarray(sample, dtype=np.float32), device=self.device)
+        self.num_lists = min(self.num_lists, sample.size(0))
+        self.num_codes = min(self.num_codes, 256, sample.size(0))
+        self.coarse = kmeans(sample, self.num_lists, iterations, self.seed)
+
+        residuals = self.split(sample - self.coarse[nearest_centroids(sample, self.coarse)])
+        self.codebooks = torch.stack([kmeans(residuals[:, j].contiguous(), self.num_codes, iterations, self.seed + j + 1)
+                                      for j in range(self.num_subvectors)])
+        return self
+
+    def encode(self, x):
+        """
+            Returns the list and the ( n x num_subvectors ) codes of the rows of x.
+        """
+        lists = nearest_centroids(x, self.coarse)
+        residuals = self.split(x - self.coarse[lists])
+        codes = torch.stack([nearest_centroids(residuals[:, j].contiguous(), self.codebooks[j]) for j in range(self.num_subvectors)], dim=1)
+        return lists, codes.to(torch.uint8)
+
+    def add(self, embeddings, block_size=65536):
+        """
+            Encode all the embeddings and sort them by inverted list. The rows of a list are contiguous, from
+            offsets[list] to offsets[list + 1].
+        """
+        lists, codes = [], []
+        for start in range(0, len(embeddings), block_size):
+            block = torch.from_numpy(np.asarray(embeddings[start:start + block_size], dtype=np.float32)).to(self.device)
+            block_lists, block_codes = self.encode(block)
+            lists.append(block_lists)
+            codes.append(block_codes)
+        lists = torch.cat(lists)
+        order = torch.argsort(lists)
+        self.ids = order
+        self.codes = torch.cat(codes)[order]
+        self.offsets = torch.cat([torch.zeros(1, dtype=torch.int64, device=self.device),
+                                  torch.bincount(lists, minlength=self.num_lists).cumsum(0)]).tolist()
+        return self
+
+    def search(self, queries, k=10, nprobe=8, embeddings=None, rerank=0):
+        """
+            Returns the scores and the rows of the k most similar embeddings of every query ( queries x k arrays,
+            row -1 when fewer than k candidates were found ).
+
+            :param nprobe: number of inverted lists searched per query
+            :param embeddings: the embeddings, needed by rerank
+            :param rerank: number of candidates scored exactly, 0 to return the approximate scores
+        """
+        queries = as_queries(queries, self.device)
+        nprobe = min(nprobe, self.num_lists)
+        half_norms = 0.5 * (self.coarse * self.coarse).sum(dim=1)
+        coarse_scores = queries @ self.coarse.T
+        probes = (coarse_scores - half_norms).topk(nprobe, dim=1).indices.tolist()
+
+        # Lookup table of the inner product of every query sub-vector with every code ( queries x num_subvectors x num_codes )
+        tables = torch.einsum('qmd,mcd->qmc', self.split(queries), self.codebooks)
+        subvectors = torch.arange(self.num_subvectors, device=self.device)
+
+        all_scores = np.full((queries.size(0), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((queries.size(0), k), -1, dtype=np.int64)
+        for q, probe in enumerate(probes):
+            rows = torch.cat([torch.arange(self.offsets[l], self.offsets[l + 1], device=self.device) for l in probe])
+            if rows.numel() == 0:
+                continue
+            sizes = torch.tensor([self.offsets[l + 1] - self.offsets[l] for l in probe], device=self.device)
+            centroid_scores = coarse_scores[q, torch.tensor(probe, device=self.device)].repeat_interleave(sizes)
+            scores = centroid_scores + tables[q][subvectors, self.codes[rows].long()].sum(dim=1)
+
+            candidates = min(max(k, rerank), rows.numel())
+            scores, order = scores.topk(candidates)
+            ids = self.ids[rows[order]]
+            if rerank and embeddings is not None:
+                ids = ids.sort().values
+                vectors = torch.from_numpy(np.asarray(embeddings[ids.cpu().numpy()], dtype=np.float32)).to(self.device)
+                scores, order = (vectors @ queries[q]).topk(min(k, candidates))
+                ids = ids[order]
+            else:
+                scores, ids = scores[:k], ids[:k]
+            all_scores[q, :scores.numel()] = scores.cpu().numpy()
+            all_ids[q, :ids.numel()] = ids.cpu().numpy()
+        return all_scores, all_ids
+
+    def save(self, file_name):
+        np.savez(file_name, coarse=self.coarse.cpu().numpy(), codebooks=self.codebooks.cpu().numpy(), codes=self.codes.cpu().numpy(),
+                 ids=self.ids.cpu().numpy(), offsets=np.asarray(self.offsets), num_subvectors=self.num_subvectors)
+
+    @classmethod
+    def load(cls, file_name, device='cpu'):
+        data = np.load(file_name)
+        index = cls(num_lists=len(data['coarse']), num_subvectors=int(data['num_subvectors']), num_codes=data['codebooks'].shape[1], device=device)
+        index.coarse = torch.from_numpy(data['coarse']).to(index.device)
+        index.codebooks = torch.from_numpy(data['codebooks']).to(index.device)
+        index.codes = torch.from_numpy(data['codes']).to(index.device)
+        index.ids = torch.from_numpy(data['ids']).to(index.device)
+        index.offsets = data['offsets'].tolist()
+        return index
+
+
+def recall_at_k(exact_ids, approx_ids, k):
+    """
+        Fraction of the exact top-k found by the approximate search.
+    """
+    return float(np.mean([len(set(e[:k]) & set(a[:k])) / k for e, a in zip(exact_ids, approx_ids)]))
+
+
+def measure(search, queries):
+    """
+        Returns the results of the batched search, its seconds, and the p50/p99 latency ( ms ) of one query at a time.
+    """
+    start = time.perf_counter()
+    scores, ids = search(queries)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(1000 * (time.perf_counter() - start))
+    return ids, batch_seconds, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def benchmark(embeddings, ivfpq, num_queries=200, k=10, nprobes=(1, 4, 16), rerank=0, device='cpu', seed=0):
+    """
+        Returns the recall@k and the latency of the exact search and of the approximate search for every nprobe. The
+        queries are random embeddings of the matrix.
+    """
+    rng = np.random.RandomState(seed)
+    queries = np.asarray(embeddings[np.sort(rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False))], dtype=np.float32)
+
+    exact = ExactIndex(embeddings, device=device, in_memory=True)
+    exact_ids, seconds, p50, p99 = measure(lambda q: exact.search(q, k), queries)
+    results = [{'index': 'exact', 'recall': 1.0, 'p50_ms': p50, 'p99_ms': p99, 'queries_per_sec': len(queries) / seconds}]
+
+    for nprobe in nprobes:
+        ids, seconds, p50, p99 = measure(lambda q: ivfpq.search(q, k, nprobe, embeddings, rerank), queries)
+        results.append({'index': f'ivfpq nprobe={nprobe}' + (f' rerank={rerank}' if rerank else ''), 'recall': recall_at_k(exact_ids, ids, k),
+                        'p50_ms': p50, 'p99_ms': p99, 'queries_per_sec': len(queries) / seconds})
+    return results
+
+
+if __name__ == '__main__':
+    import tempfile
+    from common.torch.utils.inference_backend import load_backend
+    from common.torch.utils.model_registry import MODELS, get_test_transformation
+    from common.torch.utils.quantization_util import get_data_loader
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--data-dir', default=None, help='processed dataset, a synthetic dataset is created if not set')
+    parser.add_argument('--split', default='train', help='train or val')
+    parser.add_argument('--mean-rgb', default=None, help='rgb json if the model was trained with the mean RGB normalization')
+    parser.add_argument('--output', default=None, help='path ( without extension ) of the embeddings')
+    parser.add_argument('--force', action='store_true', help='extract the embeddings even if they exist')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--num-lists', type=int, default=None, help='inverted lists, 4 x sqrt(images) by default')
+    parser.add_argument('--num-subvectors', type=int, default=16)
+    parser.add_argument('--train-size', type=int, default=100000, help='embeddings used to train the quantizers')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--rerank', type=int, default=0, help='candidates scored exactly by the approximate search')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--query', nargs='+', default=None, help='images to search, the benchmark runs if not set')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    data_dir = args.data_dir
+    if data_dir is None:
+        from common.torch.dataset.synthetic_dataset import create_processed_dataset
+
+        data_dir = temp_dir
+        create_processed_dataset(data_dir, type=args.split, num_images=2048, seed=0)
+    output = args.output or f'{temp_dir}/embeddings_{args.model}'
+
+    metadata = {'model': args.model, 'checkpoint': args.checkpoint, 'data_dir': data_dir, 'split': args.split, 'mean_rgb': args.mean_rgb}
+    embeddings, index = load_embeddings(output)
+    if args.force or embeddings is None or index['metadata'] != metadata:
+        backend = load_backend('torch', args.model, args.checkpoint, args.num_classes, device=args.device)
+        data_loader = get_data_loader(f'{data_dir}/{args.split}.csv', f'{data_dir}/{args.split}', get_test_transformation(args.model),
+                                      batch_size=args.batch_size, num_workers=args.num_workers, mean_rgb=args.mean_rgb)
+        start = time.perf_counter()
+        embeddings, index = extract_embeddings(backend.model, data_loader, output, torch.device(args.device), metadata)
+        print(f'Extracted {embeddings.shape[0]} x {embeddings.shape[1]} embeddings in {time.perf_counter() - start:.1f} sec to {output}.npy')
+
+    if args.query:
+        from common.torch.dataset.dataset import decode_image, preprocess_image
+
+        rgb_means = None
+        if args.mean_rgb:
+            with open(args.mean_rgb) as file:
+                rgb_means = json.load(file)
+        backend = load_backend('torch', args.model, args.checkpoint, args.num_classes, device=args.device)
+        extractor = EmbeddingExtractor(backend.model)
+        exact = ExactIndex(embeddings, device=args.device)
+        for path in args.query:
+            with open(path, 'rb') as file:
+                image = preprocess_image(decode_image(file.read()), get_test_transformation(args.model), rgb_means)
+            with torch.no_grad():
+                query = F.normalize(extractor(image.unsqueeze(0).to(args.device)).float(), dim=1).cpu().numpy()
+            scores, rows = exact.search(query, args.k)
+            print(path)
+            for score, row in zip(scores[0], rows[0]):
+                print(f'\t{score:.4f}  {index["image_ids"][row]}')
+    else:
+        rng = np.random.RandomState(0)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), min(args.train_size, len(embeddings)), replace=False))]
+        num_lists = args.num_lists or max(1, int(4 * np.sqrt(len(embeddings))))
+
+        start = time.perf_counter()
+        ivfpq = IVFPQIndex(num_lists, args.num_subvectors, device=args.device).train(sample).add(embeddings)
+        print(f'Built the IVF-PQ index ( {ivfpq.num_lists} lists, {args.num_subvectors} x {ivfpq.num_codes} codes ) in '
+              f'{time.perf_counter() - start:.1f} sec, {ivfpq.codes.numel() / 2 ** 20:.1f} MB of codes vs '
+              f'{embeddings.nbytes / 2 ** 20:.1f} MB of float16 embeddings')
+        ivfpq.save(f'{output}.ivfpq.npz')
+
+        results = benchmark(embeddings, ivfpq, args.queries, args.k, args.nprobe, args.rerank, args.device)
+        print(f'\n{"Index":<32}{f"Recall@{args.k}":>10}{"p50 ms":>9}{"p99 ms":>9}{"Queries/s":>11}')
+        for result in results:
+            print(f'{result["index"]:<32}{result["recall"]:>10.3f}{result["p50_ms"]:>9.2f}{result["p99_ms"]:>9.2f}{result["queries_per_sec"]:>11.1f}')
@@ -0,0 +1,341 @@
+import time
+import queue
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import torch
+from common.torch.dataset.dataset import preprocess_image
+
+"""
+    Ensemble of trained models ( e.g. AlexNet, ResNet and GoogLeNet ) using a single decoding pass.
+
+    Every test.py creates its own ClassificationDataset, hence an ensemble of three models reads and decodes every
+    image three times. The EnsembleDataset reads and decodes an image once, then creates one input per distinct
+    ( test_transformation, normalization ) of the members: 227 x 227 for AlexNet/ZFNet, 224 x 224 for the others,
+    the mean RGB subtraction or the division by 255. Members with the same preprocessing share the same input.
+
+    The members run concurrently, each one in its own worker:
+        thread  : one thread per member, on the GPU each member also uses its own CUDA stream, hence the kernels of the
+                  members overlap. torch releases the GIL during the operators.
+        process : one process per member, each with its own torch threads ( threads ), for the CPU where the members
+                  would otherwise compete for the same intra-op thread pool. The inputs are sent through shared memory.
+
+    The models end with LogSoftmax. The log probabilities only differ from the logits by a constant per image, the
+    members are combined with the weights using either the weighted average of the probabilities ( prob ) or the
+    weighted sum of the log probabilities ( log_prob, a weighted geometric mean ). The wall clock time of a batch is
+    reported along with the time of each member, it should be close to the slowest member rather than the sum.
+
+    Usage:
+        python -m common.torch.utils.ensemble --data-dir /media/4TB/datasets/caltech/processed \
+            --member alexnet:alexnet.pth:1.0:rgb_val.json resnet_38:resnet.pth:2.0 googlenet:googlenet.pth:1.0:rgb_val.json
+"""
+
+COMBINE_MODES = ['prob', 'log_prob']
+
+
+class EnsembleMember:
+    def __init__(self, model_name, checkpoint=None, weight=1.0, rgb_means=None, num_classes=256, name=None):
+        """
+            :param model_name: name in model_registry.py
+            :param checkpoint: checkpoint saved by the executor, None keeps the random weights ( benchmarks )
+            :param weight: weight of the member in the ensemble
+            :param rgb_means: dict with the R, G, B means if the model was trained with the mean RGB normalization
+        """
+        self.model_name = model_name
+        self.checkpoint = checkpoint
+        self.weight = weight
+        self.rgb_means = rgb_means
+        self.num_classes = num_classes
+        self.name = name or model_name
+
+    def preprocessing_key(self):
+        """
+            Members with the same key ( test_transformation of the model package and normalization ) share the same input.
+        """
+        from common.torch.utils.model_registry import MODELS
+
+        return MODELS[self.model_name]['package'], json.dumps(self.rgb_means, sort_keys=True)
+
+
+def preprocessing_groups(members):
+    """
+        Returns the distinct ( transformation package, rgb means ) of the members and the input index of every member.
+    """
+    keys = []
+    inputs = []
+    for member in members:
+        key = member.preprocessing_key()
+        if key not in keys:
+            keys.append(key)
+        inputs.append(keys.index(key))
+    return keys, inputs
+
+
+class EnsembleDataset(torch.utils.data.Dataset):
+    """
+        Same images and labels as the ClassificationDataset, returns the list of the inputs of the members
+        ( see preprocessing_groups() ) computed from a single decoded image.
+    """
+
+    def __init__(self, image_dir, data_frame, members, fields={'image': 'image', 'label': 'class'}):
+        from common.torch.utils.model_registry import import_attribute
+
+        super().__init__()
+        self.image_dir = image_dir
+        self.image_ids = data_frame[fields['image']].unique()
+        # Avoid filtering the data frame for every image
+        self.labels = dict(zip(data_frame[fields['image']], data_frame[fields['label']]))
+
+        keys, _ = preprocessing_groups(members)
+        self.preprocessing = [(import_attribute(f'{package}.transformation:test_transformation'), json.loads(rgb_means))
+                              for package, rgb_means in keys]
+
+    def __len__(self):
+        return self.image_ids.shape[0]
+
+    def __getitem__(self, index):
+        image_id = self.image_ids[index]
+        label = torch.as_tensor([self.labels[image_id]], dtype=torch.int64)
+
+        # Decoded once for all the members
+        image = cv2.imread(f'{self.image_dir}/{image_id}', cv2.IMREAD_COLOR)
+        inputs = [preprocess_image(image, transformation, rgb_means) for transformation, rgb_means in self.preprocessing]
+
+        return inputs, label, image_id
+
+
+class ThreadWorker:
+    """
+        Runs a member in its own thread ( and CUDA stream ).
+    """
+
+    def __init__(self, member, device):
+        from common.torch.utils.inference_backend import load_backend
+
+        self.device = torch.device(device)
+        self.backend = load_backend('torch', member.model_name, member.checkpoint, member.num_classes, device=self.device)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.stream = torch.cuda.Stream(device=self.device) if self.device.type == 'cuda' else None
+
+    def run(self, images):
+        start = time.perf_counter()
+        if self.stream is not None:
+            with torch.cuda.stream(self.stream):
+                output = self.backend(images.to(self.device, non_blocking=True))
+            self.stream.synchronize()
+        else:
+            output = self.backend(images)
+        return output, time.perf_counter() - start
+
+    def submit(self, images):
+        return self.pool.submit(self.run, images)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def member_process(requests, results, model_name, checkpoint, num_classes, device, threads):
+    """
+        Main loop of a member process. Runs the batches until it receives None.
+    """
+    from common.torch.utils.inference_backend import load_backend
+
+    if threads:
+        torch.set_num_threads(threads)
+    backend = load_backend('torch', model_name, checkpoint, num_classes, device=device)
+    results.put('ready')
+    while True:
+        images = requests.get()
+        if images is None:
+            break
+        start = time.perf_counter()
+        output = backend(images).cpu()
+        results.put((output, time.perf_counter() - start))
+
+
+def receive(results, process, timeout=1.0):
+    """
+        Returns the next result of a member process. Raises an error if the process died ( e.g. killed by the OOM killer
+        or failed to load the model ) instead of waiting forever.
+
+        :param timeout: seconds between two checks of the process
+    """
+    while True:
+        try:
+            return results.get(timeout=timeout)
+        except queue.Empty:
+            if not process.is_alive():
+                # The result may have been sent right before the process exited
+                try:
+                    return results.get(timeout=timeout)
+                except queue.Empty:
+                    raise RuntimeError(f'The member process {process.name} exited with code {process.exitcode}')
+
+
+class FutureResult:
+    def __init__(self, results, process):
+        self.results = results
+        self.process = process
+
+    def result(self):
+        return receive(self.results, self.process)
+
+
+class ProcessWorker:
+    """
+        Runs a member in its own process, the model is created in the process.
+    """
+
+    def __init__(self, member, device, threads=None):
+        context = torch.multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=member_process, args=(self.requests, self.results, member.model_name, member.checkpoint,
+                                                                    member.num_classes, str(device), threads), daemon=True)
+        self.process.start()
+        # Wait for the model, so that the loading time is not measured
+        receive(self.results, self.process)
+
+    def submit(self, images):
+        self.requests.put(images)
+        return FutureResult(self.results, self.process)
+
+    def close(self):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join()
+
+
+class EnsemblePredictor:
+    def __init__(self, members, mode='thread', combine='prob', device='cpu', threads=None):
+        """
+            :param members: list of EnsembleMember
+            :param mode: thread or process, see above
+            :param combine: prob or log_prob
+            :param threads: torch threads of every member process
+        """
+        if combine not in COMBINE_MODES:
+            raise ValueError(f"Unknown combine mode {combine}, available modes are {', '.join(COMBINE_MODES)}")
+        self.members = members
+        self.combine = combine
+        self.device = torch.device(device)
+        _, self.inputs = preprocessing_groups(members)
+
+        weights = torch.tensor([member.weight for member in members], dtype=torch.float32)
+        self.weights = weights / weights.sum()
+
+        if mode == 'process':
+            self.workers = [ProcessWorker(member, device, threads) for member in members]
+        else:
+            self.workers = [ThreadWorker(member, device) for member in members]
+
+    def combine_outputs(self, outputs):
+        """
+            Returns the log probabilities of the ensemble from the log probabilities of the members.
+        """
+        outputs = torch.stack([output.float().to(self.device) for output in outputs])
+        weights = self.weights.to(self.device).view(-1, 1, 1)
+        if self.combine == 'log_prob':
+            return (weights * outputs).sum(dim=0)
+        # log( sum w * p ), computed from the log probabilities
+        return torch.logsumexp(outputs + weights.log(), dim=0)
+
+    def predict(self, inputs):
+        """
+            Returns the log probabilities of the ensemble, the outputs of the members and the seconds of every member.
+
+            :param inputs: list of batches returned by the EnsembleDataset, one per preprocessing group
+        """
+        futures = [worker.submit(inputs[i]) for worker, i in zip(self.workers, self.inputs)]
+        results = [future.result() for future in futures]
+        outputs = [output for output, _ in results]
+        return self.combine_outputs(outputs), outputs, [seconds for _, seconds in results]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+def evaluate(predictor, data_loader):
+    """
+        Returns the top-1 accuracy ( in percentage ) of the ensemble and of every member, and the timings in seconds:
+        the wall clock time of the ensemble, the time of every member, and the sum of the slowest member per batch.
+    """
+    correct = 0
+    member_correct = np.zeros(len(predictor.members))
+    member_seconds = np.zeros(len(predictor.members))
+    slowest = 0.0
+    total = 0
+    start = time.perf_counter()
+    for inputs, labels, _ in data_loader:
+        labels = labels.view(-1)
+        ensemble, outputs, seconds = predictor.predict(inputs)
+
+        correct += (ensemble.argmax(dim=1).cpu() == labels).sum().item()
+        for i, output in enumerate(outputs):
+            member_correct[i] += (output.argmax(dim=1).cpu() == labels).sum().item()
+        member_seconds += seconds
+        slowest += max(seconds)
+        total += labels.size(0)
+
+    return {'accuracy': 100.0 * correct / total, 'member_accuracy': (100.0 * member_correct / total).tolist(),
+            'seconds': time.perf_counter() - start, 'member_seconds': member_seconds.tolist(), 'slowest_seconds': slowest, 'images': total}
+
+
+def parse_member(value, num_classes=256):
+    """
+        MODEL[:CHECKPOINT[:WEIGHT[:MEAN_RGB]]], e.g. alexnet:alexnet.pth:1.0:rgb_val.json
+    """
+    parts = value.split(':')
+    rgb_means = None
+    if len(parts) > 3 and parts[3]:
+        with open(parts[3]) as file:
+            rgb_means = json.load(file)
+    return EnsembleMember(parts[0], checkpoint=(parts[1] or None) if len(parts) > 1 else None, weight=float(parts[2]) if len(parts) > 2 else 1.0,
+                          rgb_means=rgb_means, num_classes=num_classes)
+
+
+if __name__ == '__main__':
+    import pandas as pd
+    from torch.utils.data import DataLoader
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--member', nargs='+', required=True, help='MODEL[:CHECKPOINT[:WEIGHT[:MEAN_RGB]]]')
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--data-dir', default=None, help='processed dataset with val.csv, a synthetic dataset is created if not set')
+    parser.add_argument('--mode', default='thread', choices=['thread', 'process'])
+    parser.add_argument('--combine', default='prob', choices=COMBINE_MODES)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads of every member process')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--num-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        import tempfile
+        from common.torch.dataset.synthetic_dataset import create_processed_dataset
+
+        data_dir = tempfile.mkdtemp()
+        create_processed_dataset(data_dir, type='val', num_images=512, seed=0)
+
+    members = [parse_member(value, args.num_classes) for value in args.member]
+    dataset = EnsembleDataset(f'{data_dir}/val', pd.read_csv(f'{data_dir}/val.csv'), members)
+    data_loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers, pin_memory=True)
+    print(f'{len(members)} members, {len(dataset.preprocessing)} distinct inputs per decoded image')
+
+    predictor = EnsemblePredictor(members, args.mode, args.combine, args.device, args.threads)
+    try:
+        with torch.no_grad():
+            result = evaluate(predictor, data_loader)
+    finally:
+        predictor.close()
+
+    print(f'\n{"Member":<16}{"Weight":>8}{"Top-1":>8}{"Seconds":>9}')
+    for member, accuracy, seconds in zip(members, result['member_accuracy'], result['member_seconds']):
+        print(f'{member.name:<16}{member.weight:>8.2f}{accuracy:>8.2f}{seconds:>9.2f}')
+    print(f'{"ensemble":<16}{"":>8}{result["accuracy"]:>8.2f}{result["seconds"]:>9.2f}')
+    print(f'\n{result["images"] / result["seconds"]:.1f} images/sec, ensemble {result["seconds"]:.2f} sec ( including the data loading ) vs '
+          f'slowest member {result["slowest_seconds"]:.2f} sec and sum of the members {sum(result["member_seconds"]):.2f} sec')
@@ -0,0 +1,82 @@
+from common.torch.utils.model_registry import import_attribute
+
+"""
+    Registry of the executors used by the launcher ( launcher.py ). As in model_registry.py the entries are plain
+    strings and the modules are imported only when the executor is created, hence the launcher only imports the
+    executor, the model and the properties of the selected entry.
+
+    Each entry contains:
+        executor        : "<module>:<class>" of the executor
+        properties      : module of the default config ( properties.py of the model folder )
+        model           : name in model_registry.py, used for the transformations and the tuned DataLoader settings
+        mean_rgb        : True if the model is trained with the mean RGB normalization ( rgb_val.json of INPUT_DIR )
+        batch_size      : default batch size of the training DataLoader ( before the tuned settings )
+        num_workers     : default workers of the training DataLoader ( before the tuned settings )
+        val_batch_size  : batch size of the validation and test DataLoaders
+        overrides       : config values applied on top of the properties, formatted with the config ( optional )
+        commands        : launcher commands supported by the executor, all of them by default ( optional ). The
+                          SweepExecutor only trains, it has no build_model() or prediction().
+
+    The defaults are the ones of the train.py/test.py of the model folder.
+"""
+
+EXECUTORS = {
+    'alexnet': {'executor': 'AlexNet.executor:Executor', 'properties': 'AlexNet.properties', 'model': 'alexnet', 'mean_rgb': True,
+                'batch_size': 256, 'num_workers': 16, 'val_batch_size': 16},
+    'zfnet': {'executor': 'ZFNet.executor:Executor', 'properties': 'ZFNet.properties', 'model': 'zfnet', 'mean_rgb': True,
+              'batch_size': 256, 'num_workers': 16, 'val_batch_size': 16},
+    'vggnet': {'executor': 'VGGNet.executor:Executor', 'properties': 'VGGNet.properties', 'model': 'vgg_b', 'mean_rgb': True,
+               'batch_size': 32, 'num_workers': 8, 'val_batch_size': 8},
+    'googlenet': {'executor': 'GoogLeNet.executor:Executor', 'properties': 'GoogLeNet.properties', 'model': 'googlenet', 'mean_rgb': True,
+                  'batch_size': 128, 'num_workers': 16, 'val_batch_size': 16},
+    'resnet': {'executor': 'ResNet.executor:Executor', 'properties': 'ResNet.properties', 'model': 'resnet_38', 'mean_rgb': False,
+               'batch_size': 128, 'num_workers': 16, 'val_batch_size': 64},
+    'squeezenet': {'executor': 'SqueezeNet.executor:Executor', 'properties': 'SqueezeNet.properties', 'model': 'squeezenet', 'mean_rgb': True,
+                   'batch_size': 128, 'num_workers': 16, 'val_batch_size': 64},
+    'densenet': {'executor': 'DenseNet.executor:Executor', 'properties': 'DenseNet.properties', 'model': 'densenet_121', 'mean_rgb': True,
+                 'batch_size': 768, 'num_workers': 16, 'val_batch_size': 64},
+    'squeezenet_distilled': {'executor': 'common.torch.utils.distillation_executor:DistillationExecutor', 'properties': 'SqueezeNet.properties',
+                             'model': 'squeezenet', 'mean_rgb': True, 'batch_size': 128, 'num_workers': 16, 'val_batch_size': 64,
+                             'overrides': {'PROJECT_NAME': '{PROJECT_NAME}_distilled_{TEACHER_MODEL}'}},
+    'resnet_sweep': {'executor': 'common.torch.utils.sweep_executor:SweepExecutor', 'properties': 'ResNet.properties', 'model': 'resnet_38',
+                     'mean_rgb': False, 'batch_size': 128, 'num_workers': 16, 'val_batch_size': 64,
+                     'overrides': {'PROJECT_NAME': '{PROJECT_NAME}_sweep'}, 'commands': ['train']},
+}
+
+
+def register_executor(name, executor, properties, model, mean_rgb=False, batch_size=64, num_workers=4, val_batch_size=64, overrides=None,
+                      commands=None):
+    """
+        Register an executor, e.g. a new model folder, without changing this file.
+    """
+    EXECUTORS[name] = {'executor': executor, 'properties': properties, 'model': model, 'mean_rgb': mean_rgb, 'batch_size': batch_size,
+                       'num_workers': num_workers, 'val_batch_size': val_batch_size, 'overrides': overrides or {}}
+    if commands:
+        EXECUTORS[name]['commands'] = commands
+
+
+def get_entry(name):
+    if name not in EXECUTORS:
+        raise ValueError(f"Unknown executor {name}, available executors are {', '.join(EXECUTORS.keys())}")
+    return EXECUTORS[name]
+
+
+def get_commands(name, default):
+    """
+        Returns the launcher commands supported by a registered entry.
+    """
+    return get_entry(name).get('commands', default)
+
+
+def get_executor_class(name):
+    """
+        Returns the executor class of a registered entry, its module is imported here.
+    """
+    return import_attribute(get_entry(name)['executor'])
+
+
+def get_default_config(name):
+    """
+        Returns a copy of the config of the properties.py of a registered entry.
+    """
+    return dict(import_attribute(f"{get_entry(name)['properties']}:config"))
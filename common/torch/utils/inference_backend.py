@@ -0,0 +1,119 @@
+import torch
+
+"""
+    Inference backends used by BaseExecutor.prediction_accuracy() and the deployment scripts. A backend takes a
+    batch of images ( torch tensor, N x C x H x W ) and returns the model output ( torch tensor, N x num classes ),
+    hence the top-1/top-5 calculation is the same irrespective of the runtime.
+
+        torch       : eager PyTorch model ( fp32 or quantized )
+        onnxruntime : ONNX model exported using onnx_export.py, does not need the model code or the training stack
+"""
+
+
+class InferenceBackend:
+    name = None
+
+    def __call__(self, images):
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    name = 'torch'
+
+    def __init__(self, model, device=None):
+        self.model = model
+        self.device = device
+
+    def __call__(self, images):
+        self.model.eval()
+        with torch.no_grad():
+            if self.device is not None:
+                images = images.to(self.device)
+            return self.model(images)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    name = 'onnxruntime'
+
+    def __init__(self, onnx_file, providers=None, intra_op_num_threads=None):
+        """
+            :param onnx_file: file created by onnx_export.export_onnx()
+            :param providers: ONNX Runtime execution providers, by default CUDA ( if available ) and CPU
+            :param intra_op_num_threads: number of threads used by the CPU provider, None lets ONNX Runtime decide
+        """
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_num_threads:
+            options.intra_op_num_threads = intra_op_num_threads
+
+        if providers is None:
+            providers = [p for p in ['CUDAExecutionProvider', 'CPUExecutionProvider'] if p in onnxruntime.get_available_providers()]
+
+        self.session = onnxruntime.InferenceSession(onnx_file, sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def __call__(self, images):
+        output = self.session.run([self.output_name], {self.input_name: images.detach().cpu().numpy()})[0]
+        return torch.from_numpy(output)
+
+
+def create_backend(name, model=None, onnx_file=None, device=None, **kwargs):
+    """
+        Create an inference backend by name.
+
+        :param name: torch or onnxruntime
+        :param model: torch.nn.Module, needed for the torch backend
+        :param onnx_file: exported ONNX model, needed for the onnxruntime backend
+        :param device: device of the torch backend
+    """
+    if name == 'torch':
+        return TorchBackend(model, device)
+    elif name == 'onnxruntime':
+        return OnnxRuntimeBackend(onnx_file, **kwargs)
+    raise ValueError(f'Unknown inference backend {name}, available backends are torch, onnxruntime')
+
+
+def load_backend(name, model_name=None, checkpoint=None, num_classes=256, onnx_file=None, device='cpu'):
+    """
+        Create the backend of a registered model loaded from a training checkpoint, or of an exported ONNX model.
+        Used by the serving and the bulk inference scripts.
+
+        :param name: torch or onnxruntime
+        :param model_name: name in model_registry.py, needed for the torch backend
+        :param checkpoint: checkpoint saved by the executor, None keeps the random weights ( benchmarks )
+    """
+    if name != 'torch':
+        return create_backend(name, onnx_file=onnx_file)
+
+    from common.torch.utils.model_registry import create_model
+
+    model = create_model(model_name, num_classes=num_classes)
+    if checkpoint:
+        from common.torch.utils.quantization_util import load_checkpoint_weights
+
+        model = load_checkpoint_weights(model, checkpoint)
+    device = torch.device(device)
+    model.to(device).eval()
+    return create_backend('torch', model=model, device=device)
+
+
+def evaluate(backend, data_loader):
+    """
+        Returns the top-1 and top-5 accuracy ( in percentage ) of the backend on the data loader.
+    """
+    correct = 0
+    correct_rank5 = 0
+    total = 0
+    for images, labels, _ in data_loader:
+        predictions = backend(images).cpu()
+        labels = labels.view(-1)
+
+        _, predicted = torch.topk(predictions, k=5, dim=1)
+        correct += (predicted[:, 0] == labels).sum().item()
+        correct_rank5 += (predicted == labels.view(-1, 1)).any(dim=1).sum().item()
+        total += labels.size(0)
+
+    return 100.0 * correct / total, 100.0 * correct_rank5 / total
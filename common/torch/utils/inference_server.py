@@ -0,0 +1,392 @@
+import json
+import time
+import asyncio
+import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import torch
+from common.torch.dataset.dataset import decode_image, preprocess_image
+
+"""
+    asyncio image classification service with dynamic batching, for any model of the model_registry.py.
+
+        1.  The encoded image of a request is decoded and preprocessed in a thread ( or process ) pool, using the
+            test_transformation of the model and the same normalization as the ClassificationDataset.
+        2.  The preprocessed images are put in a queue. The DynamicBatcher takes the first waiting image and adds
+            the next ones until the batch has max_batch_size images or max_wait_ms has passed since the first one,
+            hence a single request waits at most max_wait_ms and the batch size grows with the load.
+        3.  The batch runs on the inference backend ( torch or onnxruntime ) in a dedicated thread, the event loop
+            keeps accepting requests while the model runs.
+        4.  The top-k labels are read from the categories.csv created by the image_dir_preprocessor.py.
+
+    ServiceStats counts the requests, images, batches and errors and keeps the latency of the recent requests
+    ( end to end, queue wait and inference ) for the percentiles.
+
+    A minimal HTTP/1.1 server ( asyncio streams, no dependency ) exposes the service:
+        POST /predict?k=5   body: encoded image    ->  {"predictions": [{"id": 3, "label": "...", "probability": 0.91}, ...]}
+        GET  /stats                                ->  counters and latency percentiles
+        GET  /health
+
+    Usage:
+        python -m common.torch.utils.inference_server --model resnet_38 --checkpoint resnet.pth --categories categories.csv --port 8080
+        curl --data-binary @image.jpg "http://localhost:8080/predict?k=5"
+
+        # In process load test with synthetic images
+        python -m common.torch.utils.inference_server --model resnet_20 --benchmark 512 --concurrency 32
+"""
+
+
+def load_categories(csv_path):
+    """
+        Returns the list of the labels indexed by the class id, from the categories.csv ( id, label ).
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    labels = [None] * (int(df['id'].max()) + 1)
+    for class_id, label in zip(df['id'], df['label']):
+        labels[int(class_id)] = label
+    return labels
+
+
+class ServiceStats:
+    """
+        Counters and the latency of the last window requests, in milliseconds.
+    """
+
+    def __init__(self, window=10000):
+        self.start_time = time.perf_counter()
+        self.counters = collections.Counter()
+        self.latency = collections.deque(maxlen=window)
+        self.queue_wait = collections.deque(maxlen=window)
+        self.inference = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+
+    def record_batch(self, batch_size, inference_ms, queue_wait_ms):
+        self.counters['batches'] += 1
+        self.counters['images'] += batch_size
+        self.batch_sizes.append(batch_size)
+        self.inference.append(inference_ms)
+        self.queue_wait.extend(queue_wait_ms)
+
+    def record_request(self, latency_ms):
+        self.counters['requests'] += 1
+        self.latency.append(latency_ms)
+
+    def record_error(self):
+        self.counters['errors'] += 1
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return {}
+        values = np.array(values)
+        return {f'p{p}': float(np.percentile(values, p)) for p in (50, 90, 99)}
+
+    def summary(self):
+        uptime = time.perf_counter() - self.start_time
+        return {
+            'uptime_sec': uptime,
+            'counters': dict(self.counters),
+            'images_per_sec': self.counters['images'] / uptime if uptime > 0 else 0.0,
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            'latency_ms': self.percentiles(self.latency),
+            'queue_wait_ms': self.percentiles(self.queue_wait),
+            'inference_ms': self.percentiles(self.inference)
+        }
+
+
+class DynamicBatcher:
+    """
+        Groups the queued images in batches bounded by max_batch_size and max_wait_ms and runs them on the backend.
+    """
+
+    def __init__(self, backend, max_batch_size=32, max_wait_ms=5.0, stats=None):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = stats or ServiceStats()
+        # Created by start(), before Python 3.10 the queue is bound to the loop running when it is created
+        self.queue = None
+        # One thread, the batches run one after the other
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, image):
+        """
+            Queue one preprocessed image ( C x H x W tensor ) and return the model output of the image.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image, future, time.perf_counter()))
+        return await future
+
+    async def next_batch(self):
+        items = [await self.queue.get()]
+        deadline = items[0][2] + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                # Take the images which are already waiting without waiting for more
+                while len(items) < self.max_batch_size and not self.queue.empty():
+                    items.append(self.queue.get_nowait())
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self.next_batch()
+            start = time.perf_counter()
+            try:
+                images = torch.stack([image for image, _, _ in items])
+                output = await loop.run_in_executor(self.executor, lambda: self.backend(images).float().cpu())
+            except Exception as e:
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats.record_batch(len(items), (time.perf_counter() - start) * 1000.0, [(start - queued) * 1000.0 for _, _, queued in items])
+            for i, (_, future, _) in enumerate(items):
+                if not future.done():
+                    future.set_result(output[i])
+
+
+# Preprocessing state of the worker processes, set by init_preprocess_worker()
+_worker_transformation = None
+_worker_rgb_means = None
+
+
+def init_preprocess_worker(name, rgb_means):
+    global _worker_transformation, _worker_rgb_means
+    from common.torch.utils.model_registry import get_test_transformation
+
+    torch.set_num_threads(1)
+    _worker_transformation = get_test_transformation(name)
+    _worker_rgb_means = rgb_means
+
+
+def preprocess_request(data, transformation, rgb_means):
+    """
+        Decode and preprocess the body of a request. Raises a ValueError if the body is not an image, the client gets
+        a 400 Bad Request instead of the open cv error.
+    """
+    image = decode_image(data)
+    if image is None:
+        raise ValueError('the body can not be decoded as an image')
+    return preprocess_image(image, transformation, rgb_means)
+
+
+def preprocess_in_worker(data):
+    return preprocess_request(data, _worker_transformation, _worker_rgb_means)
+
+
+class InferenceService:
+    def __init__(self, backend, transformation, categories=None, max_batch_size=32, max_wait_ms=5.0, preprocess_workers=4,
+                 rgb_means=None, process_pool_model=None):
+        """
+            :param backend: inference backend ( inference_backend.py ), returns the LogSoftmax output of the model
+            :param transformation: test_transformation of the model
+            :param categories: list of labels indexed by class id, None to return the ids only
+            :param max_batch_size: max images per batch
+            :param max_wait_ms: max time the first image of a batch waits for other images
+            :param preprocess_workers: threads ( or processes ) decoding and preprocessing the images
+            :param rgb_means: dict with the R, G, B means if the model was trained with the mean RGB normalization
+            :param process_pool_model: model name, preprocess in processes instead of threads ( the workers import
+                                       the transformation of the model )
+        """
+        self.transformation = transformation
+        self.categories = categories
+        self.rgb_means = rgb_means
+        self.stats = ServiceStats()
+        self.batcher = DynamicBatcher(backend, max_batch_size, max_wait_ms, self.stats)
+        if process_pool_model:
+            self.pool = ProcessPoolExecutor(max_workers=preprocess_workers, initializer=init_preprocess_worker,
+                                            initargs=(process_pool_model, rgb_means))
+            self.preprocess_function = preprocess_in_worker
+        else:
+            # open cv and the albumentations transformations release the GIL for most of the work
+            self.pool = ThreadPoolExecutor(max_workers=preprocess_workers)
+            self.preprocess_function = lambda data: preprocess_request(data, self.transformation, self.rgb_means)
+
+    def start(self):
+        self.stats.start_time = time.perf_counter()
+        self.batcher.start()
+
+    async def stop(self):
+        await self.batcher.stop()
+        self.pool.shutdown(wait=True)
+
+    def top_k(self, output, k):
+        # The models end with LogSoftmax
+        probabilities, class_ids = torch.topk(output.exp(), k=min(k, output.size(0)))
+        return [{'id': int(class_id), 'label': self.categories[class_id] if self.categories else None, 'probability': float(probability)}
+                for probability, class_id in zip(probabilities.tolist(), class_ids.tolist())]
+
+    async def predict(self, data, k=5):
+        """
+            Returns the top-k predictions of an encoded image.
+        """
+        start = time.perf_counter()
+        try:
+            image = await asyncio.get_running_loop().run_in_executor(self.pool, self.preprocess_function, data)
+            output = await self.batcher.submit(image)
+        except Exception:
+            self.stats.record_error()
+            raise
+        predictions = self.top_k(output, k)
+        self.stats.record_request((time.perf_counter() - start) * 1000.0)
+        return predictions
+
+
+class HttpServer:
+    """
+        Minimal HTTP/1.1 front end of the InferenceService, one request per connection.
+    """
+
+    def __init__(self, service, host='127.0.0.1', port=8080, max_body_mb=20):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.max_body = int(max_body_mb * 1024 * 1024)
+
+    @staticmethod
+    async def respond(writer, status, body):
+        payload = json.dumps(body).encode()
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode())
+        writer.write(payload)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+            if not request_line:
+                return
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            url = urlparse(target)
+            if method == 'GET' and url.path == '/health':
+                await self.respond(writer, '200 OK', {'status': 'ok'})
+            elif method == 'GET' and url.path == '/stats':
+                await self.respond(writer, '200 OK', self.service.stats.summary())
+            elif method == 'POST' and url.path == '/predict':
+                length = int(headers.get('content-length', 0))
+                if length <= 0 or length > self.max_body:
+                    await self.respond(writer, '400 Bad Request', {'error': 'the body must contain an encoded image'})
+                    return
+                data = await reader.readexactly(length)
+                k = int(parse_qs(url.query).get('k', ['5'])[0])
+                try:
+                    predictions = await self.service.predict(data, k)
+                except ValueError as e:
+                    # Invalid image sent by the client
+                    await self.respond(writer, '400 Bad Request', {'error': str(e)})
+                    return
+                except Exception as e:
+                    await self.respond(writer, '500 Internal Server Error', {'error': str(e)})
+                    return
+                await self.respond(writer, '200 OK', {'predictions': predictions})
+            else:
+                await self.respond(writer, '404 Not Found', {'error': f'{method} {url.path} not found'})
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        self.service.start()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f'Serving on http://{self.host}:{self.port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.service.stop()
+
+
+async def run_benchmark(service, images, concurrency):
+    """
+        Send the encoded images to the service with the given number of concurrent clients and return the stats.
+    """
+    service.start()
+    queue = collections.deque(images)
+
+    async def client():
+        while queue:
+            await service.predict(queue.popleft())
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    summary = service.stats.summary()
+    await service.stop()
+    return summary
+
+
+def create_service(args):
+    from common.torch.utils.inference_backend import load_backend
+    from common.torch.utils.model_registry import get_test_transformation
+
+    backend = load_backend(args.backend, args.model, args.checkpoint, args.num_classes, args.onnx_file, args.device)
+    categories = load_categories(args.categories) if args.categories else None
+    rgb_means = None
+    if args.mean_rgb:
+        with open(args.mean_rgb) as file:
+            rgb_means = json.load(file)
+
+    return InferenceService(backend, get_test_transformation(args.model), categories, args.max_batch_size, args.max_wait_ms, args.workers, rgb_means,
+                            process_pool_model=args.model if args.process_pool else None)
+
+
+if __name__ == '__main__':
+    from common.torch.utils.model_registry import MODELS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--categories', default=None, help='categories.csv created by the image_dir_preprocessor.py')
+    parser.add_argument('--mean-rgb', default=None, help='rgb json if the model was trained with the mean RGB normalization')
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnxruntime'])
+    parser.add_argument('--onnx-file', default=None)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=4, help='preprocessing threads or processes')
+    parser.add_argument('--process-pool', action='store_true', help='preprocess in processes instead of threads')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--benchmark', type=int, default=None, metavar='N', help='send N synthetic images in process instead of serving')
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    service = create_service(args)
+    if args.benchmark:
+        import cv2
+        from common.torch.dataset.synthetic_dataset import random_image
+
+        rng = np.random.RandomState(0)
+        images = [cv2.imencode('.jpg', random_image(rng, 256, 256))[1].tobytes() for _ in range(args.benchmark)]
+        print(json.dumps(asyncio.run(run_benchmark(service, images, args.concurrency)), indent=2))
+    else:
+        asyncio.run(HttpServer(service, args.host, args.port).serve_forever())
@@ -2,7 +2,7 @@ import os
 import logging
 import logging.handlers
 from datetime import datetime
-from torch.utils.tensorboard import SummaryWriter
+from common.torch.utils.metrics_sink import MetricsSink, checkpoint_epoch
 
 
 class InitExecutor(object):
@@ -22,11 +22,19 @@ class InitExecutor(object):
         self.logger = None
         self.tracking = None
         self.tb_writer = None
-        self.val_acc = None
-        self.train_acc = None
-        self.train_loss = None
-        self.val_loss = None
-        self.learning_rate = None
+        # Fraction of the channels removed by structured pruning
+        self.pruning_sparsity = 0.0
+        # Progressive resizing, the training data loader at the full resolution and the current resolution
+        self.full_train_data_loader = None
+        self.train_resolution = None
+        # Wall clock time to reach the TARGET_ACCURACY
+        self.training_start_time = None
+        self.target_accuracy_reached = False
+        # Validation, last accuracy, quick validation data loader and background evaluator
+        self.last_val_accuracy = None
+        self.quick_val_data_loader = None
+        self.async_validator = None
+        self.plateau_on_validation = False
 
         self.CHECKPOINT_PATH = None
         self.CHECKPOINT_INTERVAL = None
@@ -43,6 +51,43 @@ class InitExecutor(object):
         self.LOGLEVEL = None
         self.MULTI_GPU = None
         self.FP16_MIXED = None
+        self.ACTIVATION_CHECKPOINT_SEGMENTS = None
+        self.ACTIVATION_CHECKPOINT_EVERY = None
+        self.INFERENCE_BACKEND = None
+        self.PRETRAINED_CHECKPOINT = None
+        self.LOW_RANK_RANK = None
+        self.LOW_RANK_ENERGY = None
+        self.LOW_RANK_LAYERS = None
+        self.PRUNING_SCHEDULE = None
+        self.PRUNING_CRITERION = None
+        self.PRUNING_BATCHES = None
+        self.STUDENT_MODEL = None
+        self.TEACHER_MODEL = None
+        self.TEACHER_CHECKPOINT = None
+        self.TEACHER_MEAN_RGB = None
+        self.TEACHER_LOGIT_CACHE = None
+        self.KD_TEMPERATURE = None
+        self.KD_ALPHA = None
+        self.RESOLUTION_SCHEDULE = None
+        self.TARGET_ACCURACY = None
+        self.CPU_THREADS = None
+        self.CPU_INTEROP_THREADS = None
+        self.CPU_WORKER_THREADS = None
+        self.CPU_AFFINITY = None
+        self.TTA_POLICY = None
+        self.TTA_MAX_BATCH_SIZE = None
+        self.VALIDATION_INTERVAL = None
+        self.VALIDATION_SUBSET = None
+        self.ASYNC_VALIDATION = None
+        self.ASYNC_VALIDATION_DEVICE = None
+        self.ASYNC_VALIDATION_WORKERS = None
+        self.ASYNC_VALIDATION_THREADS = None
+        self.SWEEP_CONFIGS = None
+        self.SWEEP_HALVING_EPOCHS = None
+        self.SWEEP_KEEP_FRACTION = None
+        self.METRICS_FLUSH_SECS = None
+        self.PROGRESS_REFRESH_SECS = None
+        self.ONNX_MODEL_FILE = None
 
     def init_logging(self):
         """
@@ -77,12 +122,15 @@ class InitExecutor(object):
                 # If the file exists then load from last checkpoint
                 if os.path.isfile(self.last_checkpoint_file):
                     self.load_from_check_point = True
-                    # Also load the tb writer from previous session
-                    self.tb_writer = SummaryWriter(log_dir=lines[1])
+                    # Also load the tb writer from previous session. The epochs written after the checkpoint
+                    # are run again, hence hidden from tensor board ( purge_step ).
+                    epoch = checkpoint_epoch(self.last_checkpoint_file)
+                    self.tb_writer = MetricsSink(lines[1].strip(), purge_step=epoch + 1 if epoch is not None else None,
+                                                 flush_secs=self.METRICS_FLUSH_SECS)
         else:
             # Initialize the tensor board summary writer
             now = datetime.now()
-            self.tb_writer = SummaryWriter(log_dir=f'runs/{self.PROJECT_NAME}_{now.strftime("%Y%m%d-%H%M%S")}')
+            self.tb_writer = MetricsSink(f'runs/{self.PROJECT_NAME}_{now.strftime("%Y%m%d-%H%M%S")}', flush_secs=self.METRICS_FLUSH_SECS)
 
 
 class BaseLogger:
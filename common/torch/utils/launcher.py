@@ -0,0 +1,284 @@
+import os
+import ast
+import json
+import time
+import runpy
+import argparse
+from datetime import datetime
+from common.torch.utils.executor_registry import EXECUTORS, get_entry, get_commands, get_executor_class, get_default_config
+
+"""
+    Single entry point for the torch models, in place of the train.py/test.py of every model folder.
+
+        python -m common.torch.utils.launcher <command> <executor> [--config FILE] [--set KEY=VALUE ...]
+
+    Commands:
+        train       : train the model ( or resume from the last checkpoint ), same as train.py
+        evaluate    : validation accuracy and loss of the last checkpoint on VALID_CSV
+        predict     : top-1/top-5 accuracy of the last checkpoint using prediction() ( INFERENCE_BACKEND, TTA_POLICY ) on
+                      the csv of --split, same as test.py
+        benchmark   : images/sec of the training step and of the DataLoader using the real data, for --batches batches
+
+    The config is built in this order:
+        1.  the properties.py of the executor ( see executor_registry.py )
+        2.  the config file: a python file defining a config dict ( like properties.py ) or a json file, only the keys
+            of the file are replaced
+        3.  the overrides of the registry entry ( e.g. the PROJECT_NAME of the sweep )
+        4.  --set KEY=VALUE, the value is parsed as a python literal ( 10, 0.001, None, [10, 20], 'text' ) or used as
+            a string. When INPUT_DIR is changed, TRAIN_DIR, VALID_DIR, TRAIN_CSV and VALID_CSV follow it unless set.
+
+    The DataLoaders use the settings tuned by autotune.py for the model ( --batch-size and --num-workers override
+    them, --val-batch-size overrides the batch size of the validation and test DataLoaders ) and the same dataset
+    arguments as the train.py of the model folder. Some executors only support some commands ( e.g. resnet_sweep only
+    trains, see executor_registry.py ).
+
+    The resolved config, the DataLoader settings, the command line and the machine ( including the git commit ) are
+    written to the tensor board run folder of the executor ( launch_<command>_<time>.json ), next to the tensor board
+    data of the run, hence every result can be traced back to the exact settings which produced it.
+
+    Only the modules of the selected executor are imported, "--help" does not import torch.
+
+    Usage:
+        python -m common.torch.utils.launcher train resnet --set EPOCHS=20 INPUT_DIR=/media/4TB/datasets/caltech/processed
+        python -m common.torch.utils.launcher train squeezenet --config experiments/squeezenet_lr.json
+        python -m common.torch.utils.launcher predict googlenet --set TTA_POLICY=flip --split val
+        python -m common.torch.utils.launcher benchmark densenet --batches 50 --batch-size 32
+"""
+
+COMMANDS = ['train', 'evaluate', 'predict', 'benchmark']
+
+# Config values derived from INPUT_DIR in every properties.py
+DERIVED_PATHS = {'TRAIN_DIR': '{}/train', 'VALID_DIR': '{}/val', 'TRAIN_CSV': '{}/train.csv', 'VALID_CSV': '{}/val.csv'}
+
+
+def parse_value(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def parse_overrides(values):
+    """
+        Returns the dict of a list of KEY=VALUE strings.
+    """
+    overrides = {}
+    for value in values or []:
+        if '=' not in value:
+            raise ValueError(f'Invalid override {value}, expected KEY=VALUE')
+        key, value = value.split('=', 1)
+        overrides[key.strip()] = parse_value(value.strip())
+    return overrides
+
+
+def load_config_file(file_name):
+    """
+        Returns the config dict of a python ( config = dict() ... ) or json file.
+    """
+    if file_name.endswith('.json'):
+        with open(file_name) as file:
+            return json.load(file)
+    return runpy.run_path(file_name)['config']
+
+
+def resolve_config(name, config_file=None, overrides=None):
+    """
+        Returns the config of a registered executor with the config file and the overrides applied.
+    """
+    import torch
+
+    config = get_default_config(name)
+    changes = {}
+    if config_file:
+        changes.update(load_config_file(config_file))
+    changes.update(overrides or {})
+
+    config.update(changes)
+    # The paths follow INPUT_DIR, as they do in properties.py
+    if 'INPUT_DIR' in changes:
+        for key, path in DERIVED_PATHS.items():
+            if key not in changes:
+                config[key] = path.format(config['INPUT_DIR'])
+
+    for key, value in get_entry(name).get('overrides', {}).items():
+        if key not in changes:
+            config[key] = value.format(**config) if isinstance(value, str) else value
+
+    if not isinstance(config.get('DEVICE'), torch.device):
+        config['DEVICE'] = torch.device(config.get('DEVICE') or ('cuda' if torch.cuda.is_available() else 'cpu'))
+    return config
+
+
+def create_data_loader(csv_path, images_path, transformation, training, mean_rgb=None, **settings):
+    """
+        Same as the getDataLoader() of the train.py scripts.
+    """
+    import pandas as pd
+    from torch.utils.data import DataLoader
+    from common.torch.dataset.dataset import ClassificationDataset
+
+    dataset = ClassificationDataset(images_path, pd.read_csv(csv_path), transformation, {'image': 'image', 'label': 'class'}, training,
+                                    mean_rgb=mean_rgb)
+    return DataLoader(dataset, **settings)
+
+
+def loader_settings(name, batch_size=None, num_workers=None, val_batch_size=None):
+    """
+        Returns the settings of the training and of the validation DataLoaders. batch_size only changes the training
+        DataLoader.
+    """
+    from common.torch.utils.autotune import load_tuned_settings
+
+    entry = get_entry(name)
+    train = load_tuned_settings(entry['model'], batch_size=entry['batch_size'], num_workers=entry['num_workers'], pin_memory=True)
+    if batch_size:
+        train['batch_size'] = batch_size
+    if num_workers is not None:
+        train['num_workers'] = num_workers
+        if num_workers == 0:
+            train.pop('prefetch_factor', None)
+    train.update(shuffle=True, drop_last=True)
+
+    val = {'batch_size': val_batch_size or entry['val_batch_size'], 'num_workers': 4 if num_workers is None else num_workers, 'pin_memory': True,
+           'shuffle': False, 'drop_last': False}
+    return train, val
+
+
+def create_data_loaders(name, command, config, train_settings, val_settings, split='val'):
+    from common.torch.utils.model_registry import get_train_transformation, get_test_transformation
+
+    model = get_entry(name)['model']
+    mean_rgb = f"{config['INPUT_DIR']}/rgb_val.json" if get_entry(name)['mean_rgb'] else None
+    val_loader = create_data_loader(config['VALID_CSV'], config['VALID_DIR'], get_test_transformation(model), False, mean_rgb, **val_settings)
+
+    if command in ['train', 'benchmark']:
+        train_loader = create_data_loader(config['TRAIN_CSV'], config['TRAIN_DIR'], get_train_transformation(model), True, mean_rgb,
+                                          **train_settings)
+        return {'TRAIN': train_loader, 'VAL': val_loader}
+
+    if command == 'predict':
+        test_loader = val_loader
+        if split == 'train':
+            test_loader = create_data_loader(config['TRAIN_CSV'], config['TRAIN_DIR'], get_test_transformation(model), False, mean_rgb,
+                                             **val_settings)
+        # build_model() saves the graph to tensor board using a validation batch
+        return {'TEST': test_loader, 'VAL': val_loader}
+
+    return {'VAL': val_loader}
+
+
+def record_run(executor, command, name, config, train_settings, val_settings, argv, results=None, file_name=None):
+    """
+        Writes the resolved config and the settings of the run to the tensor board run folder of the executor.
+        Returns the file name.
+    """
+    from common.torch.utils.benchmark_suite import machine_info
+
+    run_dir = executor.tb_writer.get_logdir()
+    os.makedirs(run_dir, exist_ok=True)
+    file_name = file_name or f'{run_dir}/launch_{command}_{datetime.now().strftime("%Y%m%d-%H%M%S")}.json'
+    record = {'command': command, 'executor': name, 'entry': get_entry(name), 'argv': argv, 'config': config,
+              'data_loaders': {'train': train_settings, 'val': val_settings}, 'machine': machine_info(), 'results': results}
+    with open(file_name, 'w') as file:
+        # torch.device and the other objects are stored as strings
+        json.dump(record, file, indent=2, default=str)
+    return file_name
+
+
+def evaluate(executor):
+    """
+        Returns the validation accuracy and loss of the last checkpoint.
+    """
+    executor.build_model()
+    executor.load_checkpoint()
+    accuracy = executor.calculate_validation_loss_accuracy()
+    return {'val_accuracy': accuracy, 'val_loss': executor.val_loss_hist.value}
+
+
+def benchmark(executor, batches, warmup=3):
+    """
+        Returns the images/sec of the training step ( forward, backward and optimizer step ) and of the DataLoader,
+        and the share of the time spent waiting for the data.
+    """
+    from common.torch.utils.benchmark_util import synchronize
+
+    executor.build_model()
+    executor.pre_training_loop_ops()
+
+    data_seconds, step_seconds, images_count = 0.0, 0.0, 0
+    iterator = iter(executor.train_data_loader)
+    for i in range(warmup + batches):
+        start = time.perf_counter()
+        try:
+            images, labels, _ = next(iterator)
+        except StopIteration:
+            iterator = iter(executor.train_data_loader)
+            images, labels, _ = next(iterator)
+        images = images.to(executor.DEVICE)
+        labels = labels.to(executor.DEVICE)
+        loaded = time.perf_counter()
+
+        executor.forward_backward_pass(images, labels, 1, i)
+        synchronize(executor.DEVICE)
+        if i >= warmup:
+            data_seconds += loaded - start
+            step_seconds += time.perf_counter() - loaded
+            images_count += images.size(0)
+    executor.pbar.close()
+
+    total = data_seconds + step_seconds
+    return {'batches': batches, 'images_per_sec': images_count / total, 'step_images_per_sec': images_count / step_seconds,
+            'data_wait_fraction': data_seconds / total}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train, evaluate, predict or benchmark a registered executor')
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('executor', choices=list(EXECUTORS.keys()))
+    parser.add_argument('--config', default=None, help='python ( config dict ) or json file applied on top of the properties.py')
+    parser.add_argument('--set', nargs='+', default=[], metavar='KEY=VALUE', help='config overrides')
+    parser.add_argument('--batch-size', type=int, default=None, help='overrides the tuned batch size of the training DataLoader')
+    parser.add_argument('--val-batch-size', type=int, default=None, help='overrides the batch size of the validation and test DataLoaders')
+    parser.add_argument('--num-workers', type=int, default=None, help='overrides the tuned DataLoader workers')
+    parser.add_argument('--split', default='val', choices=['train', 'val'], help='images used by predict')
+    parser.add_argument('--batches', type=int, default=50, help='batches measured by benchmark')
+    parser.add_argument('--print-config', action='store_true', help='print the resolved config and exit')
+    args = parser.parse_args(argv)
+    if args.command not in get_commands(args.executor, COMMANDS):
+        parser.error(f"{args.executor} only supports {', '.join(get_commands(args.executor, COMMANDS))}")
+
+    config = resolve_config(args.executor, args.config, parse_overrides(args.set))
+    if args.print_config:
+        print(json.dumps(config, indent=2, default=str))
+        return
+
+    train_settings, val_settings = loader_settings(args.executor, args.batch_size, args.num_workers, args.val_batch_size)
+    data_loaders = create_data_loaders(args.executor, args.command, config, train_settings, val_settings, args.split)
+    executor = get_executor_class(args.executor)("", data_loaders, config=config)
+
+    # Recorded before the run, and again with the results when it completes
+    record_file = record_run(executor, args.command, args.executor, config, train_settings, val_settings, argv)
+    executor.logger.info(f"Resolved config saved to {record_file}")
+
+    start = time.perf_counter()
+    if args.command == 'train':
+        executor.train()
+        results = {}
+    elif args.command == 'evaluate':
+        results = evaluate(executor)
+    elif args.command == 'predict':
+        # Every prediction() returns the ( top-1, top-5 ) accuracy of prediction_accuracy()
+        accuracy, rank5_accuracy = executor.prediction()
+        results = {'accuracy': accuracy, 'rank5_accuracy': rank5_accuracy}
+    else:
+        results = benchmark(executor, args.batches)
+    results['seconds'] = time.perf_counter() - start
+
+    record_run(executor, args.command, args.executor, config, train_settings, val_settings, argv, results, record_file)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    import sys
+
+    main(sys.argv[1:])
@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+import torch
+from common.torch.utils.benchmark_util import measure_module_latency
+from common.torch.utils.inference_backend import TorchBackend, evaluate
+from common.torch.utils.model_registry import MODELS, create_model, get_image_size, get_test_transformation
+from common.torch.utils.quantization_util import load_checkpoint_weights, get_data_loader
+
+"""
+    Low rank factorization of the large fully connected layers ( e.g. Linear(7 * 7 * 512, 4096) of VGG ).
+
+    Each selected Linear layer with weight W ( out x in ) is replaced using the truncated SVD W ~ U_k S_k V_k^T by two
+    Linear layers:
+        Linear(in, k, bias=False)  with weight sqrt(S_k) V_k^T
+        Linear(k, out)             with weight U_k sqrt(S_k) and the original bias
+
+    The number of parameters goes from out * in to k * (in + out). The rank k is either fixed or the smallest rank
+    which retains the given fraction of the energy ( sum of the squared singular values ).
+
+    For fine-tuning, set LOW_RANK_RANK or LOW_RANK_ENERGY and PRETRAINED_CHECKPOINT in properties.py and run the
+    train.py of the model, BaseExecutor.enable_low_rank_factorization() factorizes the model before training.
+
+    Usage:
+        python -m common.torch.utils.low_rank --model vgg_a --checkpoint vgg_checkpoint_50.pth --ranks 64 128 256 --energy 0.9 \
+            --val-csv val.csv --val-dir val
+"""
+
+
+def rank_for_energy(singular_values, energy):
+    """
+        Returns the smallest rank which retains the given fraction of sum(S^2).
+    """
+    cumulative = torch.cumsum(singular_values ** 2, dim=0)
+    return int((cumulative < energy * cumulative[-1]).sum().item()) + 1
+
+
+def factorize_linear(linear, rank=None, energy=None):
+    """
+        Factorize one Linear layer using truncated SVD.
+
+        :param linear: torch.nn.Linear
+        :param rank: rank of the factorization
+        :param energy: alternatively, fraction of the energy to retain ( 0 - 1 )
+        :return: torch.nn.Sequential of two Linear layers and the selected rank
+    """
+    weight = linear.weight.data.float()
+    U, S, V = torch.svd(weight)
+
+    if rank is None:
+        rank = rank_for_energy(S, energy)
+    rank = min(rank, S.shape[0])
+
+    # Split the singular values equally between both the layers
+    root_s = torch.sqrt(S[:rank])
+
+    first = torch.nn.Linear(linear.in_features, rank, bias=False)
+    first.weight.data.copy_(root_s.view(-1, 1) * V[:, :rank].t())
+
+    second = torch.nn.Linear(rank, linear.out_features, bias=linear.bias is not None)
+    second.weight.data.copy_(U[:, :rank] * root_s.view(1, -1))
+    if linear.bias is not None:
+        second.bias.data.copy_(linear.bias.data)
+
+    return torch.nn.Sequential(first, second).to(linear.weight.device), rank
+
+
+def linear_layers(model, layers=None):
+    """
+        Returns the ( name, parent module, attribute, Linear ) of the selected Linear layers.
+
+        :param layers: list of names as in model.named_modules(), e.g. ['model.29'], None selects all the Linear layers
+    """
+    selected = []
+    for parent_name, parent in model.named_modules():
+        for attribute, child in parent.named_children():
+            name = f'{parent_name}.{attribute}' if parent_name else attribute
+            if isinstance(child, torch.nn.Linear) and (layers is None or name in layers):
+                selected.append((name, parent, attribute, child))
+    return selected
+
+
+def factorize_model(model, rank=None, energy=None, layers=None):
+    """
+        Replace the selected Linear layers in place. A layer is only factorized if it reduces the number of parameters.
+
+        :return: dict of layer name -> selected rank
+    """
+    if rank is None and energy is None:
+        raise ValueError('Either rank or energy must be set')
+
+    ranks = {}
+    for name, parent, attribute, linear in linear_layers(model, layers):
+        factorized, selected_rank = factorize_linear(linear, rank=rank, energy=energy)
+        if selected_rank * (linear.in_features + linear.out_features) >= linear.in_features * linear.out_features:
+            continue
+        setattr(parent, attribute, factorized)
+        ranks[name] = selected_rank
+    return ranks
+
+
+def model_size_mb(model):
+    return sum(p.numel() * p.element_size() for p in model.parameters()) / 1024.0 ** 2
+
+
+def profile(model, data_loader, image_size, batch_sizes=(1, 32), repeat=10):
+    """
+        Returns the size, latency and ( if the data loader is set ) accuracy of the model.
+    """
+    result = {'parameters': sum(p.numel() for p in model.parameters()), 'size_mb': model_size_mb(model), 'latency': {}}
+    for batch_size in batch_sizes:
+        latency = measure_module_latency(model, torch.rand(batch_size, 3, image_size, image_size), repeat=repeat)
+        result['latency'][batch_size] = {'p50_ms': latency['p50_ms'], 'images_per_sec': 1000.0 * batch_size / latency['p50_ms']}
+    if data_loader is not None:
+        result['top1'], result['top5'] = evaluate(TorchBackend(model), data_loader)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--ranks', type=int, nargs='*', default=[64, 128, 256, 512])
+    parser.add_argument('--energy', type=float, nargs='*', default=[], help='energy thresholds, e.g. 0.8 0.9')
+    parser.add_argument('--layers', nargs='*', default=None, help='names of the Linear layers, default all')
+    parser.add_argument('--val-csv', default=None)
+    parser.add_argument('--val-dir', default=None)
+    parser.add_argument('--mean-rgb', default=None)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--output', default=None, help='json report')
+    parser.add_argument('--save-dir', default=None, help='save each factorized model using torch.save()')
+    args = parser.parse_args()
+
+    image_size = get_image_size(args.model)
+    data_loader = None
+    if args.val_csv:
+        data_loader = get_data_loader(args.val_csv, args.val_dir, get_test_transformation(args.model), mean_rgb=args.mean_rgb)
+
+    def load():
+        return load_checkpoint_weights(create_model(args.model, num_classes=args.num_classes), args.checkpoint).eval()
+
+    report = {'model': args.model, 'checkpoint': args.checkpoint, 'baseline': profile(load(), data_loader, image_size, args.batch_sizes),
+              'factorized': []}
+
+    settings = [{'rank': rank} for rank in args.ranks] + [{'energy': energy} for energy in args.energy]
+    for setting in settings:
+        model = load()
+        ranks = factorize_model(model, layers=args.layers, **setting)
+        result = dict(setting, ranks=ranks, **profile(model, data_loader, image_size, args.batch_sizes))
+        report['factorized'].append(result)
+
+        if args.save_dir:
+            os.makedirs(args.save_dir, exist_ok=True)
+            torch.save(model, f"{args.save_dir}/{args.model}_{'_'.join(f'{k}_{v}' for k, v in setting.items())}.pth")
+
+    print(f'{"Setting":<16}{"Params (M)":>12}{"Size MB":>10}{"Top-1":>8}{"Top-5":>8}' + ''.join(f'{f"bs {b} ms":>12}' for b in args.batch_sizes))
+    for name, result in [('baseline', report['baseline'])] + [(str(r.get('rank', r.get('energy'))), r) for r in report['factorized']]:
+        print(f'{name:<16}{result["parameters"] / 1e6:>12.2f}{result["size_mb"]:>10.1f}{result.get("top1", float("nan")):>8.2f}'
+              f'{result.get("top5", float("nan")):>8.2f}' + ''.join(f'{result["latency"][b]["p50_ms"]:>12.2f}' for b in args.batch_sizes))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
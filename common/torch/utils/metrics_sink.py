@@ -0,0 +1,232 @@
+import os
+import re
+import time
+import queue
+import threading
+from common.lazy_import import lazy_import
+
+# Optional packages, imported on first use ( see common/lazy_import.py )
+SummaryWriter = lazy_import('torch.utils.tensorboard', 'SummaryWriter', install='pip install tensorboard')
+tqdm = lazy_import('tqdm', 'tqdm')
+
+"""
+    Low overhead tensor board writer and progress bar of the training loops.
+
+    MetricsSink has the methods of the SummaryWriter used by the executors ( add_scalar, add_scalars, add_graph,
+    get_logdir, flush and close ). The scalars are written as soon as they are produced, instead of being kept in lists
+    until the next checkpoint, hence a crash only loses the last flush_secs seconds of metrics. The training thread only
+    puts ( tag, value, step ) in a queue, the summaries are serialized and written by a background thread, which also
+    flushes and fsyncs the event files at most every flush_secs seconds ( and when flush() is called, e.g. at every
+    checkpoint ).
+
+    Resume: the training restarts from the epoch after the last checkpoint, while the epochs run after the checkpoint
+    and before the crash were already written. purge_step ( the first epoch of the resumed run ) hides these events
+    from tensor board, including the ones of the add_scalars() runs, hence every epoch is shown once.
+
+    ProgressBar is a tqdm progress bar redrawn at most every refresh_secs seconds. set_postfix() and update() are
+    called for every batch but the postfix is only formatted and drawn when the bar is redrawn.
+
+    Usage:
+        sink = MetricsSink('runs/nmt', flush_secs=30)
+        pbar = ProgressBar(len(train_iterator), refresh_secs=1)
+        for i, batch in enumerate(train_iterator):
+            ...
+            pbar.set_postfix(epoch=f"{epoch}, train loss= {loss}")
+            pbar.update()
+        pbar.close()
+        sink.add_scalars("Loss", {'train': train_loss, 'val': val_loss}, epoch)
+        sink.close()
+"""
+
+EVENT_FILE_PREFIX = 'events.out.tfevents'
+
+# Markers of the queue
+FLUSH = 'flush'
+CLOSE = 'close'
+
+
+def checkpoint_epoch(file_name):
+    """
+        Returns the epoch of a checkpoint file ( <PROJECT_NAME>_checkpoint_<epoch>.pth ), None if unknown.
+    """
+    match = re.search(r'_checkpoint_(\d+)\.pth$', file_name or '')
+    return int(match.group(1)) if match else None
+
+
+class MetricsSink:
+    def __init__(self, log_dir, purge_step=None, flush_secs=30, max_queue=10000):
+        """
+            :param log_dir: tensor board run folder
+            :param purge_step: first step of a resumed run, the events from this step of the previous session are hidden
+            :param flush_secs: max seconds between two flushes ( and fsync ) of the event files
+            :param max_queue: max pending events, add_scalar() blocks when the writer is behind
+        """
+        self.log_dir = log_dir
+        self.purge_step = purge_step
+        self.flush_secs = flush_secs or 30
+
+        # Created here, a missing tensorboard fails when the run is created and not in the background thread
+        self.writer = SummaryWriter(log_dir=log_dir, purge_step=purge_step, flush_secs=self.flush_secs)
+        # Runs of add_scalars(), same folders as SummaryWriter.add_scalars() but with the purge_step
+        self.scalars_writers = {}
+        # add_graph() uses the writer from the training thread
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+        self.last_sync_time = 0
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self.run, name='metrics-sink', daemon=True)
+        self.thread.start()
+
+    def get_logdir(self):
+        return self.log_dir
+
+    def add_scalar(self, tag, value, step):
+        self.put((tag, None, value, step))
+
+    def add_scalars(self, tag, values, step):
+        for key, value in values.items():
+            self.put((tag, key, value, step))
+
+    def add_graph(self, model, images):
+        with self.lock:
+            self.writer.add_graph(model, images)
+
+    def put(self, item):
+        if self.error is not None:
+            raise RuntimeError(f"Metrics of {self.log_dir} can not be written: {self.error}") from self.error
+        if not self.closed:
+            self.queue.put(item)
+
+    def flush(self):
+        """
+            Returns when all the events put so far are written and synced to disk.
+        """
+        if self.closed:
+            return
+        done = threading.Event()
+        self.put((FLUSH, done))
+        done.wait()
+
+    def close(self):
+        if self.closed:
+            return
+        # Not put(), the writers are closed even after an error
+        self.queue.put((CLOSE, None))
+        self.closed = True
+        self.thread.join()
+
+    def run(self):
+        last_sync = time.monotonic()
+        written = False
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, self.flush_secs - (time.monotonic() - last_sync)))
+            except queue.Empty:
+                item = None
+
+            # The markers are ( FLUSH or CLOSE, event ), the scalars ( tag, key, value, step )
+            if item is not None and len(item) == 2:
+                self.sync()
+                last_sync, written = time.monotonic(), False
+                if item[0] == CLOSE:
+                    break
+                item[1].set()
+                continue
+
+            if item is not None:
+                try:
+                    self.write(*item)
+                    written = True
+                except Exception as e:
+                    # Raised by the next call of the training thread
+                    self.error = e
+
+            if written and time.monotonic() - last_sync >= self.flush_secs:
+                self.sync()
+                last_sync, written = time.monotonic(), False
+
+        with self.lock:
+            for writer in [self.writer] + list(self.scalars_writers.values()):
+                writer.close()
+
+    def write(self, tag, key, value, step):
+        if key is None:
+            with self.lock:
+                self.writer.add_scalar(tag, value, step)
+            return
+
+        if (tag, key) not in self.scalars_writers:
+            log_dir = f"{self.log_dir}/{tag.replace('/', '_')}_{key}"
+            self.scalars_writers[(tag, key)] = SummaryWriter(log_dir=log_dir, purge_step=self.purge_step, flush_secs=self.flush_secs)
+        self.scalars_writers[(tag, key)].add_scalar(tag, value, step)
+
+    def sync(self):
+        """
+            Flushes the writers and fsyncs the event files, only the files changed since the last sync.
+        """
+        start = time.time()
+        try:
+            with self.lock:
+                for writer in [self.writer] + list(self.scalars_writers.values()):
+                    writer.flush()
+        except Exception as e:
+            self.error = e
+            return
+        for folder, _, files in os.walk(self.log_dir):
+            for file_name in files:
+                path = os.path.join(folder, file_name)
+                if not file_name.startswith(EVENT_FILE_PREFIX) or os.path.getmtime(path) < self.last_sync_time:
+                    continue
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    pass
+        self.last_sync_time = start
+
+
+class ProgressBar:
+    def __init__(self, total, refresh_secs=1.0, **kwargs):
+        """
+            :param total: number of batches
+            :param refresh_secs: min seconds between two redraws of the bar
+            :param kwargs: tqdm arguments, the bar format of the executors by default
+        """
+        self.refresh_secs = refresh_secs if refresh_secs is not None else 1.0
+        kwargs = {'bar_format': '{l_bar}{bar:10}{r_bar}{bar:-10b}', 'unit': ' batches', 'ncols': 200, **kwargs}
+        self.pbar = tqdm(total=total, mininterval=self.refresh_secs, **kwargs)
+        self.last_refresh = time.monotonic()
+        self.pending = 0
+        self.postfix = None
+
+    def due(self):
+        """
+            Returns True if the bar is redrawn by the next update(), i.e. when the postfix is worth formatting.
+        """
+        return time.monotonic() - self.last_refresh >= self.refresh_secs
+
+    def set_postfix(self, refresh=False, **kwargs):
+        # Kept until the next redraw, refresh is accepted for compatibility with tqdm and ignored
+        self.postfix = kwargs
+
+    def update(self, n=1):
+        self.pending += n
+        if self.due():
+            self.refresh()
+
+    def refresh(self):
+        if self.postfix is not None:
+            self.pbar.set_postfix(refresh=False, **self.postfix)
+            self.postfix = None
+        self.pbar.update(self.pending)
+        self.pending = 0
+        self.last_refresh = time.monotonic()
+
+    def close(self):
+        self.refresh()
+        self.pbar.close()
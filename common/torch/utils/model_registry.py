@@ -0,0 +1,72 @@
+import importlib
+
+"""
+    Registry of the torch models implemented in this repository. The entries are plain strings and the
+    modules are imported only when a model is created, hence importing the registry is cheap.
+
+    Each entry contains:
+        model           : "<module>:<factory>" used to create the model
+        kwargs          : additional arguments of the factory
+        image_size      : input height/width used by the transformation.py of the model
+        package         : the model folder, containing executor.py, properties.py and transformation.py
+"""
+
+MODELS = {
+    'alexnet': {'model': 'AlexNet.model:AlexNetModel', 'kwargs': {}, 'image_size': 227, 'package': 'AlexNet'},
+    'zfnet': {'model': 'ZFNet.model:ZFNetModel', 'kwargs': {}, 'image_size': 227, 'package': 'ZFNet'},
+    'vgg_a': {'model': 'VGGNet.model:VGG', 'kwargs': {'network_type': 'A'}, 'image_size': 224, 'package': 'VGGNet'},
+    'vgg_b': {'model': 'VGGNet.model:VGG', 'kwargs': {'network_type': 'B'}, 'image_size': 224, 'package': 'VGGNet'},
+    'vgg_d': {'model': 'VGGNet.model:VGG', 'kwargs': {'network_type': 'D'}, 'image_size': 224, 'package': 'VGGNet'},
+    'vgg_e': {'model': 'VGGNet.model:VGG', 'kwargs': {'network_type': 'E'}, 'image_size': 224, 'package': 'VGGNet'},
+    'googlenet': {'model': 'GoogLeNet.model:GoogLeNet', 'kwargs': {}, 'image_size': 224, 'package': 'GoogLeNet'},
+    'resnet_20': {'model': 'ResNet.model:resnet_20', 'kwargs': {}, 'image_size': 224, 'package': 'ResNet'},
+    'resnet_26': {'model': 'ResNet.model:resnet_26', 'kwargs': {}, 'image_size': 224, 'package': 'ResNet'},
+    'resnet_29': {'model': 'ResNet.model:resnet_29', 'kwargs': {}, 'image_size': 224, 'package': 'ResNet'},
+    'resnet_38': {'model': 'ResNet.model:resnet_38', 'kwargs': {}, 'image_size': 224, 'package': 'ResNet'},
+    'resnet_50': {'model': 'ResNet.model:resnet_50', 'kwargs': {}, 'image_size': 224, 'package': 'ResNet'},
+    'squeezenet': {'model': 'SqueezeNet.model:SqueezeNet', 'kwargs': {}, 'image_size': 224, 'package': 'SqueezeNet'},
+    'densenet_121': {'model': 'DenseNet.model:densenet_121', 'kwargs': {}, 'image_size': 224, 'package': 'DenseNet'},
+    'densenet_169': {'model': 'DenseNet.model:densenet_169', 'kwargs': {}, 'image_size': 224, 'package': 'DenseNet'},
+}
+
+
+def import_attribute(path):
+    """
+        Import "<module>:<attribute>" and return the attribute.
+    """
+    module_name, attribute = path.split(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def create_model(name, num_classes=256, **kwargs):
+    """
+        Create a registered model by name.
+
+        :param name: key of the MODELS dict
+        :param num_classes: number of classes
+        :param kwargs: override the arguments of the factory
+    """
+    if name not in MODELS:
+        raise ValueError(f"Unknown model {name}, available models are {', '.join(MODELS.keys())}")
+    entry = MODELS[name]
+    arguments = dict(entry['kwargs'])
+    arguments.update(kwargs)
+    return import_attribute(entry['model'])(num_classes=num_classes, **arguments)
+
+
+def get_image_size(name):
+    return MODELS[name]['image_size']
+
+
+def get_test_transformation(name):
+    """
+        Returns the test_transformation defined in the transformation.py of the model.
+    """
+    return import_attribute(f"{MODELS[name]['package']}.transformation:test_transformation")
+
+
+def get_train_transformation(name):
+    """
+        Returns the train_transformation defined in the transformation.py of the model.
+    """
+    return import_attribute(f"{MODELS[name]['package']}.transformation:train_transformation")
@@ -1,4 +1,7 @@
+import math
 import torch
+import torch.utils.checkpoint as cp
+from common.torch.utils.pruning_util import PruningGroup, Consumer, sequential_pruning_groups
 
 
 class Flatten(torch.nn.Module):
@@ -21,6 +24,68 @@ def weights_init_xavier_normal(m):
 class CNNBaseModel(torch.nn.Module):
     def __init__(self):
         super(CNNBaseModel, self).__init__()
+        # Number of activation checkpoint segments of self.model, None means disabled
+        self.checkpoint_segments = None
+
+    def enable_activation_checkpointing(self, segments=None, every=None):
+        """
+            Enable segment wise activation checkpointing of the self.model Sequential. Only the input of
+            each segment is stored during the forward pass, the activations inside a segment are recomputed
+            during the backward pass. Less segments means less memory and more recomputation.
+
+            Only the layers before the Flatten layer are checkpointed, the classifier is small and
+            contains in-place operations which can not be recomputed. For the same reason a segment
+            should not start with an in-place layer ( e.g. ReLU(inplace=True) ).
+
+            :param segments: number of segments
+            :param every: alternatively, create a segment for every k layers of the Sequential
+        """
+        if every:
+            segments = math.ceil(self.checkpoint_layer_count() / every)
+        self.checkpoint_segments = segments
+        return self
+
+    def disable_activation_checkpointing(self):
+        self.checkpoint_segments = None
+        return self
+
+    def checkpoint_layer_count(self):
+        """
+            Returns the number of layers in self.model before the Flatten layer.
+        """
+        for i, layer in enumerate(self.model):
+            if isinstance(layer, Flatten):
+                return i
+        return len(self.model)
+
+    def forward_model(self, x):
+        """
+            Run the self.model Sequential, using activation checkpointing when it has been enabled and
+            the model is being trained.
+
+            :param x: input data
+        """
+        if not self.checkpoint_segments or not self.training or not torch.is_grad_enabled():
+            return self.model(x)
+
+        count = self.checkpoint_layer_count()
+        features = self.model[:count]
+        classifier = self.model[count:]
+
+        # The checkpointed segments produce gradients only when the input requires gradient,
+        # which is not the case for the images.
+        if not x.requires_grad:
+            x = x.detach().requires_grad_()
+
+        x = cp.checkpoint_sequential(features, min(self.checkpoint_segments, count), x)
+        return classifier(x)
+
+    def pruning_groups(self):
+        """
+            Returns the channel groups which can be removed by structured pruning ( see pruning_util.py ).
+            The models with branches or residual connections override this function.
+        """
+        return sequential_pruning_groups(self.model)
 
     def weights_init_xavier_normal(self):
         for m in self.modules():
@@ -0,0 +1,119 @@
+import os
+import json
+import argparse
+import torch
+from common.torch.utils.benchmark_util import measure_latency, max_abs_difference
+from common.torch.utils.inference_backend import TorchBackend, OnnxRuntimeBackend, evaluate
+from common.torch.utils.model_registry import MODELS, create_model, get_image_size, get_test_transformation
+from common.torch.utils.quantization_util import load_checkpoint_weights, get_data_loader
+
+"""
+    Export a trained CNNBaseModel checkpoint to ONNX with a dynamic batch size, so that it can be deployed
+    using ONNX Runtime without the model code and the training stack ( apex, tensorboard etc ).
+
+    After the export:
+        1.  Parity check: the output of PyTorch and ONNX Runtime is compared for a few batch sizes.
+        2.  Throughput comparison of both backends.
+        3.  ( optional ) top-1/top-5 accuracy of both backends on the validation csv.
+
+    Usage:
+        python -m common.torch.utils.onnx_export --model resnet_38 --checkpoint resnet_checkpoint_100.pth --output resnet_38.onnx
+"""
+
+
+def export_onnx(model, file_name, image_size=224, opset_version=11):
+    """
+        Export the model to ONNX. The batch dimension of the input and output is dynamic.
+
+        :param model: torch.nn.Module with the trained weights
+        :param file_name: output .onnx file
+        :param image_size: input height/width
+        :param opset_version: ONNX opset version
+    """
+    model = model.cpu().eval()
+    x = torch.rand(1, 3, image_size, image_size)
+    with torch.no_grad():
+        torch.onnx.export(model, x, file_name, input_names=['images'], output_names=['output'],
+                          dynamic_axes={'images': {0: 'batch_size'}, 'output': {0: 'batch_size'}},
+                          opset_version=opset_version, do_constant_folding=True)
+    return file_name
+
+
+def check_parity(model, onnx_file, image_size=224, batch_sizes=(1, 8), atol=1e-4):
+    """
+        Compare the output of the torch model and the ONNX model on random inputs. The batch sizes other than 1
+        also verify that the batch dimension is dynamic.
+
+        :return: tuple of ( True if all the outputs are within atol, dict of batch size -> max abs difference )
+    """
+    torch_backend = TorchBackend(model.cpu())
+    onnx_backend = OnnxRuntimeBackend(onnx_file, providers=['CPUExecutionProvider'])
+
+    differences = {}
+    for batch_size in batch_sizes:
+        x = torch.rand(batch_size, 3, image_size, image_size)
+        differences[batch_size] = max_abs_difference(torch_backend(x), onnx_backend(x))
+
+    return all(d <= atol for d in differences.values()), differences
+
+
+def compare_throughput(backends, image_size=224, batch_sizes=(1, 32), repeat=10):
+    """
+        Returns the p50 latency and images/sec of each backend for each batch size.
+
+        :param backends: list of InferenceBackend
+    """
+    results = {}
+    for backend in backends:
+        results[backend.name] = {}
+        for batch_size in batch_sizes:
+            x = torch.rand(batch_size, 3, image_size, image_size)
+            latency = measure_latency(lambda: backend(x), warmup=2, repeat=repeat)
+            results[backend.name][batch_size] = {'p50_ms': latency['p50_ms'], 'images_per_sec': 1000.0 * batch_size / latency['p50_ms']}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--opset', type=int, default=11)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--threads', type=int, default=None, help='number of threads used by both backends')
+    parser.add_argument('--val-csv', default=None, help='also compare the top-1/top-5 accuracy on this csv')
+    parser.add_argument('--val-dir', default=None)
+    parser.add_argument('--mean-rgb', default=None)
+    parser.add_argument('--num-classes', type=int, default=256)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    image_size = get_image_size(args.model)
+    model = load_checkpoint_weights(create_model(args.model, num_classes=args.num_classes), args.checkpoint).eval()
+
+    export_onnx(model, args.output, image_size=image_size, opset_version=args.opset)
+    print(f'Exported {args.model} to {args.output}')
+
+    passed, differences = check_parity(model, args.output, image_size=image_size, batch_sizes=args.batch_sizes, atol=args.atol)
+    for batch_size, difference in differences.items():
+        print(f'Parity batch size {batch_size:<6} max abs difference {difference:.2e}')
+    print(f'Parity check {"passed" if passed else "FAILED"} ( atol={args.atol} )')
+
+    backends = [TorchBackend(model), OnnxRuntimeBackend(args.output, providers=['CPUExecutionProvider'], intra_op_num_threads=args.threads)]
+    report = {'model': args.model, 'checkpoint': args.checkpoint, 'parity': {'passed': passed, 'max_abs_difference': differences},
+              'throughput': compare_throughput(backends, image_size=image_size, batch_sizes=args.batch_sizes)}
+
+    if args.val_csv:
+        data_loader = get_data_loader(args.val_csv, args.val_dir, get_test_transformation(args.model), mean_rgb=args.mean_rgb)
+        report['accuracy'] = {}
+        for backend in backends:
+            top1, top5 = evaluate(backend, data_loader)
+            report['accuracy'][backend.name] = {'top1': top1, 'top5': top5}
+
+    with open(f'{os.path.splitext(args.output)[0]}_report.json', 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,211 @@
+import copy
+import json
+import time
+import argparse
+import torch
+from torch.utils.data import DataLoader, RandomSampler
+from common.lazy_import import lazy_import
+
+A = lazy_import('albumentations')
+
+"""
+    Progressive resizing: the early epochs are trained using a lower resolution, which needs less computation per image,
+    and the resolution is increased during the training, e.g. 128 -> 176 -> 224. The last epochs and the validation
+    use the full resolution.
+
+    The training transformation is rebuilt for each resolution. The RandomCrop of the transformation.py still selects the
+    same region of the image and a Resize is added after it, so the field of view does not change, only the number of
+    pixels. The batch size is scaled by (full size / size)^2 so that the activation memory stays about the same.
+
+    The model must not depend on the input size, i.e. it must use AdaptiveAvgPool2d before the classifier ( ResNet,
+    GoogLeNet, SqueezeNet, DenseNet ). AlexNet, ZFNet and VGG have a Linear layer sized for the full resolution.
+
+    BaseExecutor.apply_resolution_schedule() uses this with RESOLUTION_SCHEDULE. The CLI compares the wall clock time
+    needed to reach a target validation accuracy with and without a schedule.
+
+    Usage:
+        python -m common.torch.utils.progressive_resizing --model resnet_20 --data-dir /media/4TB/datasets/caltech/processed \
+            --epochs 10 --schedule 1:128 4:176 8:224 --target-accuracy 20
+"""
+
+
+def supports_progressive_resizing(model):
+    """
+        Returns True if the model has an AdaptiveAvgPool2d layer, hence the classifier does not depend on the input size.
+    """
+    return any(isinstance(module, (torch.nn.AdaptiveAvgPool2d, torch.nn.AdaptiveMaxPool2d)) for module in model.modules())
+
+
+def resolution_for_epoch(schedule, epoch):
+    """
+        Returns the resolution of the epoch, i.e. the value of the last schedule entry starting on or before the epoch.
+
+        :param schedule: dict of first epoch -> resolution, e.g. {1: 128, 6: 176, 11: 224}
+    """
+    started = [start for start in schedule if start <= epoch]
+    return schedule[max(started)] if started else None
+
+
+def transformation_size(transformation):
+    """
+        Returns the output size of the transformation, i.e. the height of the last crop or Resize layer.
+    """
+    size = None
+    for transform in transformation.transforms:
+        if isinstance(transform, (A.Resize, A.RandomCrop, A.CenterCrop)):
+            size = transform.height
+    return size
+
+
+def rescale_transformation(transformation, size):
+    """
+        Returns a copy of the albumentations Compose producing images of size x size. A Resize is added after each
+        RandomCrop/CenterCrop and the existing Resize layers are changed.
+
+        :param transformation: train_transformation of the model
+        :param size: target height and width
+    """
+    transforms = []
+    for transform in transformation.transforms:
+        if isinstance(transform, A.Resize):
+            transform = copy.deepcopy(transform)
+            transform.height, transform.width = size, size
+            transforms.append(transform)
+        elif isinstance(transform, (A.RandomCrop, A.CenterCrop)):
+            transforms.append(transform)
+            if (transform.height, transform.width) != (size, size):
+                transforms.append(A.Resize(size, size, p=1.0))
+        else:
+            transforms.append(transform)
+    return A.Compose(transforms)
+
+
+def scaled_batch_size(batch_size, full_size, size, multiple=8, max_batch_size=None):
+    """
+        Scale the batch size with the number of pixels, rounded down to a multiple of 8.
+
+        :param batch_size: batch size at the full resolution
+        :param full_size: full resolution
+        :param size: current resolution
+        :param max_batch_size: optional upper limit, e.g. the number of training images
+    """
+    scaled = int(batch_size * (full_size / size) ** 2)
+    scaled = max(multiple, scaled - scaled % multiple) if scaled >= multiple else max(1, scaled)
+    return min(scaled, max_batch_size) if max_batch_size else scaled
+
+
+def rebuild_data_loader(data_loader, transformation, batch_size):
+    """
+        Create a DataLoader with the same dataset and settings as the given one, using another transformation and batch size.
+        The dataset is copied, hence the original data loader is not changed. The worker_init_fn ( e.g. the WorkerThreadInit
+        of configure_cpu_threads() ) and the tuned prefetch_factor / persistent_workers ( see autotune.py ) are kept.
+    """
+    dataset = copy.copy(data_loader.dataset)
+    dataset.transform = transformation
+    # prefetch_factor and persistent_workers can only be set with worker processes
+    arguments = {'prefetch_factor': data_loader.prefetch_factor, 'persistent_workers': data_loader.persistent_workers} \
+        if data_loader.num_workers > 0 and hasattr(data_loader, 'persistent_workers') else {}
+    return DataLoader(dataset, batch_size=batch_size, shuffle=isinstance(data_loader.sampler, RandomSampler), num_workers=data_loader.num_workers,
+                      pin_memory=data_loader.pin_memory, drop_last=data_loader.drop_last, collate_fn=data_loader.collate_fn,
+                      worker_init_fn=data_loader.worker_init_fn, **arguments)
+
+
+def time_to_accuracy(history, target):
+    """
+        Returns the wall clock seconds when the validation accuracy first reached the target, None if never.
+
+        :param history: list of dict with elapsed_sec and val_accuracy
+    """
+    for record in history:
+        if record['val_accuracy'] >= target:
+            return record['elapsed_sec']
+    return None
+
+
+def train_with_schedule(name, data_dir, epochs, schedule, batch_size, lr, num_workers, device, seed=0):
+    """
+        Train a registered model with a simple loop and return the per epoch wall clock time and validation accuracy.
+        A schedule of None trains at the full resolution for all the epochs.
+    """
+    import pandas as pd
+    from common.torch.dataset.dataset import ClassificationDataset
+    from common.torch.utils.inference_backend import TorchBackend, evaluate
+    from common.torch.utils.model_registry import create_model, get_image_size, get_train_transformation, get_test_transformation
+
+    torch.manual_seed(seed)
+    fields = {'image': 'image', 'label': 'class'}
+    train_dataset = ClassificationDataset(f'{data_dir}/train', pd.read_csv(f'{data_dir}/train.csv'), get_train_transformation(name), fields)
+    val_dataset = ClassificationDataset(f'{data_dir}/val', pd.read_csv(f'{data_dir}/val.csv'), get_test_transformation(name), fields, training=False)
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers, drop_last=True)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+    model = create_model(name, num_classes=int(train_dataset.data_frame['class'].max()) + 1).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr, weight_decay=0.0001)
+    criterion = torch.nn.NLLLoss()
+    full_size = get_image_size(name)
+
+    history = []
+    current_size = full_size
+    loader = train_loader
+    start = time.perf_counter()
+    for epoch in range(1, epochs + 1):
+        size = resolution_for_epoch(schedule, epoch) if schedule else full_size
+        if size != current_size:
+            loader = train_loader if size == full_size else rebuild_data_loader(train_loader, rescale_transformation(train_loader.dataset.transform, size),
+                                                                                scaled_batch_size(batch_size, full_size, size))
+            current_size = size
+
+        model.train()
+        for images, labels, _ in loader:
+            optimizer.zero_grad()
+            loss = criterion(model(images.to(device)), labels.to(device).view(-1))
+            loss.backward()
+            optimizer.step()
+
+        top1, _ = evaluate(TorchBackend(model, device), val_loader)
+        history.append({'epoch': epoch, 'size': size, 'batch_size': loader.batch_size, 'elapsed_sec': time.perf_counter() - start,
+                        'val_accuracy': top1})
+        print(f'epoch={epoch}, size={size}, batch size={loader.batch_size}, elapsed={history[-1]["elapsed_sec"]:.1f}s, val acc={top1:.2f}')
+
+    return history
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True)
+    parser.add_argument('--data-dir', default=None, help='processed dataset with train/val csv, a synthetic dataset is created if not set')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--schedule', nargs='+', default=['1:128', '4:176', '8:224'], help='<first epoch>:<resolution>')
+    parser.add_argument('--target-accuracy', type=float, required=True)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    schedule = {int(epoch): int(size) for epoch, size in (entry.split(':') for entry in args.schedule)}
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        import tempfile
+        from common.torch.dataset.synthetic_dataset import create_processed_dataset
+
+        data_dir = tempfile.mkdtemp()
+        create_processed_dataset(data_dir, type='train', num_images=512, num_classes=8, seed=0)
+        create_processed_dataset(data_dir, type='val', num_images=128, num_classes=8, seed=1)
+
+    report = {'model': args.model, 'schedule': schedule, 'target_accuracy': args.target_accuracy}
+    for name, selected in [('fixed', None), ('progressive', schedule)]:
+        print(f'Training with the {name} schedule ...')
+        history = train_with_schedule(args.model, data_dir, args.epochs, selected, args.batch_size, args.lr, args.num_workers, device)
+        report[name] = {'history': history, 'time_to_target_sec': time_to_accuracy(history, args.target_accuracy)}
+
+    for name in ['fixed', 'progressive']:
+        seconds = report[name]['time_to_target_sec']
+        print(f'{name:<12} time to {args.target_accuracy}% val acc: {"not reached" if seconds is None else f"{seconds:.1f} sec"}, '
+              f'total {report[name]["history"][-1]["elapsed_sec"]:.1f} sec')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,321 @@
+import os
+import json
+import argparse
+import torch
+
+"""
+    Structured ( channel ) pruning. Unlike the unstructured sparsity, the selected filters are physically removed from
+    the convolution layers, hence the pruned model is a smaller dense model which is faster on CPU.
+
+    Removing the output channels of a convolution changes the input of every layer which reads them. The channels are
+    therefore pruned together in a PruningGroup:
+        producers       : convolutions whose output channels are removed. More than one convolution is needed when
+                          the outputs are added together ( e.g. the residual stream of a ResNet stage ).
+        channel_layers  : per channel layers using the same channels ( BatchNorm2d, PReLU )
+        consumers       : layers reading the channels ( the next convolution or Linear layer ). When the channels are
+                          concatenated with other channels ( Inception, Fire expand ), the offset is the number of
+                          channels of the preceding tensors in torch.cat().
+
+    The models define their groups in pruning_groups(). A plain Sequential ( AlexNet, ZFNet, VGG ) is handled by
+    sequential_pruning_groups().
+
+    Criteria to rank the channels:
+        l1, l2  : norm of the filter weights
+        taylor  : first order Taylor expansion of the loss ( Molchanov et al. 2019 ), (sum of weight x gradient)^2
+                  accumulated over a few batches.
+
+    Usage:
+        python -m common.torch.utils.pruning_util --model resnet_38 --checkpoint resnet_checkpoint_100.pth --sparsity 0.25 0.5 \
+            --criterion l1 --val-csv val.csv --val-dir val --save-dir pruned
+"""
+
+
+class Consumer:
+    """
+        A layer reading the channels of a PruningGroup.
+
+        :param layer: Conv2d or Linear
+        :param before: convolutions whose output channels precede the channels of the group in torch.cat()
+        :param spatial: for a Linear layer after Flatten, the number of elements per channel ( H x W )
+    """
+
+    def __init__(self, layer, before=(), spatial=1):
+        self.layer = layer
+        self.before = list(before)
+        self.spatial = spatial
+
+    @property
+    def offset(self):
+        return sum(conv.out_channels for conv in self.before)
+
+
+class PruningGroup:
+    def __init__(self, name, producers, channel_layers=(), consumers=()):
+        self.name = name
+        self.producers = list(producers)
+        self.channel_layers = list(channel_layers)
+        self.consumers = list(consumers)
+
+    @property
+    def channels(self):
+        return self.producers[0].out_channels
+
+
+def sequential_pruning_groups(sequential, prefix='model'):
+    """
+        Create the groups of a Sequential of Conv2d, BatchNorm2d, activation, pooling, Dropout, Flatten and Linear
+        layers. A convolution is only pruned when the layer reading it is known. Any other module with parameters
+        stops the search, as its input channels can not be changed.
+    """
+    groups = []
+    current = None
+    for i, layer in enumerate(sequential):
+        if isinstance(layer, torch.nn.Conv2d):
+            if current is not None:
+                current.consumers.append(Consumer(layer))
+                groups.append(current)
+            current = PruningGroup(f'{prefix}.{i}', [layer]) if layer.groups == 1 else None
+        elif isinstance(layer, torch.nn.BatchNorm2d) or isinstance(layer, torch.nn.PReLU):
+            # PReLU with a single parameter is shared by all the channels
+            if current is not None and (isinstance(layer, torch.nn.BatchNorm2d) or layer.num_parameters > 1):
+                current.channel_layers.append(layer)
+        elif isinstance(layer, torch.nn.Linear):
+            if current is not None:
+                current.consumers.append(Consumer(layer, spatial=layer.in_features // current.channels))
+                groups.append(current)
+            break
+        elif len(list(layer.parameters())) > 0:
+            current = None
+    return groups
+
+
+def get_pruning_groups(model):
+    if hasattr(model, 'pruning_groups'):
+        return model.pruning_groups()
+    return sequential_pruning_groups(model.model)
+
+
+def set_parameter(module, name, value):
+    setattr(module, name, torch.nn.Parameter(value.contiguous(), requires_grad=getattr(module, name).requires_grad))
+
+
+def prune_output_channels(conv, keep):
+    set_parameter(conv, 'weight', conv.weight.data[keep])
+    if conv.bias is not None:
+        set_parameter(conv, 'bias', conv.bias.data[keep])
+    conv.out_channels = len(keep)
+
+
+def prune_channel_layer(layer, keep):
+    if isinstance(layer, torch.nn.BatchNorm2d):
+        set_parameter(layer, 'weight', layer.weight.data[keep])
+        set_parameter(layer, 'bias', layer.bias.data[keep])
+        layer.running_mean = layer.running_mean[keep].contiguous()
+        layer.running_var = layer.running_var[keep].contiguous()
+        layer.num_features = len(keep)
+    else:
+        set_parameter(layer, 'weight', layer.weight.data[keep])
+        layer.num_parameters = len(keep)
+
+
+def prune_input_channels(consumer, remove):
+    """
+        Remove the input channels of a consumer. remove contains the channel indices of the group.
+    """
+    layer = consumer.layer
+    in_features = layer.in_channels if isinstance(layer, torch.nn.Conv2d) else layer.in_features
+
+    removed = set()
+    for channel in remove:
+        start = (consumer.offset + channel) * consumer.spatial
+        removed.update(range(start, start + consumer.spatial))
+    keep = torch.tensor([i for i in range(in_features) if i not in removed], dtype=torch.long, device=layer.weight.device)
+
+    set_parameter(layer, 'weight', layer.weight.data[:, keep])
+    if isinstance(layer, torch.nn.Conv2d):
+        layer.in_channels = len(keep)
+    else:
+        layer.in_features = len(keep)
+
+
+def prune_group(group, keep):
+    """
+        Keep only the given channels of the group. The consumers must be pruned before the producers, as the
+        offset in a concatenation depends on the current channels of the preceding convolutions.
+    """
+    keep = sorted(keep)
+    remove = [i for i in range(group.channels) if i not in set(keep)]
+    if len(remove) == 0:
+        return
+
+    for consumer in group.consumers:
+        prune_input_channels(consumer, remove)
+
+    keep = torch.tensor(keep, dtype=torch.long, device=group.producers[0].weight.device)
+    for conv in group.producers:
+        prune_output_channels(conv, keep)
+    for layer in group.channel_layers:
+        prune_channel_layer(layer, keep)
+
+
+def taylor_scores(model, groups, data_loader, loss_function, device=None, batches=10):
+    """
+        Accumulate (sum of weight x gradient)^2 per filter of every producer. The model is kept in eval mode, so that
+        the BatchNorm statistics are not updated.
+    """
+    producers = {id(conv): conv for group in groups for conv in group.producers}
+    scores = {key: torch.zeros(conv.out_channels, device=conv.weight.device) for key, conv in producers.items()}
+
+    model.eval()
+    for i, (images, labels, _) in enumerate(data_loader):
+        if i >= batches:
+            break
+        if device is not None:
+            images = images.to(device)
+            labels = labels.to(device)
+
+        model.zero_grad()
+        loss = loss_function(model(images), labels.view(-1))
+        loss.backward()
+
+        for key, conv in producers.items():
+            contribution = (conv.weight * conv.weight.grad).sum(dim=(1, 2, 3))
+            if conv.bias is not None:
+                contribution += conv.bias * conv.bias.grad
+            scores[key] += contribution.detach() ** 2
+
+    model.zero_grad()
+    return scores
+
+
+def channel_scores(group, criterion='l1', taylor=None):
+    """
+        Returns the importance of each channel of the group, summed over the producers.
+    """
+    score = torch.zeros(group.channels, device=group.producers[0].weight.device)
+    for conv in group.producers:
+        weight = conv.weight.data.view(conv.out_channels, -1)
+        if criterion == 'l1':
+            score += weight.abs().sum(dim=1)
+        elif criterion == 'l2':
+            score += weight.norm(p=2, dim=1)
+        elif criterion == 'taylor':
+            score += taylor[id(conv)]
+        else:
+            raise ValueError(f'Unknown criterion {criterion}, available criteria are l1, l2, taylor')
+    return score
+
+
+def prune_model(model, ratio, criterion='l1', data_loader=None, loss_function=None, device=None, batches=10, min_channels=1):
+    """
+        Remove the given fraction of the channels of every pruning group, in place.
+
+        :param model: model with pruning_groups() or a self.model Sequential
+        :param ratio: fraction of the current channels to remove
+        :param criterion: l1, l2 or taylor
+        :param data_loader: needed for taylor
+        :param loss_function: needed for taylor, NLLLoss by default ( the models end with LogSoftmax )
+        :param device: device of the data for taylor
+        :param batches: number of batches for taylor
+        :param min_channels: minimum number of channels to keep per group
+        :return: dict of group name -> (channels before, channels after)
+    """
+    groups = get_pruning_groups(model)
+
+    taylor = None
+    if criterion == 'taylor':
+        if data_loader is None:
+            raise ValueError('The taylor criterion needs a data loader')
+        taylor = taylor_scores(model, groups, data_loader, loss_function or torch.nn.NLLLoss(), device=device, batches=batches)
+
+    # Rank all the groups before changing any layer
+    selected = []
+    for group in groups:
+        count = max(min_channels, int(round(group.channels * (1.0 - ratio))))
+        score = channel_scores(group, criterion, taylor)
+        keep = torch.argsort(score, descending=True)[:count].tolist()
+        selected.append((group, keep))
+
+    summary = {}
+    for group, keep in selected:
+        summary[group.name] = (group.channels, len(keep))
+        prune_group(group, keep)
+    return summary
+
+
+def step_ratio(current_sparsity, target_sparsity):
+    """
+        Fraction of the remaining channels to remove to go from the current to the target sparsity
+        ( both relative to the original model ).
+    """
+    return 1.0 - (1.0 - target_sparsity) / (1.0 - current_sparsity)
+
+
+if __name__ == '__main__':
+    from common.torch.utils.cost_analyzer import analyze_model
+    from common.torch.utils.benchmark_util import measure_module_latency
+    from common.torch.utils.inference_backend import TorchBackend, evaluate
+    from common.torch.utils.model_registry import MODELS, create_model, get_image_size, get_test_transformation
+    from common.torch.utils.quantization_util import load_checkpoint_weights, get_data_loader
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', default=None, help='random weights if not set ( FLOPs and latency only )')
+    parser.add_argument('--sparsity', type=float, nargs='+', default=[0.25, 0.5, 0.75])
+    parser.add_argument('--criterion', default='l1', choices=['l1', 'l2', 'taylor'])
+    parser.add_argument('--val-csv', default=None)
+    parser.add_argument('--val-dir', default=None)
+    parser.add_argument('--mean-rgb', default=None)
+    parser.add_argument('--taylor-batches', type=int, default=10)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--save-dir', default=None, help='save each pruned model using torch.save()')
+    parser.add_argument('--output', default=None, help='json report')
+    args = parser.parse_args()
+
+    image_size = get_image_size(args.model)
+    data_loader = None
+    if args.val_csv:
+        data_loader = get_data_loader(args.val_csv, args.val_dir, get_test_transformation(args.model), mean_rgb=args.mean_rgb)
+    if args.criterion == 'taylor' and data_loader is None:
+        parser.error('--val-csv and --val-dir are needed for the taylor criterion')
+
+    model = create_model(args.model, num_classes=args.num_classes)
+    if args.checkpoint:
+        model = load_checkpoint_weights(model, args.checkpoint)
+
+    def profile(model):
+        _, totals = analyze_model(model, input_size=(1, 3, image_size, image_size), repeat=1)
+        result = {'parameters': totals['parameters'], 'flops': totals['flops'], 'latency': {}}
+        for batch_size in args.batch_sizes:
+            latency = measure_module_latency(model, torch.rand(batch_size, 3, image_size, image_size), repeat=10)
+            result['latency'][batch_size] = {'p50_ms': latency['p50_ms'], 'images_per_sec': 1000.0 * batch_size / latency['p50_ms']}
+        if data_loader is not None:
+            result['top1'], result['top5'] = evaluate(TorchBackend(model), data_loader)
+        return result
+
+    # Prune iteratively, so that each level starts from the previous one ( as in a prune / fine-tune schedule )
+    report = {'model': args.model, 'criterion': args.criterion, 'levels': [dict(sparsity=0.0, **profile(model))]}
+    sparsity = 0.0
+    for target in sorted(args.sparsity):
+        summary = prune_model(model, step_ratio(sparsity, target), criterion=args.criterion, data_loader=data_loader,
+                              batches=args.taylor_batches)
+        sparsity = target
+        report['levels'].append(dict(sparsity=target, groups=summary, **profile(model)))
+
+        if args.save_dir:
+            os.makedirs(args.save_dir, exist_ok=True)
+            torch.save(model, f'{args.save_dir}/{args.model}_pruned_{int(target * 100)}.pth')
+
+    baseline = report['levels'][0]
+    print(f'{"Sparsity":<10}{"Params (M)":>12}{"GFLOPs":>10}{"FLOPs %":>10}{"Top-1":>8}{"Top-5":>8}' +
+          ''.join(f'{f"bs {b} ms":>12}{"speedup":>9}' for b in args.batch_sizes))
+    for level in report['levels']:
+        print(f'{level["sparsity"]:<10}{level["parameters"] / 1e6:>12.2f}{level["flops"] / 1e9:>10.2f}'
+              f'{100.0 * level["flops"] / baseline["flops"]:>10.1f}{level.get("top1", float("nan")):>8.2f}{level.get("top5", float("nan")):>8.2f}' +
+              ''.join(f'{level["latency"][b]["p50_ms"]:>12.2f}{baseline["latency"][b]["p50_ms"] / level["latency"][b]["p50_ms"]:>9.2f}'
+                      for b in args.batch_sizes))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,221 @@
+import os
+import json
+import inspect
+import argparse
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader
+from common.torch.dataset.dataset import ClassificationDataset
+from common.torch.utils.benchmark_util import measure_module_latency
+from common.torch.utils.inference_backend import TorchBackend, evaluate as evaluate_backend
+from common.torch.utils.model_registry import MODELS, create_model, get_image_size, get_test_transformation
+
+"""
+    Post training quantization of the trained CNN checkpoints for CPU inference.
+
+    1.  Static quantization ( int8 weights and activations ):
+            - Uses FX graph mode quantization, which fuses Conv/BatchNorm/ReLU and Linear/ReLU automatically and
+              also handles the torch.cat() of InceptionModule/ExpandModule and the residual addition of ResNet.
+            - Per channel weight observer and histogram observer for the activations.
+            - Observers are calibrated using a subset of the validation csv.
+    2.  Dynamic quantization ( int8 weights, activations quantized on the fly ):
+            - Only the Linear layers are quantized. This is meant for the FC heavy heads of AlexNet/ZFNet/VGG.
+
+    The quantized model is saved as TorchScript, hence it can be loaded using torch.jit.load() without the model code.
+    A json report with the top-1/top-5 accuracy and the latency/throughput of the fp32 and int8 models is saved next to it.
+
+    Note: FX graph mode quantization needs PyTorch 1.8 or later. Dynamic quantization works with the older versions.
+
+    Usage:
+        python -m common.torch.utils.quantization_util --model resnet_38 --checkpoint resnet_checkpoint_100.pth \
+            --val-csv val.csv --val-dir val --mode static --output resnet_38_int8.pt
+"""
+
+
+def load_checkpoint_weights(model, checkpoint_file):
+    """
+        Load the model_state_dict of a checkpoint saved by BaseExecutor.save_checkpoint(). The "module." prefix
+        added by torch.nn.DataParallel is removed.
+
+        The layer sizes of a pruned model are different from the one of create_model(), hence the whole model is
+        returned instead of the given one for the checkpoints of a pruned model ( pruned_model ) and for the models
+        saved using torch.save(model) ( e.g. --save-dir of pruning_util.py and low_rank.py ). Always use the returned
+        model.
+    """
+    checkpoint = torch.load(checkpoint_file, map_location='cpu')
+    if isinstance(checkpoint, torch.nn.Module):
+        # Whole model saved using torch.save(model), the weights are part of it
+        return checkpoint.module if isinstance(checkpoint, torch.nn.DataParallel) else checkpoint
+    if 'pruned_model' in checkpoint:
+        # Same as BaseExecutor.load_checkpoint(), the model_state_dict matches the pruned model
+        model = checkpoint['pruned_model'].cpu()
+    state_dict = checkpoint['model_state_dict'] if 'model_state_dict' in checkpoint else checkpoint
+    state_dict = {(k[len('module.'):] if k.startswith('module.') else k): v for k, v in state_dict.items()}
+    model.load_state_dict(state_dict)
+    return model
+
+
+def get_data_loader(csv_path, images_path, transformation, num_images=None, batch_size=32, num_workers=4, mean_rgb=None, seed=0):
+    """
+        Create a DataLoader over the csv file, optionally using a random subset of num_images rows ( e.g. for calibration ).
+    """
+    df = pd.read_csv(csv_path)
+    if num_images and num_images < len(df):
+        df = df.sample(n=num_images, random_state=seed)
+    dataset = ClassificationDataset(images_path, df, transformation, {'image': 'image', 'label': 'class'}, training=False, mean_rgb=mean_rgb)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, drop_last=False)
+
+
+def static_qconfig(backend='fbgemm'):
+    """
+        Per channel symmetric weights and histogram calibrated activations. reduce_range is needed for fbgemm ( x86 ).
+    """
+    from torch.quantization import QConfig, HistogramObserver, default_per_channel_weight_observer
+
+    return QConfig(activation=HistogramObserver.with_args(reduce_range=(backend == 'fbgemm')), weight=default_per_channel_weight_observer)
+
+
+def quantize_static(model, calibration_loader, example_input, backend='fbgemm', max_batches=None):
+    """
+        Static int8 quantization using FX graph mode.
+
+        :param model: fp32 model with the trained weights
+        :param calibration_loader: DataLoader used to calibrate the activation observers
+        :param example_input: example input tensor, needed for tracing in newer PyTorch versions
+        :param backend: fbgemm ( x86 ) or qnnpack ( ARM )
+        :param max_batches: stop calibration after this many batches
+        :return: quantized model
+    """
+    from torch.quantization import quantize_fx
+
+    torch.backends.quantized.engine = backend
+    model = model.cpu().eval()
+
+    qconfig_dict = {'': static_qconfig(backend)}
+    # The example_inputs argument was added in PyTorch 1.13
+    if 'example_inputs' in inspect.signature(quantize_fx.prepare_fx).parameters:
+        prepared = quantize_fx.prepare_fx(model, qconfig_dict, example_inputs=(example_input,))
+    else:
+        prepared = quantize_fx.prepare_fx(model, qconfig_dict)
+
+    # Calibration
+    with torch.no_grad():
+        for i, (images, _, _) in enumerate(calibration_loader):
+            prepared(images)
+            if max_batches and i + 1 >= max_batches:
+                break
+
+    return quantize_fx.convert_fx(prepared)
+
+
+def quantize_dynamic(model):
+    """
+        Dynamic int8 quantization of the Linear layers.
+    """
+    return torch.quantization.quantize_dynamic(model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(model, example_input, file_name):
+    """
+        Save the quantized model as TorchScript so that it can be reloaded without the model code.
+    """
+    with torch.no_grad():
+        scripted = torch.jit.trace(model, example_input)
+    torch.jit.save(scripted, file_name)
+    return file_name
+
+
+def load_quantized(file_name, backend='fbgemm'):
+    """
+        Load a model saved by save_quantized().
+    """
+    torch.backends.quantized.engine = backend
+    return torch.jit.load(file_name, map_location='cpu')
+
+
+def evaluate(model, data_loader):
+    """
+        Returns the top-1 and top-5 accuracy ( in percentage ) of the model on the data loader.
+    """
+    return evaluate_backend(TorchBackend(model), data_loader)
+
+
+def file_size_mb(model, file_name):
+    """
+        Size of the serialized model in MB.
+    """
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, file_name)
+    else:
+        torch.save(model.state_dict(), file_name)
+    size = os.path.getsize(file_name) / 1024.0 ** 2
+    os.remove(file_name)
+    return size
+
+
+def compare_models(fp32_model, int8_model, data_loader, image_size, batch_sizes=(1, 32), repeat=10):
+    """
+        Returns the accuracy, latency and throughput of both models.
+    """
+    report = {}
+    for name, model in [('fp32', fp32_model), ('int8', int8_model)]:
+        top1, top5 = evaluate(model, data_loader) if data_loader is not None else (None, None)
+        report[name] = {'top1': top1, 'top5': top5, 'size_mb': file_size_mb(model, f'.{name}.tmp'), 'latency': {}}
+        for batch_size in batch_sizes:
+            latency = measure_module_latency(model, torch.rand(batch_size, 3, image_size, image_size), repeat=repeat)
+            report[name]['latency'][batch_size] = {'p50_ms': latency['p50_ms'], 'images_per_sec': 1000.0 * batch_size / latency['p50_ms']}
+
+    if data_loader is not None:
+        report['top1_delta'] = report['int8']['top1'] - report['fp32']['top1']
+        report['top5_delta'] = report['int8']['top5'] - report['fp32']['top5']
+    report['speedup'] = {batch_size: report['fp32']['latency'][batch_size]['p50_ms'] / report['int8']['latency'][batch_size]['p50_ms']
+                         for batch_size in batch_sizes}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--mode', default='static', choices=['static', 'dynamic'])
+    parser.add_argument('--val-csv', default=None)
+    parser.add_argument('--val-dir', default=None)
+    parser.add_argument('--mean-rgb', default=None, help='rgb_val.json, for the models trained with mean RGB normalization')
+    parser.add_argument('--calibration-images', type=int, default=512)
+    parser.add_argument('--evaluation-images', type=int, default=None, help='subset of the validation set for the accuracy, default all')
+    parser.add_argument('--backend', default='fbgemm', choices=['fbgemm', 'qnnpack'])
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    image_size = get_image_size(args.model)
+    example_input = torch.rand(1, 3, image_size, image_size)
+
+    fp32_model = load_checkpoint_weights(create_model(args.model, num_classes=args.num_classes), args.checkpoint).eval()
+
+    evaluation_loader = None
+    if args.val_csv:
+        transformation = get_test_transformation(args.model)
+        evaluation_loader = get_data_loader(args.val_csv, args.val_dir, transformation, num_images=args.evaluation_images, mean_rgb=args.mean_rgb)
+
+    if args.mode == 'static':
+        if not args.val_csv:
+            parser.error('--val-csv and --val-dir are needed for the calibration of static quantization')
+        # Use a different subset than the evaluation when possible
+        calibration_loader = get_data_loader(args.val_csv, args.val_dir, transformation, num_images=args.calibration_images, mean_rgb=args.mean_rgb,
+                                             seed=1)
+        int8_model = quantize_static(load_checkpoint_weights(create_model(args.model, num_classes=args.num_classes), args.checkpoint),
+                                     calibration_loader, example_input, backend=args.backend)
+    else:
+        int8_model = quantize_dynamic(load_checkpoint_weights(create_model(args.model, num_classes=args.num_classes), args.checkpoint))
+
+    save_quantized(int8_model, example_input, args.output)
+    int8_model = load_quantized(args.output, backend=args.backend)
+
+    report = compare_models(fp32_model, int8_model, evaluation_loader, image_size)
+    report.update({'model': args.model, 'checkpoint': args.checkpoint, 'mode': args.mode, 'backend': args.backend})
+
+    with open(f'{os.path.splitext(args.output)[0]}_report.json', 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,250 @@
+import json
+from common.torch.utils.base_executor import *
+from common.torch.utils.model_registry import create_model, get_image_size
+
+"""
+    The SweepExecutor trains several model / optimizer configurations ( e.g. resnet_20 to resnet_50, or several learning
+    rates ) at the same time on one stream of training batches. Every batch is read, decoded and augmented once by the
+    DataLoader, moved to the device once and used by all the configurations, hence the input pipeline is paid once
+    instead of once per configuration. All the configurations see exactly the same augmented images.
+
+    Every configuration is a SweepMember, i.e. a BaseExecutor with its own PROJECT_NAME ( <PROJECT_NAME>_<NAME> ), hence
+    its own checkpoints, last.checkpoint file, resume and tensor board run. The tensor board run of the sweep itself
+    shows the validation accuracy of all the members in one chart.
+
+    Losing configurations are stopped early using successive halving: at each epoch of SWEEP_HALVING_EPOCHS only the
+    best SWEEP_KEEP_FRACTION of the running members ( by the last validation accuracy ) continue. The stopped members
+    save a final checkpoint and are recorded in the sweep state file, hence they are not restarted on resume.
+
+    The members run one after the other on each batch in one process, the models and optimizers of all the running
+    members must fit in the memory of the device. The members must use the same input size.
+
+    The configuration needs the following keys in addition to the ones used by BaseExecutor:
+        SWEEP_CONFIGS        : list of dict with NAME, MODEL ( name in model_registry.py ), OPTIMIZER ( adam or sgd ), LR,
+                               WEIGHT_DECAY and SCHEDULER ( cosine or plateau ), any other key overrides the config
+        SWEEP_HALVING_EPOCHS : epochs after which the losing members are stopped, e.g. [5, 10, 20]
+        SWEEP_KEEP_FRACTION  : fraction of the members kept at each halving epoch
+"""
+
+
+class SilentProgressBar:
+    """
+        Progress bar of the members, the sweep shows a single progress bar for all of them.
+    """
+
+    def due(self):
+        return False
+
+    def set_postfix(self, *args, **kwargs):
+        pass
+
+    def update(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class SweepMember(BaseExecutor):
+    def __init__(self, name, data_loaders, config, logger):
+        # Set before BaseExecutor.__init__(), which invokes init_logging()
+        self.shared_logger = logger
+        super().__init__(data_loaders, config)
+        self.name = name
+        self.start_epoch = 1
+
+    def init_logging(self):
+        # All the members log to the logger of the sweep
+        self.logger = self.shared_logger
+
+    def build_model(self):
+        """
+            This function is for instantiating the model, optimizer, learning rate scheduler and loss function of the member.
+        """
+        self.model = create_model(self.MODEL, num_classes=self.NUM_CLASSES)
+
+        # Trade compute for memory if configured
+        self.enable_activation_checkpointing()
+
+        self.enable_multi_gpu_training()
+
+        # Send the model to GPU
+        self.model.to(self.DEVICE)
+
+        if self.OPTIMIZER == 'sgd':
+            self.optimizer = torch.optim.SGD(self.model.parameters(), lr=self.LR, momentum=0.9, weight_decay=self.WEIGHT_DECAY, nesterov=True)
+        else:
+            self.optimizer = torch.optim.Adam(self.model.parameters(), lr=self.LR, weight_decay=self.WEIGHT_DECAY)
+
+        if self.SCHEDULER == 'plateau':
+            self.scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(self.optimizer, mode='max', factor=0.5, patience=3, verbose=False, threshold=0.01)
+        else:
+            self.scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(self.optimizer, T_max=5, eta_min=1e-5)
+
+        # The models end with LogSoftmax
+        self.criterion = torch.nn.NLLLoss()
+
+        # Loss Average
+        self.train_loss_hist = AverageLoss()
+
+        # Enable Precision Mode
+        self.enable_precision_mode()
+
+    def pre_training_loop_ops(self, epoch=None):
+        """
+            Same as BaseExecutor.pre_training_loop_ops() without the progress bar and the resolution schedule, the
+            data loader is shared by all the members.
+        """
+        if self.training_start_time is None:
+            self.training_start_time = time.perf_counter()
+
+        self.model.train()
+        self.train_loss_hist.reset()
+        self.pbar = SilentProgressBar()
+
+    def step_scheduler(self, eval_accuracy):
+        if isinstance(self.scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+            self.step_scheduler_on_validation(eval_accuracy)
+        else:
+            self.scheduler.step()
+
+    def stop(self, epoch):
+        """
+            Stop the member early, wait for its background validation and save a final checkpoint. The model, the
+            optimizer state and the gradients are released, so that the memory is available to the other members.
+        """
+        self.receive_validation_results(block=True)
+        self.save_checkpoint(epoch, force=True)
+        self.tb_writer.close()
+
+        # The sweep still references the member ( self.members ), only its name and results are kept
+        self.model = self.optimizer = self.scheduler = None
+        if torch.device(self.DEVICE).type == 'cuda':
+            torch.cuda.empty_cache()
+
+
+class SweepExecutor(BaseExecutor):
+    def __init__(self, version, data_loaders, config):
+        super().__init__(data_loaders, config)
+        self.version = version
+        self.data_loaders = data_loaders
+        self.config = config
+        self.members = []
+
+    def state_file(self):
+        return f'{self.INPUT_DIR}/sweep.{self.PROJECT_NAME}.json'
+
+    def load_state(self):
+        if os.path.isfile(self.state_file()):
+            with open(self.state_file()) as file:
+                return json.load(file)
+        return {'stopped': {}}
+
+    def save_state(self, state):
+        with open(self.state_file(), 'w') as file:
+            json.dump(state, file, indent=2)
+
+    def create_members(self):
+        """
+            This function is for creating a SweepMember for each configuration of SWEEP_CONFIGS.
+        """
+        image_sizes = {get_image_size(member['MODEL']) for member in self.SWEEP_CONFIGS}
+        if len(image_sizes) > 1:
+            self.logger.error(f"The members of a sweep must use the same input size, found {sorted(image_sizes)}")
+            raise Exception("Compatibility error, please review logs ...")
+
+        members = []
+        for member_config in self.SWEEP_CONFIGS:
+            config = dict(self.config)
+            config.update({'OPTIMIZER': 'adam', 'LR': 0.001, 'WEIGHT_DECAY': 0.0001, 'SCHEDULER': 'cosine'})
+            config.update(member_config)
+            config['PROJECT_NAME'] = f"{self.PROJECT_NAME}_{member_config['NAME']}"
+            members.append(SweepMember(member_config['NAME'], self.data_loaders, config, self.logger))
+        return members
+
+    def halve(self, epoch, running, state):
+        """
+            Successive halving, returns the members which continue after the epoch. Only the members which trained
+            this epoch are ranked, the members resumed from a later checkpoint have not joined yet and continue.
+        """
+        trained = [m for m in running if m.start_epoch <= epoch]
+        if epoch not in (self.SWEEP_HALVING_EPOCHS or []) or len(trained) <= 1:
+            return running
+
+        # Rank using the validation of this epoch, wait for the background evaluators ( ASYNC_VALIDATION )
+        for member in trained:
+            member.receive_validation_results(block=True)
+
+        ranked = sorted(trained, key=lambda m: m.last_val_accuracy if m.last_val_accuracy is not None else -1.0, reverse=True)
+        keep = max(1, int(round(len(ranked) * (self.SWEEP_KEEP_FRACTION or 0.5))))
+        for member in ranked[keep:]:
+            self.logger.info(f"Stopping {member.name} after epoch {epoch} with val acc={member.last_val_accuracy}")
+            member.stop(epoch)
+            state['stopped'][member.name] = {'epoch': epoch, 'val_accuracy': member.last_val_accuracy}
+        self.save_state(state)
+        return [m for m in running if m not in ranked[keep:]]
+
+    def train(self):
+        """
+            This function is used for training all the members on the shared data loader.
+        """
+        self.members = self.create_members()
+        state = self.load_state()
+
+        running = []
+        for member in self.members:
+            if member.name in state['stopped']:
+                self.logger.info(f"{member.name} was stopped after epoch {state['stopped'][member.name]['epoch']}, skipping ...")
+                continue
+            self.logger.info(f"Building model {member.name} ( {member.MODEL} ) ...")
+            member.build_model()
+            member.create_checkpoint_folder()
+            member.start_epoch = member.load_checkpoint()
+            if member.start_epoch <= self.EPOCHS:
+                running.append(member)
+
+        if not running:
+            self.logger.info("All the members are complete")
+            return
+
+        # Training Loop
+        self.logger.info(f"Training {', '.join(m.name for m in running)} starting now ...")
+        for epoch in range(min(m.start_epoch for m in running), self.EPOCHS + 1):
+            # Members resumed from a later checkpoint join when the sweep reaches their epoch
+            members = [m for m in running if m.start_epoch <= epoch]
+            for member in members:
+                member.pre_training_loop_ops(epoch)
+            correct = {member.name: 0 for member in members}
+            total = {member.name: 0 for member in members}
+
+            pbar = ProgressBar(len(self.train_data_loader), self.PROGRESS_REFRESH_SECS)
+            for i, (images, labels, _) in enumerate(self.train_data_loader):
+                # Decoded, augmented and moved to the device once for all the members
+                images = images.to(self.DEVICE)
+                labels = labels.to(self.DEVICE)
+
+                for member in members:
+                    predictions = member.forward_backward_pass(images, labels, epoch, i)
+                    total[member.name], correct[member.name] = self.cal_prediction(predictions, labels, total[member.name], correct[member.name])
+
+                if pbar.due():
+                    pbar.set_postfix(epoch=f" {epoch}, " + ", ".join(f"{m.name}={round(m.train_loss_hist.value, 4)}" for m in members))
+                pbar.update()
+            pbar.close()
+
+            for member in members:
+                eval_accuracy = member.post_training_loop_ops(epoch, (100 * correct[member.name]) / total[member.name])
+                member.step_scheduler(eval_accuracy)
+
+            # All the members in one chart of the sweep run
+            self.tb_writer.add_scalars("Sweep Validation Accuracy", {m.name: m.last_val_accuracy for m in members if m.last_val_accuracy is not None},
+                                       epoch)
+
+            running = self.halve(epoch, running, state)
+
+        for member in running:
+            member.tb_writer.close()
+        self.tb_writer.close()
+
+        best = max(running, key=lambda m: m.last_val_accuracy if m.last_val_accuracy is not None else -1.0)
+        self.logger.info(f"Best configuration {best.name} with val acc={best.last_val_accuracy}")
@@ -0,0 +1,171 @@
+import time
+import argparse
+import torch
+import torch.nn.functional as F
+
+"""
+    Test time augmentation ( TTA ). Every test image is classified using several views and the model outputs of the
+    views are averaged.
+
+    The views are created from the test batch on the device ( the output of the test_transformation, e.g. a 224 x 224
+    Resize ), all the views of a group of images are stacked in one batch and run in a single forward pass. All the
+    views have the size of the test image, hence they also work for the models with a fixed size classifier
+    ( AlexNet, ZFNet, VGG ) and with the ONNX export.
+
+        none        : the test image only
+        flip        : the image and its horizontal flip ( 2 views )
+        five_crop   : the image is enlarged by CROP_SCALE ( 256 / 224, same as Resize(256) + Crop(224) ) and the 4
+                      corner and center crops are used ( 5 views )
+        ten_crop    : five_crop and the horizontal flip of each crop ( 10 views )
+        multi_scale : center crops of the image enlarged by each of the SCALES, i.e. zoomed views, and their flips
+                      ( 2 x len(SCALES) views )
+
+    The models end with LogSoftmax, the log probabilities of the views are averaged. The number of images per forward
+    pass is chosen so that images x views does not exceed max_batch_size, which bounds the memory.
+
+    The CLI reports the top-1/top-5 accuracy and the images/sec of each policy on the validation set.
+
+    Usage:
+        python -m common.torch.utils.tta --model resnet_38 --checkpoint resnet.pth --data-dir /media/4TB/datasets/caltech/processed \
+            --policies none flip five_crop ten_crop multi_scale
+"""
+
+POLICIES = ['none', 'flip', 'five_crop', 'ten_crop', 'multi_scale']
+
+# Enlargement of the image before the 5/10 crops
+CROP_SCALE = 256 / 224
+
+# Zoom factors of the multi_scale views
+SCALES = (1.0, 1.15, 1.3)
+
+
+def resize(images, size):
+    return F.interpolate(images, size=(size, size), mode='bilinear', align_corners=False)
+
+
+def center_crop(images, size):
+    top = (images.shape[-2] - size) // 2
+    left = (images.shape[-1] - size) // 2
+    return images[..., top:top + size, left:left + size]
+
+
+def five_crops(images, size):
+    """
+        Returns the 4 corner crops and the center crop of the images.
+    """
+    height, width = images.shape[-2:]
+    return [images[..., :size, :size], images[..., :size, width - size:], images[..., height - size:, :size],
+            images[..., height - size:, width - size:], center_crop(images, size)]
+
+
+def tta_views(images, policy, crop_scale=CROP_SCALE, scales=SCALES):
+    """
+        Returns the views of the images as a list of tensors, each of the same shape as the images.
+
+        :param images: N x C x H x W tensor ( H = W )
+        :param policy: one of the POLICIES
+    """
+    size = images.shape[-1]
+    if policy in [None, 'none']:
+        views = [images]
+    elif policy == 'flip':
+        views = [images, images.flip(-1)]
+    elif policy in ['five_crop', 'ten_crop']:
+        views = five_crops(resize(images, int(round(size * crop_scale))), size)
+        if policy == 'ten_crop':
+            views += [view.flip(-1) for view in views]
+    elif policy == 'multi_scale':
+        views = [images if scale == 1.0 else center_crop(resize(images, int(round(size * scale))), size) for scale in scales]
+        views += [view.flip(-1) for view in views]
+    else:
+        raise ValueError(f"Unknown TTA policy {policy}, available policies are {', '.join(POLICIES)}")
+    return views
+
+
+def num_views(policy, scales=SCALES):
+    return {'none': 1, 'flip': 2, 'five_crop': 5, 'ten_crop': 10, 'multi_scale': 2 * len(scales)}[policy or 'none']
+
+
+def tta_predict(backend, images, policy, max_batch_size=256, crop_scale=CROP_SCALE, scales=SCALES):
+    """
+        Returns the averaged output of the views of the images ( N x num classes ), on the device of the images.
+
+        :param backend: inference backend ( inference_backend.py ) or a callable model
+        :param images: N x C x H x W tensor, already on the device
+        :param policy: one of the POLICIES
+        :param max_batch_size: max images x views per forward pass
+    """
+    views_per_image = num_views(policy, scales)
+    chunk = max(1, max_batch_size // views_per_image)
+
+    outputs = []
+    for start in range(0, images.size(0), chunk):
+        group = images[start:start + chunk]
+        views = torch.cat(tta_views(group, policy, crop_scale, scales), dim=0)
+        # ONNX Runtime returns the output on the CPU
+        output = backend(views.contiguous()).to(images.device)
+        # views x images x classes, the views of an image are averaged
+        outputs.append(output.view(views_per_image, group.size(0), -1).mean(dim=0))
+    return torch.cat(outputs, dim=0)
+
+
+def evaluate_policy(backend, data_loader, policy, device, max_batch_size=256):
+    """
+        Returns the top-1 and top-5 accuracy ( in percentage ) and the images/sec of a TTA policy.
+    """
+    correct = 0
+    correct_rank5 = 0
+    total = 0
+    start = time.perf_counter()
+    for images, labels, _ in data_loader:
+        labels = labels.to(device).view(-1)
+        predictions = tta_predict(backend, images.to(device), policy, max_batch_size)
+
+        _, predicted = torch.topk(predictions, k=5, dim=1)
+        correct += (predicted[:, 0] == labels).sum().item()
+        correct_rank5 += (predicted == labels.view(-1, 1)).any(dim=1).sum().item()
+        total += labels.size(0)
+
+    elapsed = time.perf_counter() - start
+    return 100.0 * correct / total, 100.0 * correct_rank5 / total, total / elapsed
+
+
+if __name__ == '__main__':
+    import pandas as pd
+    from torch.utils.data import DataLoader
+    from common.torch.dataset.dataset import ClassificationDataset
+    from common.torch.utils.inference_backend import load_backend
+    from common.torch.utils.model_registry import MODELS, get_test_transformation
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, choices=list(MODELS.keys()))
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--num-classes', type=int, default=256)
+    parser.add_argument('--data-dir', required=True, help='processed dataset with val.csv')
+    parser.add_argument('--mean-rgb', default=None, help='rgb json if the model was trained with the mean RGB normalization')
+    parser.add_argument('--policies', nargs='+', default=POLICIES, choices=POLICIES)
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnxruntime'])
+    parser.add_argument('--onnx-file', default=None)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=256, help='max images x views per forward pass')
+    parser.add_argument('--num-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    backend = load_backend(args.backend, args.model, args.checkpoint, args.num_classes, args.onnx_file, device)
+    dataset = ClassificationDataset(f'{args.data_dir}/val', pd.read_csv(f'{args.data_dir}/val.csv'), get_test_transformation(args.model),
+                                    {'image': 'image', 'label': 'class'}, training=False, mean_rgb=args.mean_rgb)
+    data_loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers)
+
+    results = []
+    with torch.no_grad():
+        for policy in args.policies:
+            top1, top5, images_per_sec = evaluate_policy(backend, data_loader, policy, device, args.max_batch_size)
+            results.append((policy, num_views(policy), top1, top5, images_per_sec))
+            print(f'{policy}: top-1 {top1:.2f}%, top-5 {top5:.2f}%, {images_per_sec:.1f} images/sec')
+
+    baseline = results[0]
+    print(f'\n{"Policy":<14}{"Views":>6}{"Top-1":>8}{"Top-5":>8}{"Images/s":>10}{"Top-1 gain":>12}{"Cost":>7}')
+    for policy, views, top1, top5, images_per_sec in results:
+        print(f'{policy:<14}{views:>6}{top1:>8.2f}{top5:>8.2f}{images_per_sec:>10.1f}{top1 - baseline[2]:>+12.2f}{baseline[4] / images_per_sec:>6.1f}x')